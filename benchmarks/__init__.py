@@ -0,0 +1 @@
+"""MassTransit benchmarks."""
@@ -0,0 +1,189 @@
+"""In-process stand-in for a RabbitMQ broker, used by the benchmarks.
+
+`LoopbackBroker` implements the parts of the pika channel API used by `RabbitMQConsumer` and `RabbitMQProducer`.
+Published bodies are routed to bound queues and delivered to the consumer's `on_message` while fewer deliveries than
+the prefetch count are unacknowledged, as RabbitMQ does. Everything else runs through the real consumer and producer
+code, so only the network and the broker's own work are left out of the measurements.
+"""
+
+import asyncio
+import contextlib
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+@dataclass(slots=True)
+class Deliver:
+    """Basic.Deliver method frame."""
+
+    delivery_tag: int
+    consumer_tag: str
+    exchange: str
+    routing_key: str
+    redelivered: bool = False
+
+
+class LoopbackChannel:
+    """Channel of a `LoopbackBroker`, with the subset of `pika.channel.Channel` the consumer and producer use.
+
+    RPC callbacks are invoked synchronously. Deliveries are scheduled on the event loop so that handler tasks and
+    acknowledgements interleave with them as they would with a socket.
+    """
+
+    def __init__(self, broker: "LoopbackBroker"):
+        """Initializes a channel with no consumer."""
+        self.broker = broker
+        self.prefetch_count = 0
+        self.settled: dict[str, int] = defaultdict(int)
+        self._consumer: tuple[str, Callable] | None = None
+        self._unacked: set[int] = set()
+        self._next_tag = 0
+        self._scheduled = False
+        self._waiters: list[tuple[int, asyncio.Future]] = []
+
+    def add_on_close_callback(self, callback):
+        """Channels of the loopback broker are never closed by the broker."""
+
+    def add_on_cancel_callback(self, callback):
+        """Consumers of the loopback broker are never cancelled by the broker."""
+
+    def confirm_delivery(self):
+        """Publishes are always confirmed."""
+
+    def exchange_declare(self, exchange, exchange_type=None, durable=False, callback=None, **kwargs):
+        """Declare an exchange. Other arguments of pika, such as `arguments`, are accepted and ignored."""
+        self.broker.bindings.setdefault(exchange, set())
+        if callback is not None:
+            callback(None)
+
+    def queue_declare(self, queue, durable=False, callback=None, **kwargs):
+        """Declare a queue. Other arguments of pika, such as `arguments`, are accepted and ignored."""
+        self.broker.queues.setdefault(queue, deque())
+        if callback is not None:
+            callback(None)
+
+    def queue_bind(self, queue, exchange, routing_key=None, callback=None, **kwargs):
+        """Bind a queue to an exchange, ignoring the routing key as a fanout exchange does."""
+        self.broker.bindings.setdefault(exchange, set()).add(queue)
+        if callback is not None:
+            callback(None)
+
+    def basic_qos(self, prefetch_count=0, callback=None, **kwargs):
+        """Set the number of unacknowledged deliveries the consumer may hold."""
+        self.prefetch_count = prefetch_count
+        if callback is not None:
+            callback(None)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        """Route a message to the queues bound to the exchange, or to the queue named by the routing key."""
+        queues = self.broker.bindings.get(exchange) if exchange else None
+        for queue in queues or (routing_key,):
+            self.broker.queues.setdefault(queue, deque()).append((exchange, routing_key, properties, body))
+            self.broker.wake(queue)
+
+    def basic_consume(self, queue, on_message_callback, **kwargs):
+        """Start delivering the messages of a queue to on_message_callback."""
+        consumer_tag = f"ctag-{id(self)}-{queue}"
+        self._consumer = (queue, on_message_callback)
+        self.broker.consumers[queue] = self
+        self.schedule()
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag, callback=None):
+        """Stop delivering messages."""
+        if self._consumer is not None:
+            self.broker.consumers.pop(self._consumer[0], None)
+        self._consumer = None
+        if callback is not None:
+            callback(None)
+
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a delivery."""
+        self._settle(delivery_tag, "ack")
+
+    def basic_nack(self, delivery_tag, requeue=False):
+        """Negatively acknowledge a delivery. Requeued messages are dropped."""
+        self._settle(delivery_tag, "nack")
+
+    def basic_reject(self, delivery_tag, requeue=False):
+        """Reject a delivery. Requeued messages are dropped."""
+        self._settle(delivery_tag, "reject")
+
+    def close(self):
+        """Stop delivering messages."""
+        self.basic_cancel(None)
+
+    def _settle(self, delivery_tag, outcome):
+        self._unacked.discard(delivery_tag)
+        self.settled[outcome] += 1
+        if self._waiters:
+            total = sum(self.settled.values())
+            for count, future in self._waiters:
+                if total >= count and not future.done():
+                    future.set_result(total)
+        self.schedule()
+
+    async def wait_settled(self, count: int) -> int:
+        """Wait until count deliveries were settled on this channel in total."""
+        total = sum(self.settled.values())
+        if total >= count:
+            return total
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((count, future))
+        try:
+            return await future
+        finally:
+            self._waiters.remove((count, future))
+
+    def schedule(self):
+        """Deliver pending messages on the next iteration of the event loop."""
+        if self._consumer is None or self._scheduled:
+            return
+        loop = asyncio.get_running_loop()
+        self._scheduled = True
+        loop.call_soon(self._deliver)
+
+    def _deliver(self):
+        self._scheduled = False
+        if self._consumer is None:
+            return
+        queue_name, on_message = self._consumer
+        queue = self.broker.queues[queue_name]
+        while queue and (not self.prefetch_count or len(self._unacked) < self.prefetch_count):
+            exchange, routing_key, properties, body = queue.popleft()
+            self._next_tag += 1
+            self._unacked.add(self._next_tag)
+            on_message(self, Deliver(self._next_tag, "ctag", exchange, routing_key), properties, body)
+            if self._consumer is None:
+                return
+
+
+class LoopbackBroker:
+    """Exchanges, queues and consumers of an in-process broker."""
+
+    def __init__(self):
+        """Initializes an empty broker."""
+        self.queues: dict[str, deque] = {}
+        self.bindings: dict[str, set[str]] = {}
+        self.consumers: dict[str, LoopbackChannel] = {}
+
+    def channel(self) -> LoopbackChannel:
+        """Open a new channel."""
+        return LoopbackChannel(self)
+
+    def wake(self, queue: str):
+        """Deliver to the consumer of queue if it is waiting for messages."""
+        channel = self.consumers.get(queue)
+        if channel is not None:
+            # Published outside the event loop, deliveries start with the next call to schedule.
+            with contextlib.suppress(RuntimeError):
+                channel.schedule()
+
+    def connection(self, parameters=None) -> SimpleNamespace:
+        """Stand-in for `pika.BlockingConnection`, whose channels publish to this broker."""
+        return SimpleNamespace(channel=self.channel, close=lambda: None, is_open=True)
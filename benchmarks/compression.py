@@ -0,0 +1,82 @@
+"""Compare payload compression codecs on MassTransit envelope shapes.
+
+Usage:
+    python -m benchmarks.compression [--repeat N] [--json]
+"""
+
+import argparse
+import json
+import time
+from uuid import uuid4
+
+from masstransit.compression import CODECS
+from masstransit.models import Message
+
+
+def _envelopes() -> dict[str, bytes]:
+    """Envelope shapes ranging from a tiny event to a large document."""
+    items = [
+        {"sku": f"SKU-{i:06}", "name": f"Item {i}", "quantity": i % 17, "price": i * 1.25, "tags": ["a", "b"]}
+        for i in range(2_000)
+    ]
+    shapes = {
+        "small_event": {"Value": "hello world!"},
+        "order": {"orderId": uuid4().hex, "customer": {"id": 42, "name": "Jane"}, "items": items[:20]},
+        "inventory_snapshot": {"warehouse": "MX-1", "items": items},
+        "document": {"id": uuid4().hex, "body": " ".join(f"word{i % 500}" for i in range(200_000))},
+    }
+    return {
+        name: Message(message=payload, messageType=("benchmarks.Shape",)).model_dump_json().encode()
+        for name, payload in shapes.items()
+    }
+
+
+def _time(func, data: bytes, repeat: int) -> tuple[float, bytes]:
+    result = func(data)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(data)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def run(repeat: int = 20) -> list[dict]:
+    """Run the benchmark and return one result per envelope shape and codec."""
+    results = []
+    for shape, data in _envelopes().items():
+        for codec in CODECS.values():
+            compress_time, compressed = _time(codec.compress, data, repeat)
+            decompress_time, _ = _time(codec.decompress, compressed, repeat)
+            results.append(
+                {
+                    "shape": shape,
+                    "codec": codec.name,
+                    "raw_bytes": len(data),
+                    "compressed_bytes": len(compressed),
+                    "ratio": round(len(data) / len(compressed), 2),
+                    "compress_us": round(compress_time * 1e6, 1),
+                    "decompress_us": round(decompress_time * 1e6, 1),
+                    "compress_mb_s": round(len(data) / compress_time / 1e6, 1),
+                    "decompress_mb_s": round(len(data) / decompress_time / 1e6, 1),
+                }
+            )
+    return results
+
+
+def main():
+    """Print the benchmark results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+    results = run(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = list(results[0])
+    print(" | ".join(f"{c:>18}" for c in columns))
+    for row in results:
+        print(" | ".join(f"{row[c]!s:>18}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure cold-start import time of the MassTransit entry points.
+
+Each scenario imports the modules a command needs in a fresh interpreter with `python -X importtime`, which is
+what every `python -m masstransit` invocation and every consumer process of a worker pays. The best of `--repeat`
+runs is reported, together with the slowest modules by cumulative import time.
+
+Usage:
+    python -m benchmarks.import_time [--repeat N] [--top N] [--json]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+SCENARIOS = {
+    "cli": "import masstransit.__main__",
+    "produce": "import masstransit.__main__, masstransit.models.config, masstransit.producer",
+    "consume": "import masstransit.__main__, masstransit.models.config, masstransit.consumer",
+    "worker": "import masstransit.__main__, masstransit.models.config, masstransit.worker",
+    "models": "import masstransit.models",
+}
+
+
+def _import_times(code: str) -> dict[str, int]:
+    """Cumulative import time in microseconds of each module imported by code."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def run(repeat: int = 5, top: int = 5) -> list[dict]:
+    """Run the benchmark and return one result per scenario."""
+    results = []
+    for scenario, code in SCENARIOS.items():
+        entry_points = code.removeprefix("import ").split(", ")
+        runs = [_import_times(code) for _ in range(repeat)]
+        best = min(runs, key=lambda times: sum(times[module] for module in entry_points))
+        total = sum(best[module] for module in entry_points)
+        slowest = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        results.append(
+            {
+                "scenario": scenario,
+                "total_ms": round(total / 1000, 1),
+                "modules": len(best),
+                "slowest": ", ".join(f"{module} {us / 1000:.1f}ms" for module, us in slowest[:top]),
+            }
+        )
+    return results
+
+
+def main():
+    """Print the benchmark results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest modules to list.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+    results = run(args.repeat, args.top)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for row in results:
+        print(f"{row['scenario']:>8} | {row['total_ms']:>7} ms | {row['modules']:>4} modules | {row['slowest']}")
+
+
+if __name__ == "__main__":
+    main()
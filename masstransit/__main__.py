@@ -1,39 +1,152 @@
-"""MassTransit main module."""
+"""MassTransit main module.
 
+Every command runs in a fresh interpreter, and a worker starts one per consumer, so only typer is imported here. The
+consumer, producer, worker and metrics modules, and pika with them, are imported by the commands that use them.
+"""
+
+import contextlib
 import logging
 import os
+from enum import Enum
+from typing import Annotated
 
 import typer
-from pika.exchange_type import ExchangeType
 
-from masstransit import worker as _worker
-from masstransit.consumer import ReconnectingRabbitMQConsumer
-from masstransit.models import Config
-from masstransit.producer import RabbitMQProducer
 from masstransit.utils import django_setup, logging_setup
 
 app = typer.Typer()
 logger = logging.getLogger(__name__)
 
 
+class ExchangeType(str, Enum):
+    """Exchange types of `pika.exchange_type.ExchangeType`, without importing pika, and x-consistent-hash."""
+
+    direct = "direct"
+    fanout = "fanout"
+    headers = "headers"
+    topic = "topic"
+    consistent_hash = "x-consistent-hash"
+
+
+class ErrorAction(str, Enum):
+    """Names of `masstransit.models.MessageAction`, without importing the models."""
+
+    ACK = "ACK"
+    NACK = "NACK"
+    NACK_AND_REQUEUE = "NACK_AND_REQUEUE"
+    REJECT = "REJECT"
+    REJECT_AND_REQUEUE = "REJECT_AND_REQUEUE"
+
+
+class ExpiredAction(str, Enum):
+    """Names of `masstransit.models.MessageAction`, and HANDLE to handle expired deliveries anyway."""
+
+    ACK = "ACK"
+    NACK = "NACK"
+    NACK_AND_REQUEUE = "NACK_AND_REQUEUE"
+    REJECT = "REJECT"
+    REJECT_AND_REQUEUE = "REJECT_AND_REQUEUE"
+    HANDLE = "HANDLE"
+
+
 @app.command()
 def consume(
     ctx: typer.Context,
     queue: str,
     exchange: str | None = None,
-    exchange_type: ExchangeType = ExchangeType.fanout,  # type: ignore
+    exchange_type: ExchangeType = ExchangeType.fanout,
     routing_key: str | None = None,
     callback_path: str = "masstransit.consumer.default_callback",
+    prefetch_count: int = 1,
+    max_inflight_bytes: int | None = None,
+    middleware: Annotated[
+        list[str] | None, typer.Option(help="Dotted path to a consumer filter. Can be repeated.")
+    ] = None,
+    expired_action: Annotated[
+        ExpiredAction,
+        typer.Option(
+            case_sensitive=False, help="Action for expired deliveries: ACK, REJECT, or HANDLE to handle them anyway."
+        ),
+    ] = ExpiredAction.ACK,
+    coalesce_key: Annotated[
+        str | None, typer.Option(help="Handle only the latest message per correlationId or payload field path.")
+    ] = None,
+    coalesce_window: float = 0.1,
+    rate_limit: Annotated[float | None, typer.Option(help="Maximum messages handled per second.")] = None,
+    rate_limit_burst: int = 1,
+    breaker_threshold: Annotated[
+        int | None, typer.Option(help="Consecutive handler failures that pause consumption.")
+    ] = None,
+    breaker_reset_timeout: float = 30.0,
+    handler_timeout: float | None = None,
+    error_action: Annotated[
+        ErrorAction,
+        typer.Option(
+            case_sensitive=False, help="Action for deliveries whose handler raised: REJECT, NACK, or a requeue action."
+        ),
+    ] = ErrorAction.REJECT,
+    publish_faults: Annotated[
+        bool, typer.Option(help="Send a Fault of failed deliveries to their faultAddress or the <queue>_error queue.")
+    ] = False,
+    single_active_consumer: Annotated[
+        bool, typer.Option(help="Declare the queue with a single active consumer, to handle messages in order.")
+    ] = False,
+    processes: Annotated[
+        int | None,
+        typer.Option(help="Handle messages in this many worker processes, passing bodies through shared memory."),
+    ] = None,
+    shared_buffer_size: Annotated[
+        int | None, typer.Option(help="Size in bytes of the shared memory buffer of the worker processes.")
+    ] = None,
 ):
     """Start a message consumer."""
-    ReconnectingRabbitMQConsumer(
-        ctx.obj["config"],
-        queue,
-        exchange,
-        exchange_type,
-        routing_key,
-        callback_path,
-    ).run()
+    from masstransit import profiling  # noqa: PLC0415
+    from masstransit.consumer import ReconnectingRabbitMQConsumer  # noqa: PLC0415
+    from masstransit.models import MessageAction  # noqa: PLC0415
+
+    server = None
+    if ctx.obj.get("metrics_port") is not None:
+        from masstransit.metrics import MetricsServer  # noqa: PLC0415
+
+        server = MetricsServer(ctx.obj["metrics_port"], ctx.obj["metrics_host"]).start()
+    profiling.install(ctx.obj["config"], server)
+    with contextlib.ExitStack() as stack:
+        process_options = {}
+        if processes is not None:
+            from masstransit import process_pool  # noqa: PLC0415
+
+            pool = stack.enter_context(
+                process_pool.HandlerProcessPool(
+                    callback_path,
+                    processes,
+                    shared_buffer_size or process_pool.DEFAULT_BUFFER_SIZE,
+                    ctx.obj["config"].claim_check_dir,
+                )
+            )
+            process_options = {"consumer_class": process_pool.SharedMemoryConsumer, "pool": pool}
+        ReconnectingRabbitMQConsumer(
+            ctx.obj["config"],
+            queue,
+            exchange,
+            exchange_type,
+            routing_key,
+            callback_path,
+            prefetch_count=prefetch_count,
+            max_inflight_bytes=max_inflight_bytes,
+            middleware=middleware or (),
+            expired_action=None if expired_action.upper() == "HANDLE" else MessageAction[expired_action.upper()],
+            coalesce_key=coalesce_key,
+            coalesce_window=coalesce_window,
+            rate_limit=rate_limit,
+            rate_limit_burst=rate_limit_burst,
+            breaker_threshold=breaker_threshold,
+            breaker_reset_timeout=breaker_reset_timeout,
+            handler_timeout=handler_timeout,
+            error_action=MessageAction[error_action.upper()],
+            publish_faults=publish_faults,
+            single_active_consumer=single_active_consumer,
+            **process_options,
+        ).run()
 
 
 @app.command()
@@ -42,26 +155,130 @@ def produce(
     exchange: str,
     queue: str,
     message: str,
-    exchange_type: ExchangeType = ExchangeType.fanout,  # type: ignore
+    exchange_type: ExchangeType = ExchangeType.fanout,
     routing_key: str = "",
     contract_class_path: str = "masstransit.models.Contract",
+    ttl: float | None = None,
+    shard_key: Annotated[
+        str | None, typer.Option(help="correlationId or payload field path used as routing key for sharded queues.")
+    ] = None,
 ):
     """Produce a message."""
+    from masstransit.producer import RabbitMQProducer  # noqa: PLC0415
+
     RabbitMQProducer(
         ctx.obj["config"],
         exchange,
         exchange_type,
         queue,
+        shard_key=shard_key,
     ).send(
         message,
         routing_key,
         contract_class_path=contract_class_path,
+        ttl=ttl,
+    )
+
+
+@app.command()
+def record(
+    ctx: typer.Context,
+    queue: str,
+    path: str,
+    exchange: str | None = None,
+    exchange_type: ExchangeType = ExchangeType.fanout,
+    routing_key: str | None = None,
+    ack: Annotated[
+        bool, typer.Option(help="Acknowledge recorded messages. With --no-ack they stay in the queue.")
+    ] = True,
+    limit: Annotated[int | None, typer.Option(help="Stop after recording this many messages.")] = None,
+    prefetch_count: int = 100,
+):
+    """Record the messages of a queue to a segment file."""
+    from masstransit import capture  # noqa: PLC0415
+
+    capture.record(
+        ctx.obj["config"],
+        queue,
+        path,
+        acknowledge=ack,
+        limit=limit,
+        prefetch_count=prefetch_count,
+        exchange=exchange,
+        exchange_type=exchange_type,
+        routing_key=routing_key,
     )
 
 
+@app.command()
+def replay(
+    ctx: typer.Context,
+    path: str,
+    exchange: Annotated[str | None, typer.Option(help="Publish to this exchange instead of the recorded one.")] = None,
+    routing_key: Annotated[str | None, typer.Option(help="Publish with this routing key instead.")] = None,
+    speed: Annotated[float, typer.Option(help="Multiple of the recorded rate. 0 replays as fast as possible.")] = 1.0,
+    limit: int | None = None,
+    callback_path: Annotated[
+        str | None, typer.Option(help="Feed this consumer callback instead of publishing to the broker.")
+    ] = None,
+    prefetch_count: int = 1,
+    middleware: Annotated[
+        list[str] | None, typer.Option(help="Dotted path to a consumer filter, with --callback-path. Can be repeated.")
+    ] = None,
+):
+    """Replay the messages of a segment file."""
+    from masstransit import capture  # noqa: PLC0415
+
+    if callback_path is None:
+        capture.replay(ctx.obj["config"], path, exchange, routing_key, speed=speed, limit=limit)
+        return
+    capture.replay_to_callback(
+        ctx.obj["config"],
+        path,
+        callback_path,
+        speed=speed,
+        prefetch_count=prefetch_count,
+        limit=limit,
+        middleware=middleware or (),
+    )
+
+
+@app.command()
+def stats(
+    ctx: typer.Context,
+    worker: Annotated[str | None, typer.Option(help="Only show the queues of this worker.")] = None,
+    interval: Annotated[float, typer.Option(help="Seconds between samples.")] = 5.0,
+    samples: Annotated[int, typer.Option(help="Number of samples rates are computed over.")] = 3,
+    watch: Annotated[bool, typer.Option(help="Keep sampling and print the stats after each sample.")] = False,
+    json_output: Annotated[bool, typer.Option("--json", help="Print the stats as JSON, one line per report.")] = False,
+    metrics_url: Annotated[
+        str | None, typer.Option(help="Metrics endpoint of the workers, to measure drain and ingress rates.")
+    ] = None,
+):
+    """Show the depth, rates and time to drain of the queues of the configured workers."""
+    import json  # noqa: PLC0415
+
+    from masstransit import stats as _stats  # noqa: PLC0415
+
+    queues = _stats.configured_queues(ctx.obj["config"], worker)
+    sampler = _stats.QueueSampler(ctx.obj["config"], queues, metrics_url, window=samples)
+    try:
+        for report in _stats.reports(sampler, interval, samples, follow=watch):
+            if json_output:
+                typer.echo(json.dumps([queue_stats.as_dict() for queue_stats in report]))
+            else:
+                typer.echo(_stats.format_table(report) + ("\n" if watch else ""))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.close()
+
+
 @app.command()
 def worker(ctx: typer.Context, name: str):
     """Run worker from config."""
+    from masstransit import worker as _worker  # noqa: PLC0415
+
     _worker.start(name=name, **ctx.obj)
 
 
@@ -72,8 +289,16 @@ def main(
     log_level: str = "INFO",
     django_settings: str | None = None,
     configure_logging: bool = True,
+    metrics_port: int | None = None,
+    metrics_host: str = "127.0.0.1",
+    log_sample_rate: Annotated[int, typer.Option(help="Log 1 in N per-message lines. Errors are always logged.")] = 1,
+    log_queue: Annotated[
+        bool, typer.Option(help="Write logs from a background thread instead of the event loop.")
+    ] = False,
 ):
     """MassTransit for python."""
+    from masstransit.models.config import Config  # noqa: PLC0415
+
     if config_path:
         os.environ.setdefault("MASSTRANSIT_CONFIG", config_path)
     ctx.obj = {
@@ -81,11 +306,15 @@ def main(
         "log_level": log_level,
         "django_settings": django_settings,
         "configure_logging": configure_logging,
+        "metrics_port": metrics_port,
+        "metrics_host": metrics_host,
+        "log_sample_rate": log_sample_rate,
+        "log_queue": log_queue,
     }
     if django_settings:
         django_setup(django_settings)
     if configure_logging:
-        logging_setup(log_level)
+        logging_setup(log_level, sample_rate=log_sample_rate, use_queue=log_queue)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,413 @@
+"""Record deliveries to segment files and replay them.
+
+A segment file starts with `MAGIC`, followed by one record per delivery: a `RECORD` header with the receive time and
+the field lengths, then the exchange, routing key, properties as compact JSON, and the raw body. Records are only ever
+appended, so a capture can be resumed, and a truncated last record, as left by a crash, is skipped when reading.
+
+Readers memory-map the file, so a capture of any size is read one record at a time through the page cache.
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import pika
+from pika.spec import Basic
+
+from masstransit.consumer import RabbitMQConsumer, ReconnectingRabbitMQConsumer
+from masstransit.models import Config, Message, MessageAction
+from masstransit.serializers import get_serializer
+from masstransit.transport import transport_from_url
+from masstransit.utils import import_string
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MTSEG\x00\x00\x01"
+# Receive time, body, properties, exchange and routing key lengths.
+RECORD = struct.Struct("<dIIBB")
+# user_id is left out: RabbitMQ rejects publishes whose user_id is not the user of the connection.
+PROPERTIES = (
+    "content_type",
+    "content_encoding",
+    "headers",
+    "delivery_mode",
+    "priority",
+    "correlation_id",
+    "reply_to",
+    "expiration",
+    "message_id",
+    "timestamp",
+    "type",
+    "app_id",
+    "cluster_id",
+)
+
+
+def _json_default(value: Any) -> str:
+    return value.decode(errors="replace") if isinstance(value, bytes) else str(value)
+
+
+class Record(NamedTuple):
+    """Recorded delivery."""
+
+    timestamp: float
+    exchange: str
+    routing_key: str
+    properties: dict[str, Any]
+    body: bytes
+
+    def basic_properties(self) -> pika.BasicProperties:
+        """AMQP properties of the delivery."""
+        return pika.BasicProperties(**self.properties)
+
+
+class SegmentWriter:
+    """Appends deliveries to a segment file."""
+
+    def __init__(self, path: str | os.PathLike):
+        """Open path for appending, creating it if needed.
+
+        Raises:
+            ValueError: If path exists and is not a segment file.
+        """
+        self.path = Path(path)
+        self.count = 0
+        self._file = self.path.open("ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        else:
+            with self.path.open("rb") as existing:
+                if existing.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise ValueError(f"{path} is not a segment file")
+
+    def append(
+        self,
+        exchange: str,
+        routing_key: str,
+        properties: pika.BasicProperties | None,
+        body: bytes,
+        timestamp: float | None = None,
+    ) -> None:
+        """Append a delivery, received at timestamp or now."""
+        attributes = {}
+        if properties is not None:
+            for name in PROPERTIES:
+                value = getattr(properties, name, None)
+                if value is not None:
+                    attributes[name] = value
+        encoded_properties = json.dumps(attributes, separators=(",", ":"), default=_json_default).encode()
+        encoded_exchange, encoded_routing_key = exchange.encode(), routing_key.encode()
+        header = RECORD.pack(
+            timestamp if timestamp is not None else time.time(),
+            len(body),
+            len(encoded_properties),
+            len(encoded_exchange),
+            len(encoded_routing_key),
+        )
+        self._file.writelines((header, encoded_exchange, encoded_routing_key, encoded_properties, body))
+        self.count += 1
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        self._file.close()
+
+    def __enter__(self) -> "SegmentWriter":
+        """Use the writer as a context manager."""
+        return self
+
+    def __exit__(self, *_exc_info) -> None:
+        """Close the writer."""
+        self.close()
+
+
+class SegmentReader:
+    """Reads the records of a segment file through a memory map."""
+
+    def __init__(self, path: str | os.PathLike):
+        """Map path.
+
+        Raises:
+            ValueError: If path is not a segment file.
+        """
+        self.path = Path(path)
+        self._file = self.path.open("rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC):
+            self._file.close()
+            raise ValueError(f"{path} is not a segment file")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a segment file")
+        if hasattr(self._mmap, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+
+    def __iter__(self) -> Iterator[Record]:
+        """Records in the order they were appended."""
+        buffer, offset, end = self._mmap, len(MAGIC), len(self._mmap)
+        while offset + RECORD.size <= end:
+            timestamp, body_size, properties_size, exchange_size, routing_key_size = RECORD.unpack_from(buffer, offset)
+            start = offset + RECORD.size
+            offset = start + exchange_size + routing_key_size + properties_size + body_size
+            if offset > end:
+                break
+            routing_key_start = start + exchange_size
+            properties_start = routing_key_start + routing_key_size
+            body_start = properties_start + properties_size
+            yield Record(
+                timestamp,
+                buffer[start:routing_key_start].decode(),
+                buffer[routing_key_start:properties_start].decode(),
+                json.loads(buffer[properties_start:body_start]),
+                buffer[body_start:offset],
+            )
+        if offset != end:
+            logger.warning("Ignoring a truncated record at the end of %s", self.path)
+
+    def close(self) -> None:
+        """Unmap and close the file."""
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "SegmentReader":
+        """Use the reader as a context manager."""
+        return self
+
+    def __exit__(self, *_exc_info) -> None:
+        """Close the reader."""
+        self.close()
+
+
+class RecordingConsumer(RabbitMQConsumer):
+    """Consumer that appends deliveries to a segment file instead of handling them."""
+
+    def __init__(self, *args, writer: SegmentWriter, acknowledge: bool = True, limit: int | None = None, **kwargs):
+        """Initializes the consumer.
+
+        Args:
+            writer: Segment file to append to, shared across reconnects.
+            acknowledge: Acknowledge recorded deliveries. Otherwise they are left unacknowledged, and go back to the
+                queue when the consumer stops.
+            limit: Stop after recording this many deliveries.
+        """
+        super().__init__(*args, **kwargs)
+        self._writer = writer
+        self._acknowledge = acknowledge
+        self._limit = limit
+
+    def on_message(self, channel, basic_deliver, properties, body, message: Message | None = None):
+        """Append the delivery to the segment file."""
+        if self._closing:
+            return
+        if message is not None:
+            body = get_serializer(properties.content_type, fallback=True).dumps(message)
+        self._writer.append(basic_deliver.exchange, basic_deliver.routing_key, properties, body)
+        if self._acknowledge:
+            self.acknowledge_message(basic_deliver.delivery_tag)
+        if self._limit is not None and self._writer.count >= self._limit:
+            self.finish()
+
+    def finish(self):
+        """Stop consuming from within the event loop. The loop stops once the connection is closed."""
+        logger.info("Recorded %d messages to %s", self._writer.count, self._writer.path)
+        if self._heartbeat_handle is not None:
+            self._heartbeat_handle.cancel()
+            self._heartbeat_handle = None
+        self._closing = True
+        self.stop_consuming()
+
+
+def record(
+    config: Config,
+    queue: str,
+    path: str | os.PathLike,
+    acknowledge: bool = True,
+    limit: int | None = None,
+    prefetch_count: int = 100,
+    **consumer_options,
+) -> int:
+    """Record the deliveries of a queue to a segment file until interrupted or `limit` is reached.
+
+    Without `acknowledge`, the prefetch count is raised to `limit`, or unlimited, so deliveries keep coming while the
+    recorded ones are held. Deliveries recorded before a reconnect are recorded again when they are redelivered.
+
+    Returns:
+        The number of recorded deliveries.
+    """
+    if not acknowledge:
+        prefetch_count = limit or 0
+    with SegmentWriter(path) as writer:
+        ReconnectingRabbitMQConsumer(
+            config,
+            queue,
+            consumer_class=RecordingConsumer,
+            writer=writer,
+            acknowledge=acknowledge,
+            limit=limit,
+            prefetch_count=prefetch_count,
+            expired_action=None,
+            publish_faults=False,
+            **consumer_options,
+        ).run()
+        return writer.count
+
+
+class _Pacer:
+    """Delays records so they are replayed at `speed` times their recorded rate, or without delay when 0."""
+
+    def __init__(self, speed: float):
+        self._speed = speed
+        self._first: float | None = None
+        self._started_at = 0.0
+
+    def delay(self, timestamp: float) -> float:
+        if self._speed <= 0:
+            return 0.0
+        if self._first is None:
+            self._first, self._started_at = timestamp, time.monotonic()
+            return 0.0
+        return (timestamp - self._first) / self._speed - (time.monotonic() - self._started_at)
+
+
+def replay(
+    config: Config,
+    path: str | os.PathLike,
+    exchange: str | None = None,
+    routing_key: str | None = None,
+    speed: float = 1.0,
+    limit: int | None = None,
+) -> int:
+    """Republish the records of a segment file with their original body and properties.
+
+    Args:
+        exchange: Exchange to publish to. Defaults to the exchange each record was delivered from.
+        routing_key: Routing key to publish with. Defaults to the routing key of each record.
+        speed: Multiple of the recorded rate, or 0 to publish as fast as possible.
+        limit: Stop after publishing this many records.
+
+    Returns:
+        The number of published records.
+    """
+    connection = transport_from_url(*config.dsns).connect_blocking()
+    channel = connection.channel()
+    pacer = _Pacer(speed)
+    count = 0
+    try:
+        with SegmentReader(path) as reader:
+            for entry in reader:
+                if limit is not None and count >= limit:
+                    break
+                delay = pacer.delay(entry.timestamp)
+                if delay > 0:
+                    time.sleep(delay)
+                channel.basic_publish(
+                    exchange=entry.exchange if exchange is None else exchange,
+                    routing_key=entry.routing_key if routing_key is None else routing_key,
+                    body=entry.body,
+                    properties=entry.basic_properties(),
+                )
+                count += 1
+    finally:
+        connection.close()
+    logger.info("Replayed %d messages from %s", count, path)
+    return count
+
+
+class _ReplayChannel:
+    """Channel through which replayed deliveries are settled, admitting at most `prefetch_count` unsettled ones."""
+
+    channel_number = 0
+
+    def __init__(self, prefetch_count: int):
+        self.settled: dict[str, int] = {"ack": 0, "nack": 0, "reject": 0}
+        self._prefetch_count = max(prefetch_count, 1)
+        self._slots = asyncio.Semaphore(self._prefetch_count)
+
+    def __int__(self) -> int:
+        return self.channel_number
+
+    async def acquire(self):
+        await self._slots.acquire()
+
+    async def drain(self):
+        for _ in range(self._prefetch_count):
+            await self._slots.acquire()
+
+    def basic_ack(self, delivery_tag):
+        self._settle("ack")
+
+    def basic_nack(self, delivery_tag, requeue=False):
+        self._settle("nack")
+
+    def basic_reject(self, delivery_tag, requeue=False):
+        self._settle("reject")
+
+    def _settle(self, outcome: str):
+        self.settled[outcome] += 1
+        self._slots.release()
+
+
+def replay_to_callback(
+    config: Config,
+    path: str | os.PathLike,
+    callback_path: str,
+    speed: float = 1.0,
+    prefetch_count: int = 1,
+    limit: int | None = None,
+    middleware: Sequence[str] = (),
+) -> dict[str, int]:
+    """Feed the records of a segment file to a consumer callback, without a broker.
+
+    Records go through the decoding and middleware of a `RabbitMQConsumer`, with at most `prefetch_count` of them
+    handled at once. Expired messages are handled anyway, and handlers that raise count as rejections. Middleware
+    that pauses consumption, such as the circuit breaker, is not supported.
+
+    Returns:
+        The number of records acknowledged, negatively acknowledged and rejected.
+    """
+    callback = import_string(callback_path)
+
+    async def _callback(**kwargs):
+        try:
+            return await callback(**kwargs)
+        except Exception:
+            logger.exception("Handler failed on replayed message %s", kwargs["basic_deliver"].delivery_tag)
+            return MessageAction.REJECT
+
+    async def _feed() -> dict[str, int]:
+        channel = _ReplayChannel(prefetch_count)
+        consumer = RabbitMQConsumer(
+            config,
+            "replay",
+            callback=_callback,
+            prefetch_count=prefetch_count,
+            middleware=middleware,
+            expired_action=None,
+            publish_faults=False,
+        )
+        consumer._channel = channel
+        pacer = _Pacer(speed)
+        with SegmentReader(path) as reader:
+            for delivery_tag, entry in enumerate(reader, 1):
+                if limit is not None and delivery_tag > limit:
+                    break
+                delay = pacer.delay(entry.timestamp)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await channel.acquire()
+                basic_deliver = Basic.Deliver("replay", delivery_tag, False, entry.exchange, entry.routing_key)
+                consumer.on_message(channel, basic_deliver, entry.basic_properties(), entry.body)
+        await channel.drain()
+        return channel.settled
+
+    settled = asyncio.run(_feed())
+    logger.info("Replayed %d messages from %s: %s", sum(settled.values()), path, settled)
+    return settled
@@ -0,0 +1,171 @@
+"""Claim-check support for large message payloads.
+
+Payloads above a size threshold are stored in a blob store by the producer, and the published envelope only
+carries a reference in its headers. Consumers fetch the payload in an executor before the handler runs, as stores
+such as S3 block, and others fetch it when `message` is first accessed.
+"""
+
+import abc
+import asyncio
+import logging
+import os
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from pydantic import PrivateAttr
+from pydantic_core import from_json, to_json
+
+from masstransit.models import Message
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CHECK_HEADER = "MT-ClaimCheck"
+
+
+class BlobStore(abc.ABC):
+    """Storage backend for claim-checked payloads."""
+
+    @abc.abstractmethod
+    def put(self, key: str, data: bytes) -> str:
+        """Store data under key and return the reference to publish."""
+
+    @abc.abstractmethod
+    def get(self, reference: str) -> bytes:
+        """Return the data stored under reference."""
+
+    @abc.abstractmethod
+    def delete(self, reference: str) -> None:
+        """Remove the data stored under reference."""
+
+
+class FileSystemBlobStore(BlobStore):
+    """Blob store backed by a local or shared directory."""
+
+    def __init__(self, root: str | os.PathLike):
+        """Initializes the store in the given directory."""
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, reference: str) -> Path:
+        path = (self.root / reference).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid claim-check reference: {reference}")
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        """Write data atomically to a file named after key."""
+        path = self._path(key)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return key
+
+    def get(self, reference: str) -> bytes:
+        """Read the file for reference.
+
+        The JSON parser only takes bytes, so the file is read in one call rather than memory-mapped and copied.
+        """
+        return self._path(reference).read_bytes()
+
+    def delete(self, reference: str) -> None:
+        """Remove the file for reference."""
+        self._path(reference).unlink(missing_ok=True)
+
+
+class S3BlobStore(BlobStore):
+    """Blob store for S3-compatible object storage.
+
+    Takes any client exposing the boto3 `put_object`, `get_object` and `delete_object` methods.
+    """
+
+    def __init__(self, client: Any, bucket: str, prefix: str = ""):
+        """Initializes the store for the given bucket and key prefix."""
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def put(self, key: str, data: bytes) -> str:
+        """Upload data as an object."""
+        reference = f"{self.prefix}{key}"
+        self.client.put_object(Bucket=self.bucket, Key=reference, Body=data)
+        return reference
+
+    def get(self, reference: str) -> bytes:
+        """Download the object body."""
+        return self.client.get_object(Bucket=self.bucket, Key=reference)["Body"].read()
+
+    def delete(self, reference: str) -> None:
+        """Delete the object."""
+        self.client.delete_object(Bucket=self.bucket, Key=reference)
+
+
+class ClaimCheckMessage(Message):
+    """Message whose payload is fetched from a blob store the first time `message` is accessed."""
+
+    _payload_loader: Callable[[], Any] | None = PrivateAttr(default=None)
+
+    def __getattr__(self, name: str) -> Any:
+        """Load the payload on first access."""
+        if name == "message" and self._payload_loader is not None:
+            loader, self._payload_loader = self._payload_loader, None
+            self.__dict__["message"] = payload = loader()
+            return payload
+        return super().__getattr__(name)  # type: ignore[misc]
+
+    async def fetch_payload(self) -> None:
+        """Fetch the payload in the default executor, so the store doesn't block the event loop."""
+        loader = self._payload_loader
+        if loader is None:
+            return
+        payload = await asyncio.get_running_loop().run_in_executor(None, loader)
+        if not self.payload_loaded:
+            self.__dict__["message"] = payload
+            self._payload_loader = None
+
+    @property
+    def payload_loaded(self) -> bool:
+        """Whether the payload has been fetched already."""
+        return "message" in self.__dict__
+
+    def model_dump(self, **kwargs) -> dict[str, Any]:
+        """Dump the model, fetching the payload first."""
+        self.message  # noqa: B018
+        return super().model_dump(**kwargs)
+
+    def model_dump_json(self, **kwargs) -> str:
+        """Dump the model as json, fetching the payload first."""
+        self.message  # noqa: B018
+        return super().model_dump_json(**kwargs)
+
+
+def check_in(message: Message, store: BlobStore, threshold: int, size: int | None = None) -> Message:
+    """Move the payload of message to store if its serialized size is above threshold.
+
+    Args:
+        size: Size of the message once serialized, when already known. Defaults to the size of the payload as JSON.
+    """
+    if size is None:
+        size = len(to_json(message.message))
+    if size <= threshold:
+        return message
+    data = to_json(message.message)
+    reference = store.put(message.messageId, data)
+    logger.debug("Claim-checked payload of %s (%d bytes): %s", message.messageId, len(data), reference)
+    return message.model_copy(update={"message": {}, "headers": {**message.headers, CLAIM_CHECK_HEADER: reference}})
+
+
+def check_out(message: Message, store: BlobStore) -> Message:
+    """Return message with a lazily fetched payload if it carries a claim-check reference."""
+    reference = message.headers.get(CLAIM_CHECK_HEADER)
+    if reference is None:
+        return message
+
+    def _load() -> Any:
+        return from_json(store.get(reference))
+
+    fields = {name: value for name, value in message.__dict__.items() if name != "message"}
+    claimed = ClaimCheckMessage.model_construct(_fields_set=message.model_fields_set, **fields)
+    del claimed.__dict__["message"]
+    claimed._payload_loader = _load
+    return claimed
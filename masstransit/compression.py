@@ -0,0 +1,141 @@
+"""Payload compression codecs negotiated through the AMQP content-encoding property.
+
+gzip is always available. zstd and lz4 are registered when their packages are installed. Bodies with an encoding
+that is not registered, such as the `utf-8` charset some clients set, are taken as not compressed. Decompressed
+bodies are limited to `MAX_DECOMPRESSED_SIZE` bytes, so that a small body can't expand into a huge one.
+"""
+
+import gzip
+import logging
+import zlib
+from collections.abc import Callable
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+MAX_DECOMPRESSED_SIZE = 2**31
+
+
+class Codec(NamedTuple):
+    """Compression codec."""
+
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _check_size(output: bytes) -> bytes:
+    if len(output) > MAX_DECOMPRESSED_SIZE:
+        raise ValueError(f"Decompressed body is larger than {MAX_DECOMPRESSED_SIZE} bytes")
+    return output
+
+
+def _decompress_frames(
+    data: bytes, new_decompressor: Callable, error: type[Exception], name: str, padding: bytes = b""
+) -> bytes:
+    """Decompress every frame of a body, with a bounded output.
+
+    Frames are decompressed one after the other with a new decompressor, and `padding` bytes between them are
+    skipped. Truncated frames and the errors of the codec are raised as `ValueError`.
+    """
+    output = bytearray()
+    try:
+        while data:
+            decompressor = new_decompressor()
+            output += decompressor.decompress(data, MAX_DECOMPRESSED_SIZE + 1 - len(output))
+            _check_size(output)
+            if not decompressor.eof:
+                raise ValueError(f"Truncated {name} body")
+            data = decompressor.unused_data.lstrip(padding)
+    except error as e:
+        raise ValueError(f"Invalid {name} body: {e}") from e
+    return bytes(output)
+
+
+def _gzip_decompress(data: bytes) -> bytes:
+    # Like gzip.decompress, every member of the body is decompressed, and the zero padding between them skipped.
+    return _decompress_frames(data, lambda: zlib.decompressobj(wbits=31), zlib.error, "gzip", padding=b"\x00")
+
+
+CODECS: dict[str, Codec] = {
+    "gzip": Codec("gzip", lambda data: gzip.compress(data, compresslevel=6, mtime=0), _gzip_decompress),
+}
+
+try:
+    from compression import zstd  # type: ignore[import-not-found]
+
+    CODECS["zstd"] = Codec(
+        "zstd",
+        zstd.compress,
+        lambda data: _decompress_frames(data, zstd.ZstdDecompressor, zstd.ZstdError, "zstd"),
+    )
+except ImportError:
+    try:
+        import zstandard  # type: ignore[import-not-found]
+
+        def _zstandard_decompress(data: bytes) -> bytes:
+            # zstandard has no bounded streaming decompressor, so the size declared in the frame header is checked
+            # before its buffer is allocated. One-shot decompression raises on truncated frames.
+            try:
+                if zstandard.frame_content_size(data) > MAX_DECOMPRESSED_SIZE:
+                    raise ValueError(f"Decompressed body is larger than {MAX_DECOMPRESSED_SIZE} bytes")
+                return _check_size(
+                    zstandard.ZstdDecompressor().decompress(data, max_output_size=MAX_DECOMPRESSED_SIZE + 1)
+                )
+            except zstandard.ZstdError as e:
+                raise ValueError(f"Invalid zstd body: {e}") from e
+
+        CODECS["zstd"] = Codec("zstd", zstandard.ZstdCompressor().compress, _zstandard_decompress)
+    except ImportError:
+        pass
+
+try:
+    import lz4.frame  # type: ignore[import-not-found]
+
+    CODECS["lz4"] = Codec(
+        "lz4",
+        lz4.frame.compress,
+        lambda data: _decompress_frames(data, lz4.frame.LZ4FrameDecompressor, RuntimeError, "lz4"),
+    )
+except ImportError:
+    pass
+
+
+def get_codec(encoding: str) -> Codec:
+    """Return the codec for a content-encoding.
+
+    Raises:
+        ValueError: If the encoding is not supported.
+    """
+    try:
+        return CODECS[encoding]
+    except KeyError:
+        raise ValueError(f"Unsupported content encoding: {encoding}") from None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress data with the codec for encoding."""
+    return get_codec(encoding).compress(data)
+
+
+_UNKNOWN_ENCODINGS: set[str] = set()
+
+
+def decompress(data: bytes, encoding: str | None) -> bytes:
+    """Decompress data with the codec for encoding.
+
+    Data is returned as is for no or identity encoding, and for encodings that are not registered, with a warning
+    the first time each of them is seen.
+
+    Raises:
+        ValueError: If the data is not valid for the codec, or decompresses to more than `MAX_DECOMPRESSED_SIZE`.
+    """
+    if not encoding or encoding == "identity":
+        return data
+    codec = CODECS.get(encoding.lower())
+    if codec is None:
+        if encoding not in _UNKNOWN_ENCODINGS:
+            _UNKNOWN_ENCODINGS.add(encoding)
+            logger.warning("Unknown content encoding %r, taking bodies with it as not compressed", encoding)
+        return data
+    return codec.decompress(data)
@@ -3,35 +3,77 @@
 import asyncio
 import functools
 import logging
+import random
 import time
 from asyncio import get_running_loop
-from enum import Enum
+from collections.abc import Callable, Sequence
 from functools import partial
 from typing import TYPE_CHECKING
 
-import pika
-from pika.adapters.asyncio_connection import AsyncioConnection
-from pika.channel import Channel
 from pika.exchange_type import ExchangeType
 from pydantic import ValidationError
 
-from masstransit.models import Config, Message
-from masstransit.utils import import_string
+from masstransit import faults, tracing
+from masstransit.claim_check import (
+    CLAIM_CHECK_HEADER,
+    BlobStore,
+    ClaimCheckMessage,
+    FileSystemBlobStore,
+    check_out,
+)
+from masstransit.compression import decompress
+from masstransit.metrics import HEALTH, Counter, Gauge, Histogram
+from masstransit.middleware import (
+    CircuitBreakerFilter,
+    CoalescingFilter,
+    DeliveryContext,
+    ExpirationFilter,
+    Filter,
+    Pipeline,
+    RateLimitFilter,
+    TimeoutFilter,
+    resolve_filter,
+)
+from masstransit.models import Config, Message, MessageAction
+from masstransit.profiling import PROFILER
+from masstransit.serializers import get_serializer
+from masstransit.transport import Transport, redact_url, transport_from_url
+from masstransit.utils import SAMPLED, import_string
 
 if TYPE_CHECKING:
+    from pika.adapters.asyncio_connection import AsyncioConnection
+    from pika.channel import Channel
     from pika.spec import Basic, BasicProperties
 
 logger = logging.getLogger(__name__)
 
-
-class MessageAction(Enum):
-    """Actions that can be taken on messages."""
-
-    ACK = 100
-    NACK = 200
-    NACK_AND_REQUEUE = 201
-    REJECT = 400
-    REJECT_AND_REQUEUE = 401
+HEARTBEAT_INTERVAL = 5.0
+
+DELIVERIES = Counter("masstransit_consumer_deliveries_total", "Deliveries received.", ("queue", "contract"))
+SETTLED = Counter(
+    "masstransit_consumer_settled_total", "Deliveries settled by message action.", ("queue", "contract", "action")
+)
+HANDLER_SECONDS = Histogram("masstransit_consumer_handler_seconds", "Handler latency.", ("queue", "contract"))
+HANDLER_ERRORS = Counter("masstransit_consumer_handler_errors_total", "Handler exceptions.", ("queue", "contract"))
+DECODE_FAILURES = Counter(
+    "masstransit_consumer_decode_failures_total", "Deliveries that could not be decoded.", ("queue",)
+)
+INFLIGHT = Gauge("masstransit_consumer_inflight", "Deliveries not settled yet.", ("queue",))
+INFLIGHT_BYTES = Gauge("masstransit_consumer_inflight_bytes", "Body size of deliveries not settled yet.", ("queue",))
+RECONNECTS = Counter("masstransit_consumer_reconnects_total", "Consumer reconnections.", ("queue",))
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+BROKER_WAIT_SECONDS = Histogram(
+    "masstransit_consumer_broker_wait_seconds",
+    "Time from sentTime until the delivery reached the consumer.",
+    ("queue",),
+    buckets=LAG_BUCKETS,
+)
+LAG_SECONDS = Histogram(
+    "masstransit_consumer_lag_seconds",
+    "Time from sentTime until the handler started.",
+    ("queue",),
+    buckets=LAG_BUCKETS,
+)
 
 
 async def default_callback(
@@ -44,6 +86,7 @@ async def default_callback(
         properties.app_id,
         message.messageId,
         message.message,
+        extra=SAMPLED,
     )
 
 
@@ -71,8 +114,57 @@ class RabbitMQConsumer:
         exchange_type: ExchangeType = ExchangeType.fanout,  # type: ignore
         routing_key: str | None = None,
         callback_path: str = "masstransit.consumer.default_callback",
+        prefetch_count: int = 1,
+        max_inflight_bytes: int | None = None,
+        claim_check_store: BlobStore | None = None,
+        middleware: Sequence[Filter | str] = (),
+        expired_action: MessageAction | None = MessageAction.ACK,
+        coalesce_key: str | None = None,
+        coalesce_window: float = 0.1,
+        rate_limit: float | None = None,
+        rate_limit_burst: int = 1,
+        breaker_threshold: int | None = None,
+        breaker_reset_timeout: float = 30.0,
+        handler_timeout: float | None = None,
+        error_action: MessageAction = MessageAction.REJECT,
+        publish_faults: bool = False,
+        single_active_consumer: bool = False,
+        dsn: str | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+        callback: Callable | None = None,
+        transport: Transport | None = None,
     ):
-        """Create a new instance of the consumer class."""
+        """Create a new instance of the consumer class.
+
+        Args:
+            prefetch_count: Maximum number of unacknowledged deliveries RabbitMQ will push to this consumer.
+            max_inflight_bytes: Optional budget for the total body size of unfinished deliveries. When exceeded,
+                consumption is paused with Basic.Cancel and resumed once enough deliveries are settled.
+            claim_check_store: Blob store to fetch claim-checked payloads from. Defaults to a file system store in
+                `config.claim_check_dir` when it is set. With `config.claim_check_delete`, payloads are deleted once
+                their delivery is acknowledged, which is only safe when a single queue receives them.
+            middleware: Filters run around the handler, as instances, classes or dotted paths to either. The first
+                filter is the outermost.
+            expired_action: Action for deliveries whose expiration property or expirationTime has passed, before
+                they are handled. ACK discards them and REJECT dead-letters them. None handles them anyway.
+            coalesce_key: Enables latest-wins coalescing: `correlationId` or a dotted path into the payload. Only the
+                latest delivery per key within `coalesce_window` seconds is handled, the others are acknowledged.
+            rate_limit: Maximum handler calls per second, with bursts of up to `rate_limit_burst` calls.
+            breaker_threshold: Consecutive handler failures after which consumption is paused for
+                `breaker_reset_timeout` seconds before probing again. Disabled when None.
+            handler_timeout: Seconds after which a handler call is cancelled and counts as a failure.
+            error_action: Action for deliveries whose handler raised. REJECT dead-letters them, when the queue has
+                a dead letter exchange, and the requeue actions put them back on the queue.
+            publish_faults: Send a `Fault` of each delivery whose handler raised, unless it is requeued, to its
+                `faultAddress` or to the `<queue>_error` exchange, which is then declared with the queue.
+            single_active_consumer: Declare the queue with a single active consumer, so that only one consumer at a
+                time receives its messages, in order, and the others take over when it stops.
+            dsn: Broker URL to connect to. Defaults to the first one in `config.dsn`.
+            loop: Event loop to run the connection on. Defaults to the running loop or a new one.
+            callback: Already imported callback, used instead of importing `callback_path`.
+            transport: Transport to consume from. Defaults to the transport for `dsn`, RabbitMQ for `amqp://` URLs
+                or the in-process bus for `memory://`.
+        """
         self.should_reconnect = False
         self.was_consuming = False
 
@@ -81,18 +173,53 @@ class RabbitMQConsumer:
         self._closing = False
         self._consumer_tag: str | None = None
         self._config = config
+        self._dsn = dsn or config.dsns[0]
+        self._transport = transport or transport_from_url(self._dsn)
+        self._loop = loop
         self._queue = queue
         self._exchange = exchange
         self._exchange_type = exchange_type
         self._routing_key = routing_key
+        self._queue_arguments = {"x-single-active-consumer": True} if single_active_consumer else None
+        self._error_action = MessageAction(error_action)
+        self._publish_faults = publish_faults
         self._consuming = False
         # In production, experiment with higher prefetch values
         # for higher consumer throughput
-        self._prefetch_count = 1
-        self._on_message_handler = import_string(callback_path)
+        self._prefetch_count = prefetch_count
+        self._max_inflight_bytes = max_inflight_bytes
+        self._inflight: dict[int, int] = {}
+        self._inflight_bytes = 0
+        self._pause_reasons: set[str] = set()
+        self._inflight_gauge = INFLIGHT.labels(queue)
+        self._inflight_bytes_gauge = INFLIGHT_BYTES.labels(queue)
+        self._broker_wait = BROKER_WAIT_SECONDS.labels(queue)
+        self._lag = LAG_SECONDS.labels(queue)
+        self._heartbeat_handle: asyncio.TimerHandle | None = None
+        self._on_message_handler = callback if callback is not None else import_string(callback_path)
+        if claim_check_store is None and config.claim_check_dir:
+            claim_check_store = FileSystemBlobStore(config.claim_check_dir)
+        self._claim_check_store = claim_check_store
+        middleware = list(middleware)
+        if breaker_threshold is not None:
+            middleware.append(CircuitBreakerFilter(breaker_threshold, breaker_reset_timeout))
+        if handler_timeout is not None:
+            middleware.append(TimeoutFilter(handler_timeout))
+        if rate_limit is not None:
+            middleware.insert(0, RateLimitFilter(rate_limit, rate_limit_burst))
+        if coalesce_key is not None:
+            if prefetch_count <= 1:
+                logger.warning("Coalescing on %s has no effect with a prefetch count of %d", queue, prefetch_count)
+            middleware = [CoalescingFilter(coalesce_key, coalesce_window), *middleware]
+        if expired_action is not None:
+            middleware = [ExpirationFilter(expired_action), *middleware]
+        self._pipeline = Pipeline(queue, middleware)
+        self._handle = self._pipeline.compose(self._call_handler)
+        self._pipeline.bind(self)
+        HEALTH.add_readiness_check(f"consumer:{queue}", self.is_ready)
 
     @property
-    def channel(self) -> Channel:
+    def channel(self) -> "Channel":
         """Get the RabbitMQ channel.
 
         Returns:
@@ -106,7 +233,7 @@ class RabbitMQConsumer:
         return self._channel
 
     @property
-    def connection(self) -> AsyncioConnection:
+    def connection(self) -> "AsyncioConnection":
         """Get the RabbitMQ connection.
 
         Returns:
@@ -120,23 +247,23 @@ class RabbitMQConsumer:
         return self._connection
 
     def connect(self):
-        """Connects to RabbitMQ, returning the connection handle.
+        """Connects to the broker through the transport, returning the connection handle.
 
         When the connection is established, the on_connection_open method
-        will be invoked by pika.
+        will be invoked by the transport.
         """
-        logger.debug("Connecting to %s", self._config.dsn)
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        return AsyncioConnection(
-            parameters=pika.URLParameters(self._config.dsn),
+        loop = self._loop
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+        return self._transport.connect(
             on_open_callback=self.on_connection_open,
             on_open_error_callback=self.on_connection_open_error,
             on_close_callback=self.on_connection_closed,
-            custom_ioloop=loop,
+            loop=loop,
         )
 
     def close_connection(self):
@@ -161,8 +288,7 @@ class RabbitMQConsumer:
         The connection
           _unused_connection:
         """
-        parameters = pika.URLParameters(self._config.dsn)
-        logger.info("Connection opened: %s", parameters)
+        logger.info("Connection opened: %s", self._transport)
         self.open_channel()
 
     def on_connection_open_error(self, _unused_connection, err):
@@ -299,7 +425,7 @@ class RabbitMQConsumer:
         """
         logger.debug("Declaring queue %s", queue_name)
         cb = functools.partial(self.on_queue_declareok, userdata=queue_name)
-        self.channel.queue_declare(queue=queue_name, callback=cb, durable=True)
+        self.channel.queue_declare(queue=queue_name, callback=cb, durable=True, arguments=self._queue_arguments)
 
     def on_queue_declareok(self, _unused_frame, userdata):
         """Method invoked by pika when the Queue.Declare RPC call made in setup_queue has completed.
@@ -341,8 +467,18 @@ class RabbitMQConsumer:
         The consumer must acknowledge this message before RabbitMQ will deliver another one. You should experiment
         with different prefetch values to achieve desired performance.
         """
+        if self._publish_faults:
+            self.setup_error_queue()
         self.channel.basic_qos(prefetch_count=self._prefetch_count, callback=self.on_basic_qos_ok)
 
+    def setup_error_queue(self):
+        """Declare the error exchange of the queue and bind it to the error queue, where faults are published."""
+        name = faults.error_queue(self._queue)
+        logger.debug("Declaring error queue %s", name)
+        self.channel.exchange_declare(exchange=name, exchange_type=ExchangeType.fanout, durable=True)
+        self.channel.queue_declare(queue=name, durable=True)
+        self.channel.queue_bind(name, name)
+
     def on_basic_qos_ok(self, _unused_frame):
         """Invoked by pika when the Basic.QoS method has completed.
 
@@ -367,11 +503,97 @@ class RabbitMQConsumer:
         """
         logger.debug("Issuing consumer related RPC commands")
         self.add_on_cancel_callback()
-        self._consumer_tag = self.channel.basic_consume(self._queue, self.on_message)
         self.was_consuming = True
-        self._consuming = True
+        if self._pause_reasons:
+            logger.info("Consumption of %s is paused: %s", self._queue, ", ".join(sorted(self._pause_reasons)))
+            return
+        self._basic_consume()
         logger.info("Consuming queue: %s.", self._queue)
 
+    def _basic_consume(self):
+        self._consumer_tag = self.channel.basic_consume(self._queue, self.on_message)
+        self._consuming = True
+
+    @property
+    def inflight_bytes(self) -> int:
+        """Total body size of the deliveries that have not been settled yet."""
+        return self._inflight_bytes
+
+    def is_ready(self) -> bool:
+        """Whether the channel is open and the consumer is subscribed or deliberately paused."""
+        return self._channel is not None and not self._closing and (self._consuming or self.is_paused)
+
+    @property
+    def stopped(self) -> bool:
+        """Whether the consumer was stopped for good, rather than to reconnect."""
+        return self._closing and not self.should_reconnect
+
+    @property
+    def is_paused(self) -> bool:
+        """Whether consumption is currently paused."""
+        return bool(self._pause_reasons)
+
+    def pause_consuming(self, reason: str):
+        """Stop receiving new deliveries until resume_consuming is called with the same reason.
+
+        The consumer is cancelled with Basic.Cancel while the channel stays open, so unfinished deliveries can
+        still be settled. Deliveries already on the wire for the cancelled consumer tag are rejected and requeued
+        by pika. Several reasons may hold the consumer paused at the same time.
+        """
+        if not self._pause_reasons:
+            logger.info("Pausing consumption of %s: %s", self._queue, reason)
+        self._pause_reasons.add(reason)
+        if not self._consuming or self._consumer_tag is None or self._channel is None:
+            return
+        self.channel.basic_cancel(self._consumer_tag, functools.partial(self.on_pauseok, userdata=self._consumer_tag))
+        self._consumer_tag = None
+        self._consuming = False
+
+    def on_pauseok(self, _unused_frame, userdata):
+        """Invoked by pika when RabbitMQ acknowledges the cancellation issued by pause_consuming."""
+        logger.debug("RabbitMQ acknowledged the pause of the consumer: %s", userdata)
+
+    def resume_consuming(self, reason: str):
+        """Release a pause reason and issue Basic.Consume again once no reasons are left."""
+        self._pause_reasons.discard(reason)
+        if self._pause_reasons or self._consuming or self._closing or self._channel is None:
+            return
+        logger.info("Resuming consumption of %s", self._queue)
+        self._basic_consume()
+
+    def set_prefetch_count(self, prefetch_count: int | None = None):
+        """Apply a prefetch count to the channel, or restore the configured one when None.
+
+        Basic.Qos only applies to consumers started afterwards, so an active subscription is restarted.
+        """
+        if self._channel is None:
+            return
+        restart = self._consuming
+        if restart:
+            self.pause_consuming("prefetch_count")
+        self.channel.basic_qos(prefetch_count=prefetch_count or self._prefetch_count)
+        if restart:
+            self.resume_consuming("prefetch_count")
+
+    def _track_delivery(self, delivery_tag: int, size: int):
+        self._inflight[delivery_tag] = size
+        self._inflight_bytes += size
+        self._inflight_gauge.set(len(self._inflight))
+        self._inflight_bytes_gauge.set(self._inflight_bytes)
+        if self._max_inflight_bytes is not None and self._inflight_bytes >= self._max_inflight_bytes:
+            self.pause_consuming("max_inflight_bytes")
+
+    def _release_delivery(self, delivery_tag: int):
+        self._inflight_bytes -= self._inflight.pop(delivery_tag, 0)
+        self._inflight_gauge.set(len(self._inflight))
+        self._inflight_bytes_gauge.set(self._inflight_bytes)
+        if (
+            "max_inflight_bytes" in self._pause_reasons
+            and self._max_inflight_bytes is not None
+            and self._inflight_bytes < self._max_inflight_bytes
+        ):
+            self.resume_consuming("max_inflight_bytes")
+
     def add_on_cancel_callback(self):
         """Add a callback that will be invoked if RabbitMQ cancels the consumer for some reason.
 
@@ -391,56 +613,165 @@ class RabbitMQConsumer:
         if self._channel:
             self.channel.close()
 
-    def on_message(self, channel, basic_deliver, properties, body):
+    def on_message(self, channel, basic_deliver, properties, body, message: Message | None = None):
         """Invoked by pika when a message is delivered from RabbitMQ.
 
         The channel is passed for your convenience. The basic_deliver object that
         is passed in carries the exchange, routing key, delivery tag and
         a redelivered flag for the message. The properties passed in is an
         instance of BasicProperties with the message properties and the body
-        is the message that was sent.
+        is the message that was sent. Transports that pass messages by reference
+        give the message instead, and it is not decoded.
         """
-        message = Message.model_validate_json(body)
-        handler = self._on_message_handler or default_callback
-        try:
-            task = get_running_loop().create_task(
-                handler(
-                    message=message,
-                    basic_deliver=basic_deliver,
-                    properties=properties,
-                    channel=channel,
-                )
+        received_at_ns = tracing.received_at_ns()
+        self._track_delivery(basic_deliver.delivery_tag, len(body))
+        context = DeliveryContext(self._queue, channel, basic_deliver, properties, body)
+        action = self._pipeline.before_decode(context)
+        if action is not None:
+            self._settle(basic_deliver.delivery_tag, action, context.contract)
+            return
+        if message is None:
+            started_at = time.perf_counter()
+            try:
+                message = self._decode(properties, body)
+            except (ValidationError, ValueError) as err:
+                DECODE_FAILURES.labels(self._queue).inc()
+                logger.error("Rejecting message %s that could not be decoded: %s", basic_deliver.delivery_tag, err)
+                self.reject_message(basic_deliver.delivery_tag)
+                return
+            finally:
+                self._pipeline.observe("decode", started_at)
+        context.message = message
+        context.contract = contract = message.messageType[0] if message.messageType else "unknown"
+        context.span = tracing.start_receive_span(self._queue, message, received_at_ns)
+        DELIVERIES.labels(self._queue, contract).inc()
+        sent_at = self._sent_timestamp(message)
+        if sent_at is not None:
+            self._broker_wait.observe(max(time.time() - sent_at, 0.0))
+        action = self._pipeline.after_decode(context)
+        if action is not None:
+            tracing.end_receive_span(context.span, action)
+            self._settle(basic_deliver.delivery_tag, action, contract, message)
+            return
+        task = get_running_loop().create_task(self._run_handler(self._handle(context), sent_at, context))
+        task.add_done_callback(
+            partial(
+                self._task_done_callback,
+                basic_deliver=basic_deliver,
+                contract=contract,
+                started_at=time.perf_counter(),
+                context=context,
             )
-            task.add_done_callback(partial(self._task_done_callback, basic_deliver=basic_deliver))
-        except ValidationError as err:
-            logger.error("ABORTING! %s Body: %s", err, body)
-            self.stop()
+        )
+
+    def _call_handler(self, context: DeliveryContext):
+        handler = self._on_message_handler or default_callback
+        return handler(
+            message=context.message,
+            basic_deliver=context.basic_deliver,
+            properties=context.properties,
+            channel=context.channel,
+        )
 
-    def _task_done_callback(self, task, basic_deliver):
-        result = task.result()
+    @staticmethod
+    def _sent_timestamp(message: Message) -> float | None:
+        try:
+            return message.sent_at.timestamp()
+        except (ValueError, OverflowError):
+            logger.debug("Invalid sentTime in message %s: %s", message.messageId, message.sentTime)
+            return None
+
+    async def _run_handler(self, coro, sent_at: float | None, context: DeliveryContext):
+        if sent_at is not None:
+            self._lag.observe(max(time.time() - sent_at, 0.0))
+        with tracing.handle(self._queue, context.message, context.span):
+            if isinstance(context.message, ClaimCheckMessage):
+                await context.message.fetch_payload()
+            return await coro
+
+    def _decode(self, properties, body) -> Message:
+        serializer = get_serializer(properties.content_type, fallback=True)
+        message = serializer.loads(decompress(body, properties.content_encoding))
+        if self._claim_check_store is not None:
+            message = check_out(message, self._claim_check_store)
+        return message
+
+    def _task_done_callback(self, task, basic_deliver, contract="unknown", started_at=None, context=None):
+        if started_at is not None:
+            # Time filters held the delivery on purpose, such as a coalescing window, is not handler latency.
+            if context is not None:
+                started_at += context.waited
+            elapsed = time.perf_counter() - started_at
+            HANDLER_SECONDS.labels(self._queue, contract).observe(elapsed)
+            self._pipeline.observe("handler", started_at)
+            if PROFILER.active and context is not None and context.message is not None:
+                PROFILER.record_handler(self._queue, contract, context.message.messageId, elapsed)
+        try:
+            result = task.result()
+        except Exception as err:
+            HANDLER_ERRORS.labels(self._queue, contract).inc()
+            logger.error("Handler failed for delivery %s", basic_deliver.delivery_tag, exc_info=err)
+            if context is not None:
+                tracing.end_receive_span(context.span, error=err)
+                if self._publish_faults and self._error_action not in faults.REQUEUE_ACTIONS:
+                    self._publish_fault(context, err)
+            self._settle(basic_deliver.delivery_tag, self._error_action, contract, getattr(context, "message", None))
+            return
         try:
             action = MessageAction(result)
         except (TypeError, ValueError):
             action = MessageAction.ACK
+        if context is not None:
+            action = self._pipeline.after_result(context, action)
+            tracing.end_receive_span(context.span, action)
+        self._settle(basic_deliver.delivery_tag, action, contract, getattr(context, "message", None))
 
+    def _publish_fault(self, context: DeliveryContext, error: BaseException):
+        try:
+            message = context.message or self._decode(context.properties, context.body)
+            faults.publish_fault(self.channel, self._queue, message, error, context.properties.content_type)
+        except Exception:
+            logger.warning(
+                "Could not publish the fault of delivery %s", context.basic_deliver.delivery_tag, exc_info=True
+            )
+
+    def _settle(self, delivery_tag, action: MessageAction, contract: str = "unknown", message: Message | None = None):
+        SETTLED.labels(self._queue, contract, action.name).inc()
         match action:
             case MessageAction.ACK:
-                self.acknowledge_message(basic_deliver.delivery_tag)
+                self.acknowledge_message(delivery_tag)
+                if message is not None:
+                    self._delete_claim_check(message)
                 return
             case MessageAction.NACK:
-                self.nack_message(basic_deliver.delivery_tag)
+                self.nack_message(delivery_tag)
                 return
             case MessageAction.NACK_AND_REQUEUE:
-                self.nack_message(basic_deliver.delivery_tag, requeue=True)
+                self.nack_message(delivery_tag, requeue=True)
                 return
             case MessageAction.REJECT:
-                self.reject_message(basic_deliver.delivery_tag)
+                self.reject_message(delivery_tag)
                 return
             case MessageAction.REJECT_AND_REQUEUE:
-                self.reject_message(basic_deliver.delivery_tag, requeue=True)
+                self.reject_message(delivery_tag, requeue=True)
                 return
         raise RuntimeError("Unknown message action")
 
+    def _delete_claim_check(self, message: Message):
+        if self._claim_check_store is None or not self._config.claim_check_delete:
+            return
+        reference = message.headers.get(CLAIM_CHECK_HEADER)
+        if reference is None:
+            return
+        # Stores may block on I/O, such as S3 requests, so the payload is deleted off the event loop.
+        future = get_running_loop().run_in_executor(None, self._claim_check_store.delete, reference)
+        future.add_done_callback(partial(self._claim_check_deleted, reference))
+
+    @staticmethod
+    def _claim_check_deleted(reference: str, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Could not delete claim-checked payload %s: %s", reference, future.exception())
+
     def acknowledge_message(self, delivery_tag):
         """Acknowledge the message delivery from RabbitMQ by sending a Basic.Ack RPC method for the delivery tag.
 
@@ -448,18 +779,21 @@ class RabbitMQConsumer:
           int: delivery_tag: The delivery tag from the Basic.Deliver frame
           delivery_tag:
         """
-        logger.debug("Acknowledging message %s", delivery_tag)
+        logger.debug("Acknowledging message %s", delivery_tag, extra=SAMPLED)
         self.channel.basic_ack(delivery_tag)
+        self._release_delivery(delivery_tag)
 
     def nack_message(self, delivery_tag, requeue=False):
         """Reject the message, such as putting it back on the queue."""
-        logger.debug("Rejecting message %s", delivery_tag)
+        logger.debug("Rejecting message %s", delivery_tag, extra=SAMPLED)
         self.channel.basic_nack(delivery_tag, requeue=requeue)
+        self._release_delivery(delivery_tag)
 
     def reject_message(self, delivery_tag, requeue=False):
         """Reject the message, such as putting it back on the queue."""
-        logger.debug("Rejecting message %s", delivery_tag)
+        logger.debug("Rejecting message %s", delivery_tag, extra=SAMPLED)
         self.channel.basic_reject(delivery_tag, requeue=requeue)
+        self._release_delivery(delivery_tag)
 
     def stop_consuming(self):
         """Tell RabbitMQ that you would like to stop consuming by sending the Basic.Cancel RPC command."""
@@ -499,8 +833,22 @@ class RabbitMQConsumer:
         Starting the IOLoop to block and allow the AsyncioConnection to operate.
         """
         self._connection = self.connect()
+        PROFILER.attach(self.connection.ioloop)
+        self._heartbeat()
         self.connection.ioloop.run_forever()
 
+    def _heartbeat(self):
+        HEALTH.heartbeat()
+        self._heartbeat_handle = self.connection.ioloop.call_later(HEARTBEAT_INTERVAL, self._heartbeat)
+
+    def close(self):
+        """Close the middleware once the consumer is stopped for good.
+
+        Filters such as `DjangoDBFilter` keep threads and connections across reconnects, so this is not part of
+        `stop`. `ReconnectingRabbitMQConsumer` calls it when it stops reconnecting.
+        """
+        self._pipeline.close()
+
     def stop(self):
         """Cleanly shutdown the connection to RabbitMQ by stopping the consumer with RabbitMQ.
 
@@ -511,6 +859,9 @@ class RabbitMQConsumer:
           communicate: with RabbitMQ
           the: IOLoop will be buffered but not processed.
         """
+        if self._heartbeat_handle is not None:
+            self._heartbeat_handle.cancel()
+            self._heartbeat_handle = None
         if not self._closing:
             self._closing = True
             logger.info("Stopping")
@@ -523,7 +874,12 @@ class RabbitMQConsumer:
 
 
 class ReconnectingRabbitMQConsumer:
-    """RabbitMQConsumer that will reconnect if the nested RabbitMQConsumer indicates that a reconnect is necessary."""
+    """RabbitMQConsumer that will reconnect whenever the nested RabbitMQConsumer stops without being stopped for good.
+
+    Reconnects wait with exponential backoff and full jitter, so consumers that lost the same node don't come back in
+    lockstep. When `config.dsn` lists several nodes, a node that can't be consumed from is skipped for the next one.
+    The event loop, the callback and the middleware are kept across reconnects.
+    """
 
     def __init__(
         self,
@@ -534,35 +890,62 @@ class ReconnectingRabbitMQConsumer:
         routing_key: str | None = None,
         callback_path: str = "masstransit.consumer.default_callback",
         consumer_class=RabbitMQConsumer,
+        **consumer_options,
     ):
-        """Initializes the ReconnectingRabbitMQConsumer instance."""
-        self._reconnect_delay = 0
+        """Initializes the ReconnectingRabbitMQConsumer instance.
+
+        Any extra keyword arguments are passed to each new consumer instance.
+        """
+        self._reconnect_attempt = 0
         self._config = config
         self._exchange = exchange
         self._exchange_type = exchange_type
         self._queue = queue
         self._routing_key = routing_key
         self._callback_path = callback_path
+        self._callback = import_string(callback_path)
         self._consumer_class = consumer_class
+        if "middleware" in consumer_options:
+            consumer_options["middleware"] = [resolve_filter(spec) for spec in consumer_options["middleware"]]
+        self._consumer_options = consumer_options
+        self._dsns = config.dsns
+        if config.dsn_selection == "random":
+            random.shuffle(self._dsns)
+        self._dsn_index = 0
+        self._loop = asyncio.new_event_loop()
         self._connect_consumer()
 
     def run(self):
-        """Run the consumer loop."""
-        while True:
-            try:
-                self._consumer.run()
-            except KeyboardInterrupt:
-                self._consumer.stop()
-                break
-            self._maybe_reconnect()
-
-    def _maybe_reconnect(self):
-        if self._consumer.should_reconnect:
-            self._consumer.stop()
-            reconnect_delay = self._get_reconnect_delay()
-            logger.info("Reconnecting after %d seconds", reconnect_delay)
-            time.sleep(reconnect_delay)
-            self._connect_consumer()
+        """Run the consumer loop, reconnecting whenever the consumer stops, until it is interrupted or stopped.
+
+        A consumer is only stopped for good when its `stop` was called, not when the broker closed its channel or
+        connection. The middleware is closed when the loop ends.
+        """
+        try:
+            while True:
+                try:
+                    self._consumer.run()
+                except KeyboardInterrupt:
+                    self._consumer.stop()
+                    break
+                if self._consumer.stopped:
+                    break
+                self._reconnect()
+        finally:
+            self._consumer.close()
+
+    def _reconnect(self):
+        RECONNECTS.labels(self._queue).inc()
+        self._consumer.stop()
+        if self._consumer.was_consuming:
+            self._dsn_index = 0
+        else:
+            self._dsn_index = (self._dsn_index + 1) % len(self._dsns)
+        reconnect_delay = self._get_reconnect_delay()
+        logger.info("Reconnecting to %s after %.2f seconds", redact_url(self._dsns[self._dsn_index]), reconnect_delay)
+        # Sleep on the consumer loop so callbacks scheduled on it, such as finishing tasks, keep running.
+        self._loop.run_until_complete(asyncio.sleep(reconnect_delay))
+        self._connect_consumer()
 
     def _connect_consumer(self):
         self._consumer = self._consumer_class(
@@ -572,12 +955,15 @@ class ReconnectingRabbitMQConsumer:
             exchange_type=self._exchange_type,
             routing_key=self._routing_key,
             callback_path=self._callback_path,
+            dsn=self._dsns[self._dsn_index],
+            loop=self._loop,
+            callback=self._callback,
+            **self._consumer_options,
         )
 
-    def _get_reconnect_delay(self):
+    def _get_reconnect_delay(self) -> float:
         if self._consumer.was_consuming:
-            self._reconnect_delay = 0
-        else:
-            self._reconnect_delay += 1
-        self._reconnect_delay = min(self._reconnect_delay, 30)
-        return self._reconnect_delay
+            self._reconnect_attempt = 0
+        ceiling = min(self._config.reconnect_max_delay, self._config.reconnect_base_delay * 2**self._reconnect_attempt)
+        self._reconnect_attempt = min(self._reconnect_attempt + 1, 32)
+        return random.uniform(0, ceiling)
@@ -0,0 +1,198 @@
+"""Django database connection management for consumers.
+
+Consumers are long-lived and run outside of Django's request cycle, so nothing closes broken connections or
+connections older than `CONN_MAX_AGE`, and each thread a handler runs ORM code in opens a connection of its own.
+`DjangoDBFilter` keeps a bounded pool of threads, each with its own connection, opened when the consumer starts. A
+delivery holds one of them while it is handled, and runs its ORM code there with `run_in_connection`. As Django does
+around requests, old connections are closed before and after each delivery, and the delivery can be wrapped in a
+transaction.
+
+Connections are only kept between deliveries when `CONN_MAX_AGE` is above 0.
+"""
+
+import asyncio
+import contextlib
+import logging
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, TypeVar
+
+from masstransit.middleware import DeliveryContext, Filter, HandlerCall
+from masstransit.models import MessageAction
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ConnectionThread:
+    """Thread that runs the ORM code of deliveries, and keeps the connections it opens."""
+
+    def __init__(self, name: str):
+        """Start the thread."""
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix=name)
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run func in the thread."""
+        return await asyncio.wrap_future(self._executor.submit(func, *args, **kwargs))
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run func in the thread, blocking until it returns."""
+        return self._executor.submit(func, *args, **kwargs).result()
+
+    def close(self) -> None:
+        """Stop the thread once the calls already submitted are done."""
+        self._executor.shutdown(wait=True)
+
+
+class ConnectionPool:
+    """Bounded pool of connection threads, each used by one delivery at a time."""
+
+    def __init__(self, size: int, name: str = "masstransit-db"):
+        """Start the threads.
+
+        Raises:
+            ValueError: If size is not positive.
+        """
+        if size < 1:
+            raise ValueError(f"Connection pool size must be positive, not {size}")
+        self.threads = [ConnectionThread(f"{name}-{n}") for n in range(size)]
+        self._idle: asyncio.Queue[ConnectionThread] = asyncio.Queue()
+        for thread in self.threads:
+            self._idle.put_nowait(thread)
+
+    @contextlib.asynccontextmanager
+    async def connection(self) -> AsyncIterator[ConnectionThread]:
+        """Hold a connection thread, waiting for one to be released when all are in use."""
+        thread = await self._idle.get()
+        try:
+            yield thread
+        finally:
+            self._idle.put_nowait(thread)
+
+    def close(self) -> None:
+        """Stop the threads."""
+        for thread in self.threads:
+            thread.close()
+
+
+DB_CONNECTION: ContextVar[ConnectionThread | None] = ContextVar("masstransit_db_connection", default=None)
+
+
+async def run_in_connection(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run func, which may use the ORM, in the connection thread of the delivery being handled.
+
+    Raises:
+        RuntimeError: If called outside of a handler wrapped by `DjangoDBFilter`.
+    """
+    thread = DB_CONNECTION.get()
+    if thread is None:
+        raise RuntimeError("run_in_connection must be called from a handler wrapped by DjangoDBFilter")
+    return await thread.run(func, *args, **kwargs)
+
+
+def _connect(using: str) -> None:
+    from django.db import connections  # noqa: PLC0415
+
+    connections[using].ensure_connection()
+
+
+def _close_old_connections() -> None:
+    from django.db import close_old_connections  # noqa: PLC0415
+
+    close_old_connections()
+
+
+def _close_connections() -> None:
+    from django.db import connections  # noqa: PLC0415
+
+    connections.close_all()
+
+
+def _atomic(using: str) -> Any:
+    from django.db import transaction  # noqa: PLC0415
+
+    atomic = transaction.atomic(using=using)
+    atomic.__enter__()
+    return atomic
+
+
+def _end_atomic(atomic: Any, using: str, commit: bool, error: BaseException | None = None) -> None:
+    from django.db import transaction  # noqa: PLC0415
+
+    if error is None and not commit:
+        transaction.set_rollback(True, using=using)
+    atomic.__exit__(type(error) if error else None, error, error.__traceback__ if error else None)
+
+
+class DjangoDBFilter(Filter):
+    """Give each delivery a pooled Django connection, and close old connections around it.
+
+    Handlers run their ORM code with `run_in_connection`, in the connection thread held by the delivery. With
+    `atomic`, that code runs in one transaction per delivery, which is rolled back when the handler fails or the
+    delivery is not acknowledged.
+    """
+
+    def __init__(self, using: str = "default", connections: int | None = None, atomic: bool | None = None):
+        """Initializes the filter.
+
+        Args:
+            using: Database alias of the transactions.
+            connections: Number of connection threads. Defaults to `config.django_db_connections`.
+            atomic: Wrap each delivery in a transaction. Defaults to `config.django_db_atomic`.
+        """
+        self.using = using
+        self.connections = connections
+        self.atomic = atomic
+        self.pool: ConnectionPool | None = None
+
+    def bind(self, consumer: Any) -> None:
+        """Start the connection threads and connect them, once for every consumer created on reconnects."""
+        config = consumer._config
+        if self.connections is None:
+            self.connections = config.django_db_connections
+        if self.atomic is None:
+            self.atomic = config.django_db_atomic
+        if self.pool is not None:
+            return
+        self.pool = ConnectionPool(self.connections)
+        for thread in self.pool.threads:
+            try:
+                thread.call(_connect, self.using)
+            except Exception as e:
+                # The database may come up later; connections are then opened by the first delivery.
+                logger.warning("Could not connect to database %s: %s", self.using, e)
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Hold a connection thread while the handler runs, closing old connections before and after."""
+        async with self.pool.connection() as thread:
+            token = DB_CONNECTION.set(thread)
+            try:
+                await thread.run(_close_old_connections)
+                if not self.atomic:
+                    return await call_next(context)
+                atomic = await thread.run(_atomic, self.using)
+                try:
+                    result = await call_next(context)
+                except BaseException as e:
+                    await thread.run(_end_atomic, atomic, self.using, False, e)
+                    raise
+                try:
+                    commit = result is None or MessageAction(result) is MessageAction.ACK
+                except (TypeError, ValueError):
+                    commit = True
+                await thread.run(_end_atomic, atomic, self.using, commit)
+                return result
+            finally:
+                DB_CONNECTION.reset(token)
+                await thread.run(_close_old_connections)
+
+    def close(self) -> None:
+        """Close the connections and stop the threads."""
+        if self.pool is None:
+            return
+        for thread in self.pool.threads:
+            thread.call(_close_connections)
+        self.pool.close()
+        self.pool = None
@@ -0,0 +1,108 @@
+"""MassTransit faults of failed handlers.
+
+When a handler raises, its delivery is settled with the error action of the consumer. Unless the delivery is
+requeued and the consumer publishes faults, a `Fault<T>` envelope carrying the exception and the original payload is
+sent to the `faultAddress` of the message, or published to the `<queue>_error` exchange, which is bound to a queue of
+the same name.
+"""
+
+import traceback
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pika
+
+from masstransit.metrics import Counter
+from masstransit.models import Message, MessageAction
+from masstransit.models.message import Host
+from masstransit.serializers import get_serializer
+from masstransit.utils import address_destination
+
+FAULT_MESSAGE_TYPE = "urn:message:MassTransit:Fault"
+ERROR_QUEUE_SUFFIX = "_error"
+REQUEUE_ACTIONS = frozenset((MessageAction.NACK_AND_REQUEUE, MessageAction.REJECT_AND_REQUEUE))
+# Depth of the chain of causes included in a fault.
+MAX_INNER_EXCEPTIONS = 8
+
+FAULTS = Counter("masstransit_consumer_faults_total", "Faults sent for failed handlers.", ("queue",))
+
+
+def error_queue(queue: str) -> str:
+    """Name of the error exchange and queue of a queue."""
+    return f"{queue}{ERROR_QUEUE_SUFFIX}"
+
+
+def fault_message_types(message_types: tuple[str, ...] | None) -> list[str]:
+    """Message types of the fault of a message, `Fault<T>` for each of its types and the `Fault` base type."""
+    faults = [
+        f"{FAULT_MESSAGE_TYPE}[[{message_type.removeprefix('urn:message:')}]]" for message_type in message_types or ()
+    ]
+    return [*faults, FAULT_MESSAGE_TYPE]
+
+
+def exception_info(error: BaseException, depth: int = 0) -> dict:
+    """MassTransit `ExceptionInfo` of an exception, with its cause as the inner exception."""
+    cause = error.__cause__ or error.__context__
+    return {
+        "exceptionType": f"{type(error).__module__}.{type(error).__qualname__}",
+        "innerException": exception_info(cause, depth + 1)
+        if cause is not None and depth < MAX_INNER_EXCEPTIONS
+        else None,
+        "stackTrace": "".join(traceback.format_tb(error.__traceback__)),
+        "message": str(error),
+        "source": type(error).__module__,
+        "data": None,
+    }
+
+
+def fault_message(message: Message, error: BaseException, source_address: str | None = None) -> Message:
+    """`Fault<T>` envelope of a message whose handler raised error."""
+    return Message(
+        messageType=tuple(fault_message_types(message.messageType)),
+        message={
+            "faultId": str(uuid4()),
+            "faultedMessageId": message.messageId,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "exceptions": [exception_info(error)],
+            "host": Host().model_dump(),
+            "faultMessageTypes": list(message.messageType or ()),
+            "message": message.message,
+        },
+        requestId=message.requestId,
+        correlationId=message.correlationId,
+        conversationId=message.conversationId or message.messageId,
+        initiatorId=message.messageId,
+        sourceAddress=source_address,
+        destinationAddress=message.faultAddress,
+        headers={key: message.headers[key] for key in ("traceparent", "tracestate") if key in message.headers},
+    )
+
+
+def fault_destination(message: Message, queue: str) -> tuple[str, str]:
+    """Exchange and routing key to send the fault of message to.
+
+    The `faultAddress` is resolved with `address_destination`. Without a fault address, faults go to the error
+    exchange of the queue.
+    """
+    if not message.faultAddress:
+        return error_queue(queue), ""
+    return address_destination(message.faultAddress)
+
+
+def publish_fault(channel, queue: str, message: Message, error: BaseException, content_type: str | None = None):
+    """Publish the fault of a message on channel, serialized as the message was."""
+    fault = fault_message(message, error, source_address=f"queue:{queue}")
+    exchange, routing_key = fault_destination(message, queue)
+    serializer = get_serializer(content_type, fallback=True)
+    channel.basic_publish(
+        exchange=exchange,
+        routing_key=routing_key,
+        body=serializer.dumps(fault),
+        properties=pika.BasicProperties(
+            content_type=serializer.content_type,
+            delivery_mode=pika.DeliveryMode.Persistent,
+            message_id=fault.messageId,
+            correlation_id=message.requestId or message.correlationId,
+        ),
+    )
+    FAULTS.labels(queue).inc()
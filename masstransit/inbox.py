@@ -0,0 +1,236 @@
+"""Inbox of processed message ids for idempotent consumers.
+
+Redeliveries after reconnects and producer retries both reach the consumer with a `messageId` it has already
+processed. An inbox remembers processed ids so the duplicates can be acknowledged without running the handler again.
+The in-memory inbox deduplicates within a process. The SQLite and Django inboxes share processed ids between
+processes. Their calls block on I/O, so they are marked `blocking` and `DedupFilter` makes them in a thread of its own,
+off the event loop.
+"""
+
+import abc
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLE = "masstransit_inbox"
+
+
+class InboxStore(abc.ABC):
+    """Storage backend for processed message ids.
+
+    Stores whose calls block on I/O set `blocking`, and are then only called from a single thread, never from the
+    thread running the event loop.
+    """
+
+    blocking = False
+
+    @abc.abstractmethod
+    def contains(self, message_id: str) -> bool:
+        """Whether message_id was processed and has not expired."""
+
+    @abc.abstractmethod
+    def add(self, message_id: str) -> int:
+        """Record message_id as processed and return the number of ids evicted to make room or by expiry."""
+
+    def close(self) -> None:  # noqa: B027
+        """Release the resources of the store."""
+
+
+class MemoryInbox(InboxStore):
+    """Bounded in-memory inbox.
+
+    Keeps the `max_size` most recently seen ids, each for at most `ttl` seconds when given.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float | None = None):
+        """Initializes an empty inbox."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Number of ids currently remembered."""
+        return len(self._entries)
+
+    def contains(self, message_id: str) -> bool:
+        """Whether message_id was processed, refreshing its position in the LRU order."""
+        processed_at = self._entries.get(message_id)
+        if processed_at is None:
+            return False
+        if self.ttl is not None and time.monotonic() - processed_at >= self.ttl:
+            del self._entries[message_id]
+            return False
+        self._entries.move_to_end(message_id)
+        return True
+
+    def add(self, message_id: str) -> int:
+        """Record message_id, evicting expired and least recently seen ids."""
+        now = time.monotonic()
+        self._entries[message_id] = now
+        self._entries.move_to_end(message_id)
+        evicted = 0
+        if self.ttl is not None:
+            while self._entries:
+                oldest_id, processed_at = next(iter(self._entries.items()))
+                if now - processed_at < self.ttl:
+                    break
+                del self._entries[oldest_id]
+                evicted += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+
+class SQLiteInbox(InboxStore):
+    """Inbox in a SQLite database, shared by the processes of a host.
+
+    Expired ids are purged at most once per `purge_interval` seconds when `ttl` is given.
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float | None = None,
+        table: str = DEFAULT_TABLE,
+        purge_interval: float = 60.0,
+    ):
+        """Open the database and create the inbox table if needed."""
+        if not table.isidentifier():
+            raise ValueError(f"Invalid inbox table name: {table}")
+        self.ttl = ttl
+        self.table = table
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30.0)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (message_id TEXT PRIMARY KEY, processed_at REAL NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_processed_at ON {table} (processed_at)")
+
+    def contains(self, message_id: str) -> bool:
+        """Whether message_id is in the database and has not expired."""
+        oldest = time.time() - self.ttl if self.ttl is not None else float("-inf")
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT 1 FROM {self.table} WHERE message_id = ? AND processed_at >= ?", (message_id, oldest)
+            ).fetchone()
+        return row is not None
+
+    def add(self, message_id: str) -> int:
+        """Insert or refresh message_id, purging expired ids when due."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (message_id, processed_at) VALUES (?, ?)", (message_id, now)
+            )
+            if self.ttl is None or now - self._purged_at < self.purge_interval:
+                return 0
+            self._purged_at = now
+            return self._connection.execute(
+                f"DELETE FROM {self.table} WHERE processed_at < ?", (now - self.ttl,)
+            ).rowcount
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+
+class DjangoInbox(InboxStore):
+    """Inbox in a table of a Django database, shared by every process using that database.
+
+    The table is created on first use, so no migration or installed app is needed. As Django refuses database calls
+    from a thread running an event loop, the inbox is blocking, and its connection belongs to the thread it is called
+    from. Unusable connections and connections older than `CONN_MAX_AGE` are closed before each call.
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        using: str = "default",
+        ttl: float | None = None,
+        table: str = DEFAULT_TABLE,
+        purge_interval: float = 60.0,
+    ):
+        """Initializes the inbox for the database alias `using`."""
+        if not table.isidentifier():
+            raise ValueError(f"Invalid inbox table name: {table}")
+        self.using = using
+        self.ttl = ttl
+        self.table = table
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self._created = False
+
+    def _cursor(self):
+        from django.db import connections  # noqa: PLC0415
+
+        connection = connections[self.using]
+        connection.close_if_unusable_or_obsolete()
+        if not self._created:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} "
+                    "(message_id VARCHAR(64) PRIMARY KEY, processed_at DOUBLE PRECISION NOT NULL)"
+                )
+            self._created = True
+        return connection.cursor()
+
+    def contains(self, message_id: str) -> bool:
+        """Whether message_id is in the table and has not expired."""
+        query, params = f"SELECT 1 FROM {self.table} WHERE message_id = %s", [message_id]
+        if self.ttl is not None:
+            query, params = f"{query} AND processed_at >= %s", [message_id, time.time() - self.ttl]
+        with self._cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone() is not None
+
+    def add(self, message_id: str) -> int:
+        """Insert or refresh message_id, purging expired ids when due."""
+        from django.db import IntegrityError, transaction  # noqa: PLC0415
+
+        now = time.time()
+        with self._cursor() as cursor:
+            try:
+                with transaction.atomic(using=self.using):
+                    cursor.execute(
+                        f"INSERT INTO {self.table} (message_id, processed_at) VALUES (%s, %s)", [message_id, now]
+                    )
+            except IntegrityError:
+                cursor.execute(f"UPDATE {self.table} SET processed_at = %s WHERE message_id = %s", [now, message_id])
+            if self.ttl is None or now - self._purged_at < self.purge_interval:
+                return 0
+            self._purged_at = now
+            cursor.execute(f"DELETE FROM {self.table} WHERE processed_at < %s", [now - self.ttl])
+            return max(cursor.rowcount, 0)
+
+
+def inbox_from_url(url: str, max_size: int = 10_000, ttl: float | None = None) -> InboxStore:
+    """Create an inbox from a URL.
+
+    Supported URLs are `memory://`, `sqlite:///path/to/inbox.db` and `django://alias` (the alias defaults to
+    `default`).
+
+    Raises:
+        ValueError: If the URL scheme is not supported.
+    """
+    parts = urlsplit(url)
+    match parts.scheme:
+        case "memory":
+            return MemoryInbox(max_size=max_size, ttl=ttl)
+        case "sqlite":
+            return SQLiteInbox(parts.netloc + parts.path or ":memory:", ttl=ttl)
+        case "django":
+            return DjangoInbox(using=parts.netloc or "default", ttl=ttl)
+    raise ValueError(f"Unsupported inbox URL: {url}")
@@ -0,0 +1,387 @@
+"""Zero-dependency metrics in the Prometheus text exposition format.
+
+Metrics are module-level objects registered in `REGISTRY`. Children for a set of label values are created once and
+cached, so recording a sample on the hot path is a dict lookup and an addition. Updates are not locked: metrics
+are written from the event loop thread and only read from the HTTP server thread.
+"""
+
+import abc
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return f"{int(value)}"
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Iterable[tuple[str, str]]) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return f"{{{pairs}}}" if pairs else ""
+
+
+class Registry:
+    """Collection of metrics exposed together."""
+
+    def __init__(self):
+        """Initializes an empty registry."""
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: "Metric") -> None:
+        """Add a metric to the registry.
+
+        Raises:
+            ValueError: If a metric with the same name is already registered.
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> "Metric":
+        """Return a registered metric by name."""
+        return self._metrics[name]
+
+    def expose(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        return "".join(f"{line}\n" for metric in self._metrics.values() for line in metric.collect())
+
+
+REGISTRY = Registry()
+
+
+class Metric(abc.ABC):
+    """Base class for labelled metrics."""
+
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: Registry | None = REGISTRY,
+    ):
+        """Initializes and registers the metric."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """Create the value of a new combination of label values."""
+
+    def labels(self, *values: str, **labels: str):
+        """Return the child for the given label values, creating it on first use.
+
+        Label values must be strings, so that the children are found by the values as given.
+
+        Raises:
+            ValueError: If the number of label values doesn't match the label names.
+            TypeError: If a label value is not a string.
+        """
+        key = values or tuple(labels[name] for name in self.labelnames)
+        try:
+            return self._children[key]
+        except KeyError:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}") from None
+            if not all(isinstance(value, str) for value in key):
+                raise TypeError(f"{self.name} label values must be strings, got {key!r}") from None
+            return self._children.setdefault(tuple(str(value) for value in key), self._new_child())
+
+    @abc.abstractmethod
+    def _samples(self, child) -> Iterator[tuple[str, tuple[tuple[str, str], ...], float]]:
+        """Yield the name, extra labels and value of each sample of a child."""
+
+    def collect(self) -> Iterator[str]:
+        """Yield the exposition lines for this metric."""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for key, child in list(self._children.items()):
+            labels = tuple(zip(self.labelnames, key, strict=True))
+            for name, extra_labels, value in self._samples(child):
+                yield f"{name}{_format_labels(labels + extra_labels)} {_format_value(value)}"
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    """Monotonically increasing counter."""
+
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increment the unlabelled counter."""
+        self.labels().inc(amount)
+
+    def _samples(self, child):
+        yield self.name, (), child.value
+
+
+class Gauge(Metric):
+    """Value that can go up and down."""
+
+    type = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        """Set the unlabelled gauge."""
+        self.labels().set(value)
+
+    def _samples(self, child):
+        yield self.name, (), child.value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: Registry | None = REGISTRY,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        """Initializes and registers the histogram."""
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Observe a value in the unlabelled histogram."""
+        self.labels().observe(value)
+
+    def _samples(self, child):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), child.counts, strict=True):
+            cumulative += count
+            yield f"{self.name}_bucket", (("le", _format_value(bound)),), cumulative
+        yield f"{self.name}_sum", (), child.sum
+        yield f"{self.name}_count", (), child.count
+
+
+class Health:
+    """Liveness and readiness state of a process.
+
+    The process is live while its heartbeat is fresh, and ready when all readiness checks pass.
+    """
+
+    def __init__(self, heartbeat_timeout: float = 60.0):
+        """Initializes the health state."""
+        self.heartbeat_timeout = heartbeat_timeout
+        self._last_heartbeat: float | None = None
+        self._readiness_checks: dict[str, Callable[[], bool]] = {}
+
+    def heartbeat(self) -> None:
+        """Record that the process is making progress."""
+        self._last_heartbeat = time.monotonic()
+
+    def add_readiness_check(self, name: str, check: Callable[[], bool]) -> None:
+        """Add or replace a named readiness check."""
+        self._readiness_checks[name] = check
+
+    def remove_readiness_check(self, name: str) -> None:
+        """Remove a named readiness check."""
+        self._readiness_checks.pop(name, None)
+
+    def is_live(self) -> bool:
+        """Whether the heartbeat, if any, is recent enough."""
+        if self._last_heartbeat is None:
+            return True
+        return time.monotonic() - self._last_heartbeat < self.heartbeat_timeout
+
+    def is_ready(self) -> bool:
+        """Whether there are readiness checks and all of them pass."""
+        checks = list(self._readiness_checks.values())
+        return bool(checks) and all(check() for check in checks)
+
+
+HEALTH = Health()
+
+Response = tuple[int, str, bytes]
+Route = Callable[[dict[str, list[str]]], Response]
+
+
+def _probe(check: Callable[[], bool]) -> Route:
+    def _route(_query) -> Response:
+        if check():
+            return HTTPStatus.OK, "text/plain", b"ok\n"
+        return HTTPStatus.SERVICE_UNAVAILABLE, "text/plain", b"unavailable\n"
+
+    return _route
+
+
+class MetricsServer:
+    """Small HTTP server for metrics and health probes.
+
+    Serves `/metrics`, `/healthz` (liveness) and `/readyz` (readiness) from a daemon thread. More routes can be
+    added with `add_route`.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        host: str = "127.0.0.1",
+        registry: Registry = REGISTRY,
+        health: Health = HEALTH,
+    ):
+        """Initializes the server with the default routes."""
+        self.host = host
+        self.port = port
+        self.routes: dict[str, Route] = {
+            "/metrics": lambda _query: (HTTPStatus.OK, CONTENT_TYPE, registry.expose().encode()),
+            "/healthz": _probe(health.is_live),
+            "/readyz": _probe(health.is_ready),
+        }
+        self._server: ThreadingHTTPServer | None = None
+
+    def add_route(self, path: str, route: Route) -> None:
+        """Serve path with route, a callable taking the parsed query string."""
+        self.routes[path] = route
+
+    def start(self) -> "MetricsServer":
+        """Start serving in a daemon thread."""
+        routes = self.routes
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                route = routes.get(url.path)
+                if route is None:
+                    status, content_type, body = HTTPStatus.NOT_FOUND, "text/plain", b"not found\n"
+                else:
+                    try:
+                        status, content_type, body = route(parse_qs(url.query))
+                    except Exception:
+                        logger.exception("Metrics route %s failed", url.path)
+                        status, content_type, body = HTTPStatus.INTERNAL_SERVER_ERROR, "text/plain", b"error\n"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="masstransit-metrics", daemon=True).start()
+        logger.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+        return self
+
+    def stop(self) -> None:
+        """Stop serving."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _with_label(key: str, name: str, value: str) -> str:
+    if key.endswith("}"):
+        return f'{key[:-1]},{name}="{value}"}}'
+    return f'{key}{{{name}="{value}"}}'
+
+
+def merge_expositions(texts: Iterable[str]) -> str:
+    """Merge expositions from several processes.
+
+    Samples of identical counter and histogram series are summed. Summing gauges would report impossible values, such
+    as a circuit breaker state, so their samples, like those of other types, are kept apart with a `process` label
+    holding the index of their exposition.
+    """
+    headers: dict[str, list[str]] = {}
+    types: dict[str, str] = {}
+    series: dict[str, dict[str, float]] = {}
+    for index, text in enumerate(texts):
+        family = ""
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    family_headers = headers.setdefault(family, [])
+                    if not any(header.startswith(f"# {parts[1]} ") for header in family_headers):
+                        family_headers.append(line)
+                    if parts[1] == "TYPE" and len(parts) == 4:
+                        types.setdefault(family, parts[3].strip())
+                    series.setdefault(family, {})
+                continue
+            key, _, value = line.rpartition(" ")
+            samples = series.setdefault(family, {})
+            if types.get(family) in ("counter", "histogram"):
+                samples[key] = samples.get(key, 0.0) + float(value)
+            else:
+                samples[_with_label(key, "process", str(index))] = float(value)
+    lines = []
+    for family, samples in series.items():
+        lines.extend(headers.get(family, []))
+        lines.extend(f"{key} {_format_value(value)}" for key, value in samples.items())
+    return "".join(f"{line}\n" for line in lines)
@@ -0,0 +1,579 @@
+"""Consumer middleware pipeline.
+
+Filters wrap the processing of every delivery in four stages:
+
+- `before_decode(context)` sees the raw delivery. Returning a `MessageAction` settles it without decoding.
+- `after_decode(context)` sees the decoded message. Returning a `MessageAction` settles it without the handler.
+- `around_handler(context, call_next)` wraps the handler and returns its result.
+- `after_result(context, action)` sees the action taken for the handler result and may replace it.
+
+Filters may also override `bind`, called for every consumer they are used by, and `close`, called once the consumer
+stops for good, to release what they acquired.
+
+A filter only overrides the hooks it needs. The pipeline is compiled once per consumer, keeping only the hooks that
+are overridden, and records the latency of each stage per queue.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Hashable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+from masstransit.inbox import InboxStore, MemoryInbox, inbox_from_url
+from masstransit.metrics import Counter, Gauge, Histogram
+from masstransit.models import Message, MessageAction
+from masstransit.utils import import_string
+
+if TYPE_CHECKING:
+    from pika.spec import Basic, BasicProperties
+
+logger = logging.getLogger(__name__)
+
+STAGE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+STAGE_SECONDS = Histogram(
+    "masstransit_consumer_stage_seconds", "Time spent per pipeline stage.", ("queue", "stage"), buckets=STAGE_BUCKETS
+)
+FILTERED = Counter(
+    "masstransit_consumer_filtered_total", "Deliveries settled by a filter.", ("queue", "filter", "action")
+)
+DEDUP_LOOKUPS = Counter(
+    "masstransit_consumer_dedup_lookups_total", "Inbox lookups by result (hit or miss).", ("queue", "result")
+)
+DEDUP_EVICTIONS = Counter(
+    "masstransit_consumer_dedup_evictions_total", "Message ids evicted from the inbox.", ("queue",)
+)
+EXPIRED = Counter(
+    "masstransit_consumer_expired_total",
+    "Expired deliveries settled without calling the handler, by where the expiration was found.",
+    ("queue", "source"),
+)
+COALESCED = Counter(
+    "masstransit_consumer_coalesced_total", "Deliveries superseded by a newer one with the same key.", ("queue",)
+)
+BREAKER_STATE = Gauge(
+    "masstransit_consumer_circuit_state", "Circuit breaker state: 0 closed, 1 open, 2 half-open.", ("queue",)
+)
+BREAKER_TRIPS = Counter("masstransit_consumer_circuit_trips_total", "Circuit breaker trips.", ("queue",))
+
+HandlerCall = Callable[["DeliveryContext"], Awaitable[Any]]
+
+
+@dataclass(slots=True)
+class DeliveryContext:
+    """State of a delivery as it moves through the pipeline."""
+
+    queue: str
+    channel: Any
+    basic_deliver: "Basic.Deliver"
+    properties: "BasicProperties"
+    body: bytes
+    message: Message | None = None
+    contract: str = "unknown"
+    received_at: float = field(default_factory=time.perf_counter)
+    items: dict[str, Any] = field(default_factory=dict)
+    span: Any = None
+    # Seconds filters held the delivery on purpose, which are left out of the handler latency.
+    waited: float = 0.0
+
+
+class Filter:
+    """Base class for consumer middleware. Override the hooks the filter needs."""
+
+    def bind(self, consumer: Any) -> None:
+        """Called once when the pipeline of a consumer is compiled."""
+
+    def before_decode(self, context: DeliveryContext) -> MessageAction | None:
+        """Inspect a raw delivery. Return an action to settle it without decoding."""
+        return None
+
+    def after_decode(self, context: DeliveryContext) -> MessageAction | None:
+        """Inspect a decoded delivery. Return an action to settle it without calling the handler."""
+        return None
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Wrap the handler call."""
+        return await call_next(context)
+
+    def after_result(self, context: DeliveryContext, action: MessageAction) -> MessageAction:
+        """Inspect or replace the action taken for the handler result."""
+        return action
+
+    def close(self) -> None:  # noqa: B027
+        """Called once when the consumer stops for good, not on reconnects, to release what `bind` acquired."""
+
+
+def _overrides(obj: Filter, name: str) -> bool:
+    return getattr(type(obj), name) is not getattr(Filter, name)
+
+
+def resolve_filter(spec: "Filter | str | type[Filter]") -> Filter:
+    """Resolve a filter instance, filter class or dotted path to either into a filter instance."""
+    if isinstance(spec, str):
+        spec = import_string(spec)
+    if isinstance(spec, type):
+        spec = spec()
+    if not isinstance(spec, Filter):
+        raise TypeError(f"Not a consumer filter: {spec!r}")
+    return spec
+
+
+class Pipeline:
+    """Compiled middleware pipeline of a consumer."""
+
+    def __init__(self, queue: str, filters: Sequence["Filter | str | type[Filter]"] = ()):
+        """Resolve the filters and keep the hooks they override."""
+        self.filters = tuple(resolve_filter(spec) for spec in filters)
+        self._before_decode = tuple(f.before_decode for f in self.filters if _overrides(f, "before_decode"))
+        self._after_decode = tuple(f.after_decode for f in self.filters if _overrides(f, "after_decode"))
+        self._around_handler = tuple(f.around_handler for f in self.filters if _overrides(f, "around_handler"))
+        self._after_result = tuple(f.after_result for f in reversed(self.filters) if _overrides(f, "after_result"))
+        self._queue = queue
+        self._stages = {
+            stage: STAGE_SECONDS.labels(queue, stage)
+            for stage in ("before_decode", "decode", "after_decode", "handler", "after_result")
+        }
+
+    def bind(self, consumer: Any) -> None:
+        """Bind every filter to the consumer."""
+        for f in self.filters:
+            f.bind(consumer)
+
+    def close(self) -> None:
+        """Close every filter, logging the filters that fail to close."""
+        for f in self.filters:
+            try:
+                f.close()
+            except Exception:
+                logger.warning("Could not close filter %s", type(f).__name__, exc_info=True)
+
+    def observe(self, stage: str, started_at: float) -> None:
+        """Record the latency of a stage that started at the given perf_counter time."""
+        self._stages[stage].observe(time.perf_counter() - started_at)
+
+    def _short_circuit(self, hooks, stage: str, context: DeliveryContext) -> MessageAction | None:
+        if not hooks:
+            return None
+        started_at = time.perf_counter()
+        try:
+            for hook in hooks:
+                action = hook(context)
+                if action is not None:
+                    FILTERED.labels(self._queue, type(hook.__self__).__name__, action.name).inc()
+                    return action
+            return None
+        finally:
+            self.observe(stage, started_at)
+
+    def before_decode(self, context: DeliveryContext) -> MessageAction | None:
+        """Run the before-decode hooks until one returns an action."""
+        return self._short_circuit(self._before_decode, "before_decode", context)
+
+    def after_decode(self, context: DeliveryContext) -> MessageAction | None:
+        """Run the after-decode hooks until one returns an action."""
+        return self._short_circuit(self._after_decode, "after_decode", context)
+
+    def compose(self, call: HandlerCall) -> HandlerCall:
+        """Wrap the handler call with the around-handler hooks, the first filter being the outermost."""
+        for around in reversed(self._around_handler):
+            call = partial(around, call_next=call)
+        return call
+
+    def after_result(self, context: DeliveryContext, action: MessageAction) -> MessageAction:
+        """Run the after-result hooks, the last filter first."""
+        if not self._after_result:
+            return action
+        started_at = time.perf_counter()
+        for hook in self._after_result:
+            action = hook(context, action)
+        self.observe("after_result", started_at)
+        return action
+
+
+class ExpirationFilter(Filter):
+    """Settle expired deliveries without calling the handler.
+
+    Before decoding, the AMQP `expiration` property is checked against the `timestamp` property. As the timestamp
+    has a resolution of one second, a delivery only counts as expired one second after its TTL, so it is never
+    dropped early. After decoding, the `expirationTime` of the envelope is checked. Acknowledging discards the
+    delivery, while rejecting it dead-letters it when the queue has a dead letter exchange.
+    """
+
+    def __init__(self, action: MessageAction = MessageAction.ACK):
+        """Initializes the filter."""
+        self.action = action
+
+    def _expired(self, context: DeliveryContext, source: str) -> MessageAction:
+        EXPIRED.labels(context.queue, source).inc()
+        logger.debug("Settling expired delivery %s with %s", context.basic_deliver.delivery_tag, self.action.name)
+        return self.action
+
+    def before_decode(self, context: DeliveryContext) -> MessageAction | None:
+        """Check the expiration and timestamp properties."""
+        expiration, timestamp = context.properties.expiration, context.properties.timestamp
+        if not isinstance(expiration, str) or not isinstance(timestamp, int):
+            return None
+        try:
+            ttl = int(expiration) / 1000
+        except ValueError:
+            return None
+        if time.time() >= timestamp + 1 + ttl:
+            return self._expired(context, "property")
+        return None
+
+    def after_decode(self, context: DeliveryContext) -> MessageAction | None:
+        """Check the expirationTime of the envelope."""
+        if context.message is not None and context.message.expirationTime and context.message.is_expired():
+            return self._expired(context, "envelope")
+        return None
+
+
+def key_selector(key: str) -> Callable[[Message], Hashable | None]:
+    """Build a key selector from `correlationId` or a dotted path into the payload, such as `item.sku`."""
+    if key == "correlationId":
+        return lambda message: message.correlationId
+    path = key.split(".")
+
+    def _select(message: Message) -> Hashable | None:
+        value: Any = message.message
+        for name in path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(name)
+        return value if isinstance(value, Hashable) else None
+
+    return _select
+
+
+class CoalescingFilter(Filter):
+    """Handle only the latest delivery per key within a window.
+
+    The first delivery for a key opens a window. Deliveries with the same key that arrive before it closes replace
+    each other. When the window closes, the latest one is handled and the ones it superseded are acknowledged
+    without calling the handler. Deliveries without a key are handled right away. Coalescing needs a prefetch count
+    large enough to hold the deliveries of a window. The wait is recorded as the `coalesce` stage and left out of the
+    handler latency.
+    """
+
+    def __init__(self, key: str | Callable[[Message], Hashable | None], window: float = 0.1):
+        """Initializes the filter.
+
+        Args:
+            key: `correlationId`, a dotted path into the payload, or a callable taking the message.
+            window: Seconds to wait for newer deliveries after the first one for a key.
+        """
+        self.key = key_selector(key) if isinstance(key, str) else key
+        self.window = window
+        self._latest: dict[Hashable, DeliveryContext] = {}
+        self._deadlines: dict[Hashable, float] = {}
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Wait for the window of the key to close and handle the delivery only if it is the latest."""
+        key = self.key(context.message) if context.message is not None else None
+        if key is None:
+            return await call_next(context)
+        loop = asyncio.get_running_loop()
+        deadline = self._deadlines.setdefault(key, loop.time() + self.window)
+        self._latest[key] = context
+        waiting_since = loop.time()
+        try:
+            await asyncio.sleep(max(deadline - waiting_since, 0.0))
+        except asyncio.CancelledError:
+            if self._latest.get(key) is context:
+                del self._latest[key], self._deadlines[key]
+            raise
+        waited = loop.time() - waiting_since
+        context.waited += waited
+        STAGE_SECONDS.labels(context.queue, "coalesce").observe(waited)
+        if self._latest.get(key) is not context:
+            COALESCED.labels(context.queue).inc()
+            return MessageAction.ACK
+        del self._latest[key], self._deadlines[key]
+        return await call_next(context)
+
+
+class TimingFilter(Filter):
+    """Log handler calls slower than a threshold, measured around the filters placed after this one."""
+
+    def __init__(self, slow_threshold: float = 1.0):
+        """Initializes the filter."""
+        self.slow_threshold = slow_threshold
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Time the wrapped call."""
+        started_at = time.perf_counter()
+        try:
+            return await call_next(context)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            if elapsed >= self.slow_threshold:
+                logger.warning(
+                    "Slow handler on %s: %.3fs for %s %s",
+                    context.queue,
+                    elapsed,
+                    context.contract,
+                    context.message.messageId if context.message else None,
+                )
+
+
+class DedupFilter(Filter):
+    """Acknowledge deliveries whose messageId was already processed, without calling the handler.
+
+    Message ids are recorded in an inbox once their handler result is acknowledged. Without an explicit store, the
+    inbox is created from `config.inbox_url` of the consumer, or kept in memory when it is not set. Concurrent
+    duplicates that are both in flight are not detected.
+
+    Blocking stores, such as the SQLite and Django inboxes, are called in a thread of the filter: duplicates are
+    looked up around the handler instead of after decoding, and ids are recorded after the delivery is settled.
+    """
+
+    def __init__(self, store: InboxStore | None = None, max_size: int = 10_000, ttl: float | None = None):
+        """Initializes the filter."""
+        self._default_store = store is None
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = MemoryInbox(max_size, ttl) if store is None else store
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: set[asyncio.Task] = set()
+
+    def bind(self, consumer: Any) -> None:
+        """Create the inbox from `config.inbox_url` of the consumer when no store was given."""
+        config = consumer._config
+        if self._default_store and config.inbox_url:
+            self.store = inbox_from_url(
+                config.inbox_url,
+                max_size=config.inbox_max_size or self.max_size,
+                ttl=config.inbox_ttl if config.inbox_ttl is not None else self.ttl,
+            )
+
+    async def _call_store(self, method: Callable, message_id: str) -> Any:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix="masstransit-inbox")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, message_id)
+
+    def _lookup(self, context: DeliveryContext, found: bool) -> MessageAction | None:
+        if found:
+            DEDUP_LOOKUPS.labels(context.queue, "hit").inc()
+            logger.debug("Skipping duplicate message %s", context.message.messageId)
+            return MessageAction.ACK
+        DEDUP_LOOKUPS.labels(context.queue, "miss").inc()
+        return None
+
+    def after_decode(self, context: DeliveryContext) -> MessageAction | None:
+        """Acknowledge duplicates, when the store does not block."""
+        if self.store.blocking or context.message is None or not context.message.messageId:
+            return None
+        return self._lookup(context, self.store.contains(context.message.messageId))
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Acknowledge duplicates without calling the handler, when the store blocks."""
+        if not self.store.blocking or context.message is None or not context.message.messageId:
+            return await call_next(context)
+        found = await self._call_store(self.store.contains, context.message.messageId)
+        if self._lookup(context, found) is not None:
+            context.items["dedup_duplicate"] = True
+            return MessageAction.ACK
+        return await call_next(context)
+
+    async def _add(self, queue: str, message_id: str) -> None:
+        try:
+            evicted = await self._call_store(self.store.add, message_id)
+        except Exception:
+            logger.warning("Could not record message %s in the inbox", message_id, exc_info=True)
+            return
+        if evicted:
+            DEDUP_EVICTIONS.labels(queue).inc(evicted)
+
+    def after_result(self, context: DeliveryContext, action: MessageAction) -> MessageAction:
+        """Record acknowledged messages as processed."""
+        if action is not MessageAction.ACK or context.message is None or not context.message.messageId:
+            return action
+        if not self.store.blocking:
+            evicted = self.store.add(context.message.messageId)
+            if evicted:
+                DEDUP_EVICTIONS.labels(context.queue).inc(evicted)
+        elif not context.items.get("dedup_duplicate"):
+            task = asyncio.get_running_loop().create_task(self._add(context.queue, context.message.messageId))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        return action
+
+    def close(self) -> None:
+        """Wait for the ids being recorded, and close the inbox created from `config.inbox_url`."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._default_store:
+            self.store.close()
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` tokens per second with bursts of up to `burst` tokens."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """Initializes a full bucket."""
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before it is available."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+
+class RateLimitFilter(Filter):
+    """Delay handler calls to at most `rate` per second, allowing bursts of `burst` calls."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """Initializes the filter."""
+        self.bucket = TokenBucket(rate, burst)
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Wait for a token before calling the handler."""
+        delay = self.bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return await call_next(context)
+
+
+class TimeoutFilter(Filter):
+    """Fail handler calls that take longer than `timeout` seconds with TimeoutError."""
+
+    def __init__(self, timeout: float):
+        """Initializes the filter."""
+        self.timeout = timeout
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Cancel the handler call after the timeout."""
+        try:
+            return await asyncio.wait_for(call_next(context), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Handler on {context.queue} timed out after {self.timeout}s") from None
+
+
+class CircuitBreakerFilter(Filter):
+    """Stop consuming while the handler keeps failing.
+
+    After `threshold` consecutive handler failures, including timeouts, the circuit opens and the consumer is
+    paused with Basic.Cancel. After `reset_timeout` seconds it becomes half-open: the consumer resumes with a prefetch
+    count of 1 and the next result decides. A success closes the circuit and restores the prefetch count, while a
+    failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+    PAUSE_REASON = "circuit_breaker"
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        """Initializes a closed circuit."""
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._consumer: Any = None
+        self._state_gauge: Any = None
+        self._timer: asyncio.TimerHandle | None = None
+
+    def bind(self, consumer: Any) -> None:
+        """Control the consumer, starting from a closed circuit."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.state = self.CLOSED
+        self.failures = 0
+        self._consumer = consumer
+        self._state_gauge = BREAKER_STATE.labels(consumer._queue)
+        self._state_gauge.set(self.state)
+
+    def _set_state(self, state: int) -> None:
+        self.state = state
+        if self._state_gauge is not None:
+            self._state_gauge.set(state)
+
+    def _trip(self) -> None:
+        logger.warning("Circuit breaker opened after %d failures, pausing for %ss", self.failures, self.reset_timeout)
+        BREAKER_TRIPS.labels(self._consumer._queue).inc()
+        self._set_state(self.OPEN)
+        self._consumer.pause_consuming(self.PAUSE_REASON)
+        self._timer = asyncio.get_running_loop().call_later(self.reset_timeout, self._half_open)
+
+    def _half_open(self) -> None:
+        logger.info("Circuit breaker half-open, probing with a prefetch count of 1")
+        self._timer = None
+        self._set_state(self.HALF_OPEN)
+        self._consumer.set_prefetch_count(1)
+        self._consumer.resume_consuming(self.PAUSE_REASON)
+
+    def _close(self) -> None:
+        logger.info("Circuit breaker closed")
+        self._set_state(self.CLOSED)
+        self._consumer.set_prefetch_count()
+
+    def on_success(self) -> None:
+        """Record a successful handler call."""
+        self.failures = 0
+        if self.state == self.HALF_OPEN:
+            self._close()
+
+    def on_failure(self) -> None:
+        """Record a failed handler call."""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+            self._trip()
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Watch the outcome of the handler call."""
+        try:
+            result = await call_next(context)
+        except Exception:
+            self.on_failure()
+            raise
+        self.on_success()
+        return result
+
+
+class ExceptionMappingFilter(Filter):
+    """Turn handler exceptions into message actions.
+
+    The mapping keys are exception classes or dotted paths to them. The most specific match wins. Exceptions that
+    match no entry use the default action, or propagate when there is none.
+    """
+
+    def __init__(
+        self,
+        mapping: dict[type[BaseException] | str, MessageAction] | None = None,
+        default: MessageAction | None = MessageAction.REJECT,
+    ):
+        """Initializes the filter."""
+        self.mapping = {
+            import_string(exc) if isinstance(exc, str) else exc: MessageAction(action)
+            for exc, action in (mapping or {}).items()
+        }
+        self.default = default
+
+    def action_for(self, exc: BaseException) -> MessageAction | None:
+        """Return the action mapped to an exception."""
+        for cls in type(exc).__mro__:
+            if cls in self.mapping:
+                return self.mapping[cls]
+        return self.default
+
+    async def around_handler(self, context: DeliveryContext, call_next: HandlerCall) -> Any:
+        """Catch handler exceptions and return the mapped action."""
+        try:
+            return await call_next(context)
+        except Exception as exc:
+            action = self.action_for(exc)
+            if action is None:
+                raise
+            logger.exception("Handler failed on %s, settling with %s", context.queue, action.name)
+            return action
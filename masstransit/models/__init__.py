@@ -1,7 +1,21 @@
 """MassTransit Models."""
 
-from .config import Config
+from typing import TYPE_CHECKING
+
+from .action import MessageAction
 from .contract import Contract
 from .message import Message
 
-__all__ = ["Contract", "Message", "Config"]
+if TYPE_CHECKING:
+    from .config import Config
+
+__all__ = ["Contract", "Message", "MessageAction", "Config"]
+
+
+def __getattr__(name: str):
+    """Import Config on first access, so handlers that only use messages don't load pydantic-settings and YAML."""
+    if name == "Config":
+        from .config import Config  # noqa: PLC0415
+
+        return Config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,13 @@
+"""MassTransit message action."""
+
+from enum import Enum
+
+
+class MessageAction(Enum):
+    """Actions that can be taken on messages."""
+
+    ACK = 100
+    NACK = 200
+    NACK_AND_REQUEUE = 201
+    REJECT = 400
+    REJECT_AND_REQUEUE = 401
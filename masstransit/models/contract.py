@@ -1,12 +1,18 @@
 """MassTransit contract model."""
 
 from importlib import import_module
+from typing import ClassVar
 
 from pydantic import BaseModel
 
 
 class Contract(BaseModel):
-    """Contract model."""
+    """Contract model.
+
+    Set `content_type` on a contract to publish it with a serializer other than the producer's.
+    """
+
+    content_type: ClassVar[str | None] = None
 
     @classmethod
     def messageType(cls):
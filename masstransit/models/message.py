@@ -3,13 +3,14 @@
 import os
 import platform
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Any
 from uuid import uuid4
 
-from dateutil.parser import parse
 from pydantic import BaseModel, Field
 
+from masstransit.utils import parse_datetime
+
 
 class Host(BaseModel):
     """MassTransit message host model."""
@@ -39,10 +40,32 @@ class Message(BaseModel):
     messageType: tuple[str, ...] | None = None
     message: dict | str | int | float | list = Field(default_factory=lambda: {})
     expirationTime: str | None = None
-    sentTime: str = Field(default_factory=lambda: datetime.now().isoformat())
+    sentTime: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     headers: dict[str, Any] = Field(default_factory=lambda: {})
     host: Host = Host()
 
+    @property
+    def sent_at(self) -> datetime:
+        """Timezone-aware sentTime. Naive timestamps are taken as local time."""
+        return parse_datetime(self.sentTime)
+
+    @property
+    def expires_at(self) -> datetime | None:
+        """Timezone-aware expirationTime, if any.
+
+        Raises:
+          ValueError: if expirationTime is not a valid timestamp
+        """
+        return parse_datetime(self.expirationTime) if self.expirationTime else None
+
+    def is_expired(self, now: datetime | None = None) -> bool:
+        """Whether expirationTime is set and has passed. Invalid expiration times never expire."""
+        try:
+            expires_at = self.expires_at
+        except ValueError:
+            return False
+        return expires_at is not None and (now or datetime.now(timezone.utc)) >= expires_at
+
     @property
     def lag(self) -> timedelta:
         """Event lag.
@@ -51,7 +74,7 @@ class Message(BaseModel):
           timedelta: between produce time and now
 
         Raises:
-          KeyError: if the `produced_at` key is not present in metadata
+          ValueError: if sentTime is not a valid timestamp
 
         """
-        return parse(self.sentTime) - datetime.now()
+        return datetime.now(timezone.utc) - self.sent_at
@@ -0,0 +1,364 @@
+"""Handling deliveries in worker processes through a shared memory ring buffer.
+
+For CPU-bound handlers of large payloads, submitting decoded messages to a process pool pickles and copies every
+payload, which can cost more than the handler. Instead, `SharedMemoryConsumer` writes the raw body of each delivery
+into a `multiprocessing.shared_memory` ring buffer and submits only its offset and length. A worker process decodes
+the body from the buffer, runs the callback and returns the `MessageAction`. The slot is reused once the worker is
+done, so the event loop only copies each body once, into the buffer, whatever its size.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Any
+
+from masstransit.claim_check import BlobStore, FileSystemBlobStore, check_out
+from masstransit.compression import decompress
+from masstransit.consumer import DELIVERIES, RabbitMQConsumer
+from masstransit.metrics import Counter, Gauge
+from masstransit.middleware import CoalescingFilter, DeliveryContext, ExpirationFilter, Filter
+from masstransit.models import Message, MessageAction
+from masstransit.serializers import get_serializer
+from masstransit.utils import import_string
+
+if TYPE_CHECKING:
+    from pika.spec import Basic, BasicProperties
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 64 * 1024 * 1024
+
+BUFFER_BYTES = Gauge(
+    "masstransit_consumer_shared_buffer_bytes", "Bytes of the shared memory buffer held by deliveries.", ("queue",)
+)
+BUFFER_WAITS = Counter(
+    "masstransit_consumer_shared_buffer_waits_total", "Deliveries that waited for space in the buffer.", ("queue",)
+)
+BUFFER_OVERFLOWS = Counter(
+    "masstransit_consumer_shared_buffer_overflows_total",
+    "Deliveries larger than the buffer, copied to the worker process instead.",
+    ("queue",),
+)
+
+
+class RingBuffer:
+    """Shared memory ring buffer of variable-size slots.
+
+    Slots are allocated at the head and may be released in any order. The tail only moves past released slots, so
+    a slow delivery holds back the space allocated after it. It is not thread-safe: slots are allocated and released
+    from the event loop of the consumer.
+    """
+
+    def __init__(self, size: int = DEFAULT_BUFFER_SIZE):
+        """Create the shared memory block.
+
+        Raises:
+            ValueError: If size is not positive.
+        """
+        if size < 1:
+            raise ValueError(f"Buffer size must be positive, not {size}")
+        self.size = size
+        self._memory = SharedMemory(create=True, size=size)
+        self._head = 0
+        self._tail = 0
+        # Slot start -> [end, released], in allocation order. Space skipped at the end of the buffer when a slot
+        # wraps around is kept as a released slot, so the tail moves past it.
+        self._slots: OrderedDict[int, list] = OrderedDict()
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory block, to attach to it from other processes."""
+        return self._memory.name
+
+    @property
+    def used(self) -> int:
+        """Bytes between the tail and the head, including released slots the tail has not moved past yet."""
+        if not self._slots:
+            return 0
+        return (self._head - self._tail) % self.size or self.size
+
+    def allocate(self, length: int) -> int | None:
+        """Allocate a slot of length bytes.
+
+        Returns:
+            The offset of the slot, or None when the buffer has no contiguous free space for it yet.
+
+        Raises:
+            ValueError: If length is larger than the buffer.
+        """
+        if length > self.size:
+            raise ValueError(f"Slot of {length} bytes does not fit in a buffer of {self.size} bytes")
+        # Empty slots still take a byte, so that every slot has its own start.
+        length = max(length, 1)
+        if not self._slots:
+            self._head = self._tail = 0
+        elif self._head == self._tail:
+            return None
+        if self._head >= self._tail:
+            if self._head + length <= self.size:
+                start = self._head
+            elif length <= self._tail:
+                self._slots[self._head] = [self.size, True]
+                start = 0
+            else:
+                return None
+        elif self._head + length <= self._tail:
+            start = self._head
+        else:
+            return None
+        self._slots[start] = [start + length, False]
+        self._head = (start + length) % self.size
+        return start
+
+    def write(self, data: bytes) -> int | None:
+        """Copy data into a new slot.
+
+        Returns:
+            The offset of the slot, or None when the buffer has no room for it yet.
+        """
+        start = self.allocate(len(data))
+        if start is not None:
+            self._memory.buf[start : start + len(data)] = data
+        return start
+
+    def release(self, start: int) -> None:
+        """Release the slot at start, and move the tail past the released slots at the front."""
+        self._slots[start][1] = True
+        while self._slots:
+            first, (end, released) = next(iter(self._slots.items()))
+            if not released:
+                break
+            del self._slots[first]
+            self._tail = end % self.size
+        if not self._slots:
+            self._head = self._tail = 0
+
+    def close(self) -> None:
+        """Close and remove the shared memory block."""
+        self._memory.close()
+        self._memory.unlink()
+
+
+_CALLBACK: Callable | None = None
+_BUFFER: SharedMemory | None = None
+_CLAIM_CHECK_STORE: BlobStore | None = None
+
+
+def _init_worker(callback_path: str, buffer_name: str, claim_check_dir: str | None) -> None:
+    global _CALLBACK, _BUFFER, _CLAIM_CHECK_STORE  # noqa: PLW0603
+    _CALLBACK = import_string(callback_path)
+    _BUFFER = SharedMemory(buffer_name)
+    _CLAIM_CHECK_STORE = FileSystemBlobStore(claim_check_dir) if claim_check_dir else None
+
+
+def _decode(body, properties: "BasicProperties") -> Message:
+    data = decompress(body, properties.content_encoding)
+    # Decoders take bytes, so uncompressed bodies are copied out of the buffer, within the worker process.
+    message = get_serializer(properties.content_type, fallback=True).loads(
+        data if isinstance(data, bytes) else bytes(data)
+    )
+    if _CLAIM_CHECK_STORE is not None:
+        message = check_out(message, _CLAIM_CHECK_STORE)
+    return message
+
+
+def handle_delivery(
+    offset: int,
+    length: int,
+    basic_deliver: "Basic.Deliver",
+    properties: "BasicProperties",
+    expired_action: MessageAction | None = None,
+    body: bytes | None = None,
+) -> MessageAction:
+    """Decode a delivery from the shared buffer and call the callback, in a worker process.
+
+    Args:
+        offset: Offset of the body in the buffer.
+        length: Length of the body.
+        expired_action: Action for messages whose expirationTime has passed. None handles them anyway.
+        body: Body of a delivery that did not fit in the buffer, used instead of it.
+
+    Returns:
+        The action for the callback result, ACK when it is not a `MessageAction`.
+    """
+    if body is not None:
+        message = _decode(body, properties)
+    else:
+        with _BUFFER.buf[offset : offset + length] as view:
+            message = _decode(view, properties)
+    if expired_action is not None and message.expirationTime and message.is_expired():
+        return expired_action
+    result = _CALLBACK(message=message, basic_deliver=basic_deliver, properties=properties, channel=None)
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    try:
+        return MessageAction(result)
+    except (TypeError, ValueError):
+        return MessageAction.ACK
+
+
+class HandlerProcessPool:
+    """Worker processes running a callback on deliveries written to a shared memory ring buffer.
+
+    The pool outlives the consumers created on reconnects, and must be closed when consuming ends.
+    """
+
+    def __init__(
+        self,
+        callback_path: str,
+        processes: int | None = None,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        claim_check_dir: str | None = None,
+    ):
+        """Create the buffer and start the worker processes.
+
+        Args:
+            callback_path: Dotted path to the callback, imported in every worker process. It is called with the
+                message, basic_deliver and properties of each delivery, without channel. Coroutine functions are
+                run to completion in the worker.
+            processes: Number of worker processes. Defaults to the number of CPUs.
+            buffer_size: Size of the ring buffer, in bytes. Deliveries wait for space when it is full, and bodies
+                larger than the buffer are copied to the worker instead.
+            claim_check_dir: Directory workers fetch claim-checked payloads from.
+        """
+        self.buffer = RingBuffer(buffer_size)
+        self._callback_path = callback_path
+        self._processes = processes
+        self._claim_check_dir = claim_check_dir
+        self._space = asyncio.Event()
+        self._executor = self._start()
+
+    def _start(self) -> concurrent.futures.ProcessPoolExecutor:
+        # Spawned workers don't inherit the connection and event loop of the consumer.
+        return concurrent.futures.ProcessPoolExecutor(
+            self._processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._callback_path, self.buffer.name, self._claim_check_dir),
+        )
+
+    def _worker_done(self, loop: asyncio.AbstractEventLoop, offset: int, queue: str, _future) -> None:
+        # Called from the thread of the executor. Slots are only released from the event loop.
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._release, offset, queue)
+
+    def _release(self, offset: int, queue: str) -> None:
+        self.buffer.release(offset)
+        BUFFER_BYTES.labels(queue).set(self.buffer.used)
+        self._space.set()
+
+    async def handle(
+        self,
+        queue: str,
+        basic_deliver: "Basic.Deliver",
+        properties: "BasicProperties",
+        body: bytes,
+        expired_action: MessageAction | None = None,
+    ) -> MessageAction:
+        """Write body to the buffer, waiting for space if needed, and handle it in a worker process.
+
+        The slot is released when the worker is done with it, even if the caller is cancelled before.
+
+        Raises:
+            BrokenProcessPool: If a worker process died. The pool is restarted.
+        """
+        if len(body) > self.buffer.size:
+            BUFFER_OVERFLOWS.labels(queue).inc()
+            executor = self._executor
+            future = executor.submit(handle_delivery, 0, 0, basic_deliver, properties, expired_action, body)
+        else:
+            offset = self.buffer.write(body)
+            if offset is None:
+                BUFFER_WAITS.labels(queue).inc()
+            while offset is None:
+                self._space.clear()
+                await self._space.wait()
+                offset = self.buffer.write(body)
+            BUFFER_BYTES.labels(queue).set(self.buffer.used)
+            executor = self._executor
+            future = executor.submit(handle_delivery, offset, len(body), basic_deliver, properties, expired_action)
+            future.add_done_callback(partial(self._worker_done, asyncio.get_running_loop(), offset, queue))
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            if self._executor is executor:
+                logger.error("A worker process of %s died, restarting the worker processes", queue)
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._start()
+            raise
+
+    def close(self) -> None:
+        """Stop the worker processes and remove the buffer."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.buffer.close()
+
+    def __enter__(self) -> "HandlerProcessPool":
+        """Use the pool as a context manager."""
+        return self
+
+    def __exit__(self, *_exc_info) -> None:
+        """Close the pool."""
+        self.close()
+
+
+class SharedMemoryConsumer(RabbitMQConsumer):
+    """Consumer that hands deliveries to the worker processes of a `HandlerProcessPool` without decoding them.
+
+    Filters run on the event loop around the submission to the worker, so they don't see the decoded message: the
+    `after_decode` hooks of filters, other than the expiration check done by the worker, and coalescing are not
+    supported. Neither are tracing spans, as the message is only decoded in the worker.
+    """
+
+    def __init__(self, *args, pool: HandlerProcessPool, **kwargs):
+        """Initializes the consumer.
+
+        Args:
+            pool: Worker processes to handle deliveries, shared across reconnects.
+
+        Raises:
+            ValueError: If a filter needs the decoded message.
+        """
+        super().__init__(*args, **kwargs)
+        for f in self._pipeline.filters:
+            if isinstance(f, CoalescingFilter) or (
+                not isinstance(f, ExpirationFilter) and type(f).after_decode is not Filter.after_decode
+            ):
+                raise ValueError(f"{type(f).__name__} needs the decoded message, which only worker processes see")
+        self._process_pool = pool
+        self._expired_action = next(
+            (f.action for f in self._pipeline.filters if isinstance(f, ExpirationFilter)), None
+        )
+
+    def on_message(self, channel, basic_deliver, properties, body, message: Message | None = None):
+        """Run the before-decode filters and hand the raw body to a worker process."""
+        if message is not None:
+            body = get_serializer(properties.content_type, fallback=True).dumps(message)
+        self._track_delivery(basic_deliver.delivery_tag, len(body))
+        context = DeliveryContext(self._queue, channel, basic_deliver, properties, body)
+        action = self._pipeline.before_decode(context)
+        if action is not None:
+            self._settle(basic_deliver.delivery_tag, action, context.contract)
+            return
+        DELIVERIES.labels(self._queue, context.contract).inc()
+        task = asyncio.get_running_loop().create_task(self._handle(context))
+        task.add_done_callback(
+            partial(
+                self._task_done_callback,
+                basic_deliver=basic_deliver,
+                contract=context.contract,
+                started_at=time.perf_counter(),
+                context=context,
+            )
+        )
+
+    async def _call_handler(self, context: DeliveryContext) -> Any:
+        return await self._process_pool.handle(
+            self._queue, context.basic_deliver, context.properties, context.body, self._expired_action
+        )
@@ -1,15 +1,33 @@
 """MassTransit Producers."""
 
 import logging
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
 import pika
+from pika.exceptions import NackError, UnroutableError
 from pika.exchange_type import ExchangeType
 
+from masstransit import tracing
+from masstransit.claim_check import BlobStore, FileSystemBlobStore, check_in
+from masstransit.compression import compress, get_codec
+from masstransit.metrics import Counter, Histogram
+from masstransit.middleware import key_selector
 from masstransit.models import Config, Contract, Message
+from masstransit.serializers import get_serializer
+from masstransit.sharding import shard_routing_key
+from masstransit.transport import Transport, transport_from_url
+from masstransit.utils import SAMPLED, Lazy
 
 logger = logging.getLogger(__name__)
 
+PUBLISHED = Counter("masstransit_producer_published_total", "Messages published.", ("exchange", "contract"))
+CONFIRMS = Counter("masstransit_producer_confirms_total", "Publisher confirms by result.", ("exchange", "result"))
+PUBLISH_SECONDS = Histogram(
+    "masstransit_producer_publish_seconds", "Publish latency, including the confirm when enabled.", ("exchange",)
+)
+
 
 class RabbitMQProducer:
     """RabbitMQ producer for basic publish."""
@@ -21,41 +39,133 @@ class RabbitMQProducer:
         exchange_type: ExchangeType,
         queue: str,
         durable: bool = True,
+        claim_check_store: BlobStore | None = None,
+        compression: str | None = None,
+        content_type: str | None = None,
+        confirm_delivery: bool = False,
+        ttl: float | None = None,
+        transport: Transport | None = None,
+        shard_key: str | None = None,
     ):
-        """Initializes RabbitMQProducer instance."""
+        """Initializes RabbitMQProducer instance.
+
+        Args:
+            claim_check_store: Blob store for the payloads of envelopes larger than `config.claim_check_threshold`
+                once serialized. Defaults to a file system store in `config.claim_check_dir` when it is set.
+            compression: Content encoding for bodies larger than `config.compression_threshold`, one of
+                `masstransit.compression.CODECS`. Defaults to `config.compression`.
+            content_type: Serializer content type used for this exchange, one of
+                `masstransit.serializers.SERIALIZERS`. Contracts may override it. Defaults to MassTransit JSON.
+            confirm_delivery: Enable publisher confirms, so each publish waits for the broker to confirm it.
+            ttl: Default time to live of published messages, in seconds.
+            transport: Transport to publish to. Defaults to the transport for `config.dsn`. Messages are passed by
+                reference, without claim-check, serialization or compression, on transports that support it.
+            shard_key: `correlationId` or a dotted path into the payload whose value is the default routing key, to
+                publish to a consistent hash exchange bound to the shard queues of a sharded consumer. The queue is
+                not declared then.
+        """
         self._config = config
         self._exchange = exchange
         self._exchange_type = exchange_type
         self._queue = queue
-        parameters = pika.URLParameters(self._config.dsn)
-        self.connection = pika.BlockingConnection(parameters)
-        logger.info("Connected to RabbitMQ: %s", parameters)
+        if claim_check_store is None and config.claim_check_dir:
+            claim_check_store = FileSystemBlobStore(config.claim_check_dir)
+        self._claim_check_store = claim_check_store
+        self._compression = compression or config.compression
+        if self._compression:
+            get_codec(self._compression)
+        self._serializer = get_serializer(content_type)
+        self._transport = transport or transport_from_url(*config.dsns)
+        self.connection = self._transport.connect_blocking()
         self.channel = self.connection.channel()
-        self.channel.queue_declare(queue=self._queue, durable=durable)
+        self._confirm_delivery = confirm_delivery
+        self._ttl = ttl
+        if confirm_delivery:
+            self.channel.confirm_delivery()
+        self._shard_key = key_selector(shard_key) if shard_key else None
+        if self._shard_key is None:
+            self.channel.queue_declare(queue=self._queue, durable=durable)
+        self._publish_seconds = PUBLISH_SECONDS.labels(exchange)
 
     def _get_message(self, message: Contract, message_kwargs: dict[str, Any] | None = None) -> Message:
         attributes = {
             "message": message.model_dump(),
             "messageType": message.messageType(),
+            **tracing.conversation_kwargs(),
             **(message_kwargs or {}),
         }
-        mt_message = Message.model_validate(attributes)
-        return mt_message
+        return Message.model_validate(attributes)
+
+    @staticmethod
+    def _properties(content_type: str | None, ttl: float | None = None) -> pika.BasicProperties:
+        properties = pika.BasicProperties(content_type=content_type, timestamp=int(time.time()))
+        if ttl is not None:
+            properties.expiration = str(max(int(ttl * 1000), 0))
+        return properties
+
+    def _encode(self, obj: Contract, message: Message, ttl: float | None = None) -> tuple[bytes, pika.BasicProperties]:
+        serializer = get_serializer(obj.content_type) if obj.content_type else self._serializer
+        body = serializer.dumps(message)
+        threshold = self._config.claim_check_threshold
+        if self._claim_check_store is not None and len(body) > threshold:
+            # The envelope is only serialized again when its payload is moved to the store.
+            body = serializer.dumps(check_in(message, self._claim_check_store, threshold, size=len(body)))
+        properties = self._properties(serializer.content_type, ttl)
+        if self._compression and len(body) >= self._config.compression_threshold:
+            body = compress(body, self._compression)
+            properties.content_encoding = self._compression
+        return body, properties
 
     def send_contract(
         self,
         obj: Contract,
         routing_key: str = "",
         message_kwargs: dict[str, Any] | None = None,
+        ttl: float | None = None,
     ):
-        """Publish message with contract object."""
+        """Publish message with contract object.
+
+        Messages published while a consumer handles a message join its conversation: their correlationId,
+        conversationId and initiatorId default to those of the handled message, and the trace context is
+        propagated in their headers.
+
+        Args:
+            ttl: Time to live in seconds, set as both the AMQP expiration property and the expirationTime of the
+                envelope. Defaults to the ttl of the producer.
+        """
+        ttl = ttl if ttl is not None else self._ttl
+        if ttl is not None:
+            expiration_time = (datetime.now(timezone.utc) + timedelta(seconds=ttl)).isoformat()
+            message_kwargs = {"expirationTime": expiration_time, **(message_kwargs or {})}
         message = self._get_message(obj, message_kwargs)
-        self.channel.basic_publish(
-            exchange=self._exchange,
-            routing_key=routing_key,
-            body=message.model_dump_json(),
-        )
-        logger.info("Sent message to %s | %s | %s", self._queue, routing_key, message.model_dump_json())
+        if self._shard_key is not None and not routing_key:
+            routing_key = shard_routing_key(self._shard_key(message), message.messageId)
+        with tracing.publish_span(self._exchange, routing_key, message):
+            if self._transport.by_reference:
+                body, properties = None, self._properties(None, ttl)
+            else:
+                body, properties = self._encode(obj, message, ttl)
+            started_at = time.perf_counter()
+            try:
+                if body is None:
+                    self.channel.publish_message(self._exchange, routing_key, message, properties)
+                else:
+                    self.channel.basic_publish(
+                        exchange=self._exchange,
+                        routing_key=routing_key,
+                        body=body,
+                        properties=properties,
+                    )
+            except (NackError, UnroutableError):
+                CONFIRMS.labels(self._exchange, "nack").inc()
+                raise
+        self._publish_seconds.observe(time.perf_counter() - started_at)
+        PUBLISHED.labels(self._exchange, message.messageType[0] if message.messageType else "unknown").inc()
+        if self._confirm_delivery:
+            CONFIRMS.labels(self._exchange, "ack").inc()
+        logger.info("Sent message %s to %s | %s", message.messageId, self._queue, routing_key, extra=SAMPLED)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sent message %s: %s", message.messageId, Lazy(message.model_dump_json), extra=SAMPLED)
 
     def send(
         self,
@@ -63,8 +173,9 @@ class RabbitMQProducer:
         routing_key: str = "",
         contract_class_path: str = "masstransit.models.Contract",
         message_kwargs: dict[str, Any] | None = None,
+        ttl: float | None = None,
     ):
         """Publish message with json message and contract-class-path."""
         contract = Contract.from_import_string(contract_class_path)
         obj = contract.model_validate_json(message)
-        self.send_contract(obj, routing_key, message_kwargs)
+        self.send_contract(obj, routing_key, message_kwargs, ttl=ttl)
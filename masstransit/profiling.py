@@ -0,0 +1,198 @@
+"""On-demand profiling of running consumers.
+
+`install` lets a running process be profiled by sending it SIGUSR2, or by requesting `/debug/profile?seconds=N` from
+its metrics server. A profiling session runs `cProfile` on the thread of the event loop and traces allocations with
+`tracemalloc`, while consumers record their slowest handler calls. Requests are handed to the event loop attached by
+the consumers with `call_soon_threadsafe`, so a session starts in a callback of its own rather than in the middle of
+the loop step the signal interrupted. It ends after `seconds`, or when the signal is sent again, and writes these
+files to the profile directory:
+
+- `<prefix>.prof`: cProfile statistics, for `pstats`, snakeviz or gprof2dot.
+- `<prefix>.tracemalloc`: allocation snapshot at the end of the session, for `tracemalloc.Snapshot.load`.
+- `<prefix>.malloc.txt`: the allocation sites that grew the most during the session.
+- `<prefix>.handlers.json`: the slowest handler calls, with their queue, messageType and messageId.
+
+Nothing is profiled or recorded between sessions, so consumers only check `PROFILER.active` after each handler call.
+"""
+
+import asyncio
+import cProfile
+import heapq
+import itertools
+import json
+import logging
+import os
+import signal
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from masstransit.metrics import MetricsServer, Response
+    from masstransit.models.config import Config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SIGNAL = getattr(signal, "SIGUSR2", None)
+TRACEMALLOC_FRAMES = 10
+_IGNORED_ALLOCATIONS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class Profiler:
+    """Profiling sessions of a process.
+
+    Sessions run on the thread that starts them, which must be the thread of the event loop to profile handlers.
+    """
+
+    def __init__(self, directory: str | None = None, seconds: float = 30.0, top: int = 20):
+        """Initializes the profiler.
+
+        Args:
+            directory: Directory for the session files. Defaults to the temporary directory.
+            seconds: Default session length.
+            top: Number of allocation sites and handler calls reported.
+        """
+        self.directory = directory
+        self.seconds = seconds
+        self.top = top
+        self.active = False
+        self._profile: cProfile.Profile | None = None
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._started_tracemalloc = False
+        self._stop_handle: asyncio.TimerHandle | None = None
+        self._slowest: list[tuple[float, int, dict]] = []
+        self._sequence = itertools.count()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self, seconds: float | None = None) -> bool:
+        """Start a session on the calling thread, unless one is running.
+
+        The session is stopped after `seconds` when an event loop is running on the thread.
+        """
+        if self.active:
+            return False
+        seconds = seconds or self.seconds
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._snapshot = tracemalloc.take_snapshot()
+        self._slowest = []
+        try:
+            self._stop_handle = asyncio.get_running_loop().call_later(seconds, self.stop)
+        except RuntimeError:
+            self._stop_handle = None
+        logger.warning("Profiling for %.0f seconds", seconds)
+        self.active = True
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return True
+
+    def stop(self) -> str | None:
+        """Stop the running session and write its files, returning their path prefix."""
+        if not self.active or self._profile is None or self._snapshot is None:
+            return None
+        self._profile.disable()
+        self.active = False
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_ALLOCATIONS)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        directory = Path(self.directory or tempfile.gettempdir())
+        directory.mkdir(parents=True, exist_ok=True)
+        prefix = directory / f"masstransit-{os.getpid()}-{datetime.now():%Y%m%d-%H%M%S}"
+        self._profile.dump_stats(f"{prefix}.prof")
+        snapshot.dump(f"{prefix}.tracemalloc")
+        growth = snapshot.compare_to(self._snapshot.filter_traces(_IGNORED_ALLOCATIONS), "lineno")
+        Path(f"{prefix}.malloc.txt").write_text("".join(f"{stat}\n" for stat in growth[: self.top]))
+        handlers = [call for _, _, call in sorted(self._slowest, reverse=True)]
+        Path(f"{prefix}.handlers.json").write_text(json.dumps(handlers, indent=2))
+        self._profile = self._snapshot = None
+        logger.warning("Profile written to %s.*", prefix)
+        return str(prefix)
+
+    def toggle(self, seconds: float | None = None) -> None:
+        """Stop the running session, or start one."""
+        if self.active:
+            self.stop()
+        else:
+            self.start(seconds)
+
+    def record_handler(self, queue: str, message_type: str, message_id: str | None, seconds: float) -> None:
+        """Keep a handler call if it is among the slowest of the session."""
+        call = {
+            "queue": queue,
+            "messageType": message_type,
+            "messageId": message_id,
+            "seconds": round(seconds, 6),
+            "finished_at": time.time(),
+        }
+        entry = (seconds, next(self._sequence), call)
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, entry)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Run the requested sessions on loop, the event loop of the consumers."""
+        self._loop = loop
+
+    def request(self, seconds: float | None = None) -> bool:
+        """Ask the attached loop to start a session of `seconds`, or to toggle one when no length is given.
+
+        Safe to call from other threads and from signal handlers. Returns False when no loop is attached.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        loop.call_soon_threadsafe(self.toggle if seconds is None else self.start, seconds)
+        return True
+
+    def on_signal(self, _signum=None, _frame=None) -> None:
+        """Toggle a session on the attached loop."""
+        if not self.request():
+            logger.warning("No event loop to profile")
+
+
+PROFILER = Profiler()
+
+
+def install(config: "Config | None" = None, server: "MetricsServer | None" = None, profiler: Profiler = PROFILER):
+    """Let the process be profiled on SIGUSR2 and, when a metrics server is given, on `/debug/profile?seconds=N`.
+
+    Both request a session from the event loop the consumers attach to the profiler. Does nothing on platforms without
+    SIGUSR2.
+    """
+    if config is not None:
+        profiler.directory = config.profile_dir
+        profiler.seconds = config.profile_seconds
+    if PROFILE_SIGNAL is None:
+        return
+    signal.signal(PROFILE_SIGNAL, profiler.on_signal)
+    if server is None:
+        return
+
+    def _route(query) -> "Response":
+        if profiler.active:
+            return HTTPStatus.CONFLICT, "text/plain", b"profiling already\n"
+        seconds = float(query.get("seconds", [profiler.seconds])[0])
+        if not profiler.request(seconds):
+            return HTTPStatus.SERVICE_UNAVAILABLE, "text/plain", b"no event loop to profile\n"
+        directory = profiler.directory or tempfile.gettempdir()
+        return (
+            HTTPStatus.ACCEPTED,
+            "text/plain",
+            f"profiling {os.getpid()} for {seconds:g}s into {directory}\n".encode(),
+        )
+
+    server.add_route("/debug/profile", _route)
@@ -0,0 +1,229 @@
+"""Request/response over RabbitMQ direct reply-to.
+
+Requests are published with `reply_to` set to the `amq.rabbitmq.reply-to` pseudo-queue, so no reply queue has to be
+declared. Responses are matched to the waiting request through `Message.requestId`.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, TypeVar
+from uuid import uuid4
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.channel import Channel
+
+from masstransit import tracing
+from masstransit.compression import decompress
+from masstransit.models import Config, Contract, Message
+from masstransit.serializers import get_serializer
+from masstransit.utils import address_destination
+
+logger = logging.getLogger(__name__)
+
+DIRECT_REPLY_TO = "amq.rabbitmq.reply-to"
+
+C = TypeVar("C", bound=Contract)
+
+
+def _as_exception(reason: Any) -> BaseException:
+    return reason if isinstance(reason, BaseException) else ConnectionError(reason)
+
+
+class RequestClient:
+    """Asyncio request client.
+
+    A single channel carries any number of concurrent requests. Each request waits on its own future, which is
+    resolved when the response with the same requestId arrives.
+
+    Example:
+        async with RequestClient(config, exchange="orders") as client:
+            status = await client.request(GetOrderStatus(orderId=1), response_type=OrderStatus, timeout=5)
+    """
+
+    def __init__(self, config: Config, exchange: str = "", content_type: str | None = None):
+        """Initializes the RequestClient instance."""
+        self._config = config
+        self._exchange = exchange
+        self._serializer = get_serializer(content_type)
+        self._connection: AsyncioConnection | None = None
+        self._channel: Channel | None = None
+        self._pending: dict[str, asyncio.Future[Message]] = {}
+
+    @property
+    def channel(self) -> Channel:
+        """Get the RabbitMQ channel.
+
+        Raises:
+            RuntimeError: If the client is not connected.
+        """
+        if self._channel is None:
+            raise RuntimeError("Request client is not connected")
+        return self._channel
+
+    async def connect(self) -> None:
+        """Connect to RabbitMQ and start consuming from the direct reply-to pseudo-queue."""
+        loop = asyncio.get_running_loop()
+        opened: asyncio.Future = loop.create_future()
+        self._connection = AsyncioConnection(
+            parameters=pika.URLParameters(self._config.dsns[0]),
+            on_open_callback=opened.set_result,
+            on_open_error_callback=lambda _connection, err: opened.set_exception(_as_exception(err)),
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=loop,
+        )
+        await opened
+        channel_opened: asyncio.Future = loop.create_future()
+        self._connection.channel(on_open_callback=channel_opened.set_result)
+        self._channel = await channel_opened
+        self._channel.add_on_close_callback(self._on_channel_closed)
+        consume_ok: asyncio.Future = loop.create_future()
+        # Direct reply-to requires no-ack consumption.
+        self._channel.basic_consume(DIRECT_REPLY_TO, self._on_response, auto_ack=True, callback=consume_ok.set_result)
+        await consume_ok
+        logger.debug("Request client ready on %s", self._exchange or "the default exchange")
+
+    async def close(self) -> None:
+        """Close the connection, failing any pending requests."""
+        self._fail_pending(ConnectionError("Request client closed"))
+        if self._connection is not None and not (self._connection.is_closing or self._connection.is_closed):
+            self._connection.close()
+        self._channel = None
+
+    async def __aenter__(self) -> "RequestClient":
+        """Connect on context entry."""
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *_exc_info) -> None:
+        """Close on context exit."""
+        await self.close()
+
+    async def request(
+        self,
+        obj: Contract,
+        routing_key: str = "",
+        timeout: float = 30.0,
+        response_type: type[C] | None = None,
+        message_kwargs: dict[str, Any] | None = None,
+    ) -> Message | C:
+        """Publish a request and wait for its response.
+
+        Args:
+            obj: Request contract.
+            routing_key: Routing key of the request.
+            timeout: Seconds to wait for the response. The request also expires in the broker after this time.
+            response_type: Contract to validate the response payload with. The response message is returned when
+                it is not given.
+            message_kwargs: Extra message envelope attributes.
+
+        Raises:
+            TimeoutError: If no response arrives in time.
+        """
+        request_id = uuid4().hex
+        message = Message.model_validate(
+            {
+                "message": obj.model_dump(),
+                "messageType": obj.messageType(),
+                "requestId": request_id,
+                "responseAddress": DIRECT_REPLY_TO,
+                "expirationTime": (datetime.now(timezone.utc) + timedelta(seconds=timeout)).isoformat(),
+                **tracing.conversation_kwargs(),
+                **(message_kwargs or {}),
+            }
+        )
+        future: asyncio.Future[Message] = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            with tracing.publish_span(self._exchange, routing_key, message):
+                self.channel.basic_publish(
+                    exchange=self._exchange,
+                    routing_key=routing_key,
+                    body=self._serializer.dumps(message),
+                    properties=pika.BasicProperties(
+                        content_type=self._serializer.content_type,
+                        correlation_id=request_id,
+                        reply_to=DIRECT_REPLY_TO,
+                        expiration=str(int(timeout * 1000)),
+                    ),
+                )
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response to request {request_id} after {timeout}s") from None
+        finally:
+            self._pending.pop(request_id, None)
+        if response_type is None:
+            return response
+        return response_type.model_validate(response.message)
+
+    def _on_response(self, _channel, _basic_deliver, properties, body) -> None:
+        message = get_serializer(properties.content_type, fallback=True).loads(
+            decompress(body, properties.content_encoding)
+        )
+        request_id = message.requestId or properties.correlation_id
+        future = self._pending.pop(request_id, None)
+        if future is None or future.done():
+            logger.debug("Discarding response to unknown or expired request %s", request_id)
+            return
+        future.set_result(message)
+
+    def _fail_pending(self, error: BaseException) -> None:
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _on_channel_closed(self, _channel, reason) -> None:
+        logger.warning("Request client channel closed: %s", reason)
+        self._channel = None
+        self._fail_pending(_as_exception(reason))
+
+    def _on_connection_closed(self, _connection, reason) -> None:
+        self._channel = None
+        self._fail_pending(_as_exception(reason))
+
+
+def respond(
+    message: Message,
+    response: Contract,
+    channel: Channel,
+    properties: pika.BasicProperties | None = None,
+    message_kwargs: dict[str, Any] | None = None,
+) -> None:
+    """Reply to a request from within a consumer callback.
+
+    The response goes to the `reply_to` queue of the request, or else to its `responseAddress`, which is published to
+    an exchange for `rabbitmq://` and `exchange:` addresses and sent to the queue for `queue:` addresses.
+
+    Example:
+        async def callback(message, channel, properties, **kwargs):
+            respond(message, OrderStatus(status="shipped"), channel, properties)
+
+    Raises:
+        ValueError: If the message was not sent as a request.
+    """
+    reply_to = properties.reply_to if properties is not None else None
+    address = reply_to or message.responseAddress
+    if not address or not message.requestId:
+        raise ValueError(f"Message {message.messageId} is not a request")
+    response_message = Message.model_validate(
+        {
+            "message": response.model_dump(),
+            "messageType": response.messageType(),
+            "requestId": message.requestId,
+            "correlationId": message.correlationId,
+            "conversationId": message.conversationId,
+            "initiatorId": message.messageId,
+            **(message_kwargs or {}),
+        }
+    )
+    tracing.inject(response_message.headers)
+    serializer = get_serializer(properties.content_type if properties is not None else None, fallback=True)
+    exchange, routing_key = ("", reply_to) if reply_to else address_destination(address)
+    channel.basic_publish(
+        exchange=exchange,
+        routing_key=routing_key,
+        body=serializer.dumps(response_message),
+        properties=pika.BasicProperties(content_type=serializer.content_type, correlation_id=message.requestId),
+    )
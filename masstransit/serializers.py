@@ -0,0 +1,107 @@
+"""Message serializers negotiated through the AMQP content-type property.
+
+JSON with the MassTransit envelope is the default. MessagePack is registered when msgpack is installed and is meant
+for Python-to-Python topics that don't need .NET MassTransit interop. Deliveries with a content type that is not
+registered, such as `text/plain` or `application/octet-stream`, are decoded as MassTransit JSON.
+"""
+
+import abc
+import logging
+
+from masstransit.models import Message
+
+try:
+    import msgpack  # type: ignore[import-not-found]
+except ImportError:
+    msgpack = None
+
+MASSTRANSIT_JSON = "application/vnd.masstransit+json"
+MSGPACK = "application/x-msgpack"
+
+logger = logging.getLogger(__name__)
+
+
+class Serializer(abc.ABC):
+    """Envelope serializer for a content type."""
+
+    content_type: str
+
+    @abc.abstractmethod
+    def dumps(self, message: Message) -> bytes:
+        """Serialize a message envelope."""
+
+    @abc.abstractmethod
+    def loads(self, body: bytes) -> Message:
+        """Deserialize a message envelope."""
+
+
+class JsonSerializer(Serializer):
+    """MassTransit JSON envelope serializer."""
+
+    content_type = MASSTRANSIT_JSON
+
+    def dumps(self, message: Message) -> bytes:
+        """Serialize a message envelope to JSON."""
+        return message.__pydantic_serializer__.to_json(message)
+
+    def loads(self, body: bytes) -> Message:
+        """Deserialize a JSON message envelope."""
+        return Message.model_validate_json(body)
+
+
+class MessagePackSerializer(Serializer):
+    """MessagePack envelope serializer."""
+
+    content_type = MSGPACK
+
+    def dumps(self, message: Message) -> bytes:
+        """Serialize a message envelope to MessagePack."""
+        return msgpack.packb(message.model_dump())
+
+    def loads(self, body: bytes) -> Message:
+        """Deserialize a MessagePack message envelope."""
+        return Message.model_validate(msgpack.unpackb(body))
+
+
+SERIALIZERS: dict[str, Serializer] = {}
+
+
+def register_serializer(serializer: Serializer, *content_types: str) -> None:
+    """Register a serializer for its content type and any additional aliases."""
+    for content_type in (serializer.content_type, *content_types):
+        SERIALIZERS[content_type] = serializer
+
+
+_UNKNOWN_CONTENT_TYPES: set[str] = set()
+
+
+def get_serializer(content_type: str | None = None, fallback: bool = False) -> Serializer:
+    """Return the serializer for a content type. Messages without content type use MassTransit JSON.
+
+    Parameters such as `; charset=utf-8` and the case of the content type are ignored.
+
+    Args:
+        fallback: Use MassTransit JSON for content types that are not registered, with a warning the first time each
+            of them is seen, as for the content type of a delivery.
+
+    Raises:
+        ValueError: If the content type is not supported, without fallback.
+    """
+    if not content_type:
+        return SERIALIZERS[MASSTRANSIT_JSON]
+    serializer = SERIALIZERS.get(content_type)
+    if serializer is None:
+        serializer = SERIALIZERS.get(content_type.partition(";")[0].strip().lower())
+    if serializer is not None:
+        return serializer
+    if not fallback:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    if content_type not in _UNKNOWN_CONTENT_TYPES:
+        _UNKNOWN_CONTENT_TYPES.add(content_type)
+        logger.warning("Unknown content type %r, decoding deliveries with it as MassTransit JSON", content_type)
+    return SERIALIZERS[MASSTRANSIT_JSON]
+
+
+register_serializer(JsonSerializer(), "application/json")
+if msgpack is not None:
+    register_serializer(MessagePackSerializer(), "application/msgpack")
@@ -0,0 +1,67 @@
+"""Consistent-hash sharding of a queue across consumer processes.
+
+A sharded consumer is expanded into `shards` queues, `<queue>-shard-<n>`, bound to an `x-consistent-hash` exchange of
+the RabbitMQ consistent hash exchange plugin with a weight of `SHARD_WEIGHT`. Producers publish with a routing key
+taken from a contract field or the correlationId, so all messages of an entity go to the same shard. Each shard queue
+has a single active consumer, so its messages are handled in order while standby consumers wait to take over.
+
+`HashRing` routes like the plugin for the in-memory transport: consistently, in proportion to the binding weights, but
+not to the same shard as RabbitMQ would.
+"""
+
+import bisect
+import hashlib
+from collections.abc import Hashable, Iterable
+
+CONSISTENT_HASH_EXCHANGE = "x-consistent-hash"
+# Binding weight of each shard queue, as the number of points on the hash ring of the exchange.
+SHARD_WEIGHT = 20
+MAX_ROUTING_KEY_BYTES = 255
+
+
+def shard_queues(queue: str, shards: int) -> list[str]:
+    """Names of the shard queues of a sharded queue."""
+    return [f"{queue}-shard-{n:02}" for n in range(1, shards + 1)]
+
+
+def shard_routing_key(key: Hashable | None, message_id: str) -> str:
+    """Routing key for a shard key. Messages without a key are spread by their messageId.
+
+    Keys longer than an AMQP routing key allows are replaced by their digest.
+    """
+    routing_key = message_id if key is None else str(key)
+    if len(routing_key.encode()) > MAX_ROUTING_KEY_BYTES:
+        routing_key = hashlib.sha256(routing_key.encode()).hexdigest()
+    return routing_key
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring of queues, each at as many points as its binding weight."""
+
+    def __init__(self, bindings: Iterable[tuple[str, str]]):
+        """Build the ring from (queue, binding key) pairs, where the binding key is the weight of the queue.
+
+        Raises:
+            ValueError: If a binding key is not a positive integer.
+        """
+        points = []
+        for queue, weight in bindings:
+            if not str(weight).isdigit() or int(weight) < 1:
+                raise ValueError(
+                    f"Binding key of {queue} to a consistent hash exchange must be a weight, not {weight!r}"
+                )
+            points.extend((_hash(f"{queue}:{point}"), queue) for point in range(int(weight)))
+        points.sort()
+        self._hashes = [point for point, _ in points]
+        self._queues = [queue for _, queue in points]
+
+    def route(self, routing_key: str) -> str | None:
+        """Queue of the first point of the ring at or after the hash of routing_key, if any queue is bound."""
+        if not self._queues:
+            return None
+        index = bisect.bisect_left(self._hashes, _hash(routing_key))
+        return self._queues[index % len(self._queues)]
@@ -0,0 +1,216 @@
+"""Live depth and throughput of the queues of configured workers.
+
+Queue depths and consumer counts come from passive `queue_declare` calls, which don't need the management plugin.
+The depth only gives the net rate, ingress minus drain. When a worker serves metrics, its settled deliveries give the
+drain rate, and the ingress rate is derived from both.
+"""
+
+import logging
+import re
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+
+from pika.exceptions import ChannelClosedByBroker
+
+from masstransit.models.config import Config
+from masstransit.transport import transport_from_url
+
+logger = logging.getLogger(__name__)
+
+SETTLED_SERIES = re.compile(r'^masstransit_consumer_settled_total\{(?:[^}]*,)?queue="((?:[^"\\]|\\.)*)"[^}]*\} (\S+)$')
+
+
+@dataclass(slots=True)
+class QueueStats:
+    """Depth and rates of a queue, in messages and messages per second."""
+
+    worker: str
+    queue: str
+    messages: int | None
+    consumers: int | None
+    ingress_rate: float | None = None
+    drain_rate: float | None = None
+    net_rate: float | None = None
+    time_to_drain: float | None = None
+
+    def as_dict(self) -> dict:
+        """Stats as JSON-serializable values."""
+        return asdict(self)
+
+
+def configured_queues(config: Config, worker: str | None = None) -> list[tuple[str, str]]:
+    """Worker name and queue of every configured consumer, or shard of a sharded consumer, without duplicates.
+
+    Raises:
+        ValueError: If worker is given and not configured.
+    """
+    workers = config.workers
+    if worker is not None:
+        worker_config = config.get_worker_config(worker)
+        if not worker_config:
+            raise ValueError(f"Worker '{worker}' not found in config")
+        workers = [worker_config]
+    return list(dict.fromkeys((w.name, consumer.queue) for w in workers for consumer in w.expanded_consumers()))
+
+
+def settled_by_queue(exposition: str) -> dict[str, float]:
+    """Total settled deliveries per queue in a metrics exposition."""
+    settled: dict[str, float] = {}
+    for line in exposition.splitlines():
+        match = SETTLED_SERIES.match(line)
+        if match is not None:
+            queue = match.group(1).replace('\\"', '"').replace("\\\\", "\\")
+            settled[queue] = settled.get(queue, 0.0) + float(match.group(2))
+    return settled
+
+
+def _slope(points: list[tuple[float, float]]) -> float | None:
+    """Least-squares slope of (time, value) points."""
+    if len(points) < 2:
+        return None
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if variance == 0:
+        return None
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / variance
+
+
+class QueueSampler:
+    """Samples the depth of queues, keeping the last `window` samples to compute rates."""
+
+    def __init__(self, config: Config, queues: list[tuple[str, str]], metrics_url: str | None = None, window: int = 3):
+        """Initializes the sampler.
+
+        Args:
+            queues: Worker name and queue to sample.
+            metrics_url: Metrics endpoint of the workers, to measure the drain rate.
+            window: Number of samples rates are computed over.
+        """
+        self._queues = queues
+        self._metrics_url = metrics_url
+        self._samples: deque[tuple[float, dict[str, tuple[int, int] | None], dict[str, float] | None]] = deque(
+            maxlen=max(window, 2)
+        )
+        self._connection = transport_from_url(*config.dsns).connect_blocking()
+        self._channel = self._connection.channel()
+
+    def _declare(self, queue: str) -> tuple[int, int] | None:
+        try:
+            frame = self._channel.queue_declare(queue=queue, passive=True)
+        except ChannelClosedByBroker as e:
+            # The broker closes the channel when the queue doesn't exist.
+            logger.debug("Queue %s not found: %s", queue, e)
+            self._channel = self._connection.channel()
+            return None
+        return frame.method.message_count, frame.method.consumer_count
+
+    def _scrape_settled(self) -> dict[str, float] | None:
+        if self._metrics_url is None:
+            return None
+        try:
+            with urllib.request.urlopen(self._metrics_url, timeout=2.0) as response:
+                return settled_by_queue(response.read().decode())
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning("Could not scrape %s: %s", self._metrics_url, e)
+            return None
+
+    def sample(self, at: float | None = None) -> None:
+        """Sample the depth of every queue, and the settled deliveries when a metrics URL is set."""
+        depths = {queue: self._declare(queue) for queue in dict.fromkeys(queue for _, queue in self._queues)}
+        self._samples.append((time.monotonic() if at is None else at, depths, self._scrape_settled()))
+
+    def report(self) -> list[QueueStats]:
+        """Stats of every queue, from the latest sample and the rates over the window."""
+        if not self._samples:
+            return []
+        _, latest, _ = self._samples[-1]
+        report = []
+        for worker, queue in self._queues:
+            depth = latest.get(queue)
+            if depth is None:
+                report.append(QueueStats(worker, queue, None, None))
+                continue
+            stats = QueueStats(worker, queue, *depth)
+            stats.net_rate = _slope([(at, d[queue][0]) for at, d, _ in self._samples if d.get(queue) is not None])
+            scraped = [(at, settled[queue]) for at, _, settled in self._samples if settled and queue in settled]
+            if len(scraped) >= 2 and scraped[-1][0] > scraped[0][0]:
+                stats.drain_rate = max(scraped[-1][1] - scraped[0][1], 0.0) / (scraped[-1][0] - scraped[0][0])
+                if stats.net_rate is not None:
+                    stats.ingress_rate = max(stats.drain_rate + stats.net_rate, 0.0)
+            if stats.messages == 0:
+                stats.time_to_drain = 0.0
+            elif stats.net_rate is not None and stats.net_rate < 0:
+                stats.time_to_drain = stats.messages / -stats.net_rate
+            report.append(stats)
+        return report
+
+    def close(self) -> None:
+        """Close the broker connection."""
+        self._connection.close()
+
+
+def reports(
+    sampler: QueueSampler, interval: float = 5.0, samples: int = 3, follow: bool = False
+) -> Iterator[list[QueueStats]]:
+    """Sample `samples` times, `interval` seconds apart, and yield the stats.
+
+    With follow, keep sampling every `interval` seconds and yield the stats after each sample.
+    """
+    sampler.sample()
+    for _ in range(samples - 1):
+        time.sleep(interval)
+        sampler.sample()
+    yield sampler.report()
+    while follow:
+        time.sleep(interval)
+        sampler.sample()
+        yield sampler.report()
+
+
+def _format_rate(rate: float | None) -> str:
+    return "-" if rate is None else f"{rate:.1f}"
+
+
+def format_duration(seconds: float | None) -> str:
+    """Short duration such as 1h02m or 45s, or "never" when None."""
+    if seconds is None:
+        return "never"
+    seconds = round(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02}m"
+    if minutes:
+        return f"{minutes}m{seconds:02}s"
+    return f"{seconds}s"
+
+
+def format_table(report: list[QueueStats]) -> str:
+    """Stats as an aligned table, with rates in messages per second."""
+    header = ("WORKER", "QUEUE", "MESSAGES", "CONSUMERS", "INGRESS/S", "DRAIN/S", "NET/S", "TIME TO DRAIN")
+    rows = [header]
+    for stats in report:
+        if stats.messages is None:
+            rows.append((stats.worker, stats.queue, "not found", "-", "-", "-", "-", "-"))
+            continue
+        rows.append(
+            (
+                stats.worker,
+                stats.queue,
+                str(stats.messages),
+                str(stats.consumers),
+                _format_rate(stats.ingress_rate),
+                _format_rate(stats.drain_rate),
+                _format_rate(stats.net_rate),
+                format_duration(stats.time_to_drain),
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths, strict=True)).rstrip() for row in rows
+    )
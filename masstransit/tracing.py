@@ -0,0 +1,170 @@
+"""Trace context and conversation propagation through `Message.headers`.
+
+When the OpenTelemetry API is installed, producers open a publish span and inject its W3C trace context
+(`traceparent` and `tracestate`) into the headers of the envelope. Consumers extract it, open a receive span that lasts
+until the delivery is settled, and a handle span around the handler. Spans are recorded by the tracer provider the
+application configures, so they cost little when none is.
+
+Without OpenTelemetry, no spans are created and the trace context of a delivery is passed unchanged to the messages
+published while handling it.
+
+In both cases, messages published from a handler take their `correlationId`, `conversationId` and `initiatorId`
+from the message being handled, unless they are set explicitly.
+"""
+
+import contextlib
+import time
+from collections.abc import Iterator
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+
+if TYPE_CHECKING:
+    from masstransit.models import Message, MessageAction
+
+TRACE_HEADERS = ("traceparent", "tracestate")
+MESSAGING_SYSTEM = "rabbitmq"
+
+TRACER = trace.get_tracer("masstransit") if trace is not None else None
+
+
+@dataclass(frozen=True, slots=True)
+class Conversation:
+    """Identifiers carried from a handled message into the messages published by its handler."""
+
+    correlationId: str | None
+    conversationId: str | None
+    initiatorId: str | None
+    trace_headers: dict[str, Any]
+
+    @classmethod
+    def from_message(cls, message: "Message") -> "Conversation":
+        """Conversation of the messages published while handling message."""
+        return cls(
+            correlationId=message.correlationId,
+            conversationId=message.conversationId or message.messageId,
+            initiatorId=message.messageId,
+            trace_headers={key: message.headers[key] for key in TRACE_HEADERS if key in message.headers},
+        )
+
+    def message_kwargs(self) -> dict[str, str]:
+        """Envelope attributes of the conversation that are set."""
+        attributes = {
+            "correlationId": self.correlationId,
+            "conversationId": self.conversationId,
+            "initiatorId": self.initiatorId,
+        }
+        return {key: value for key, value in attributes.items() if value is not None}
+
+
+CONVERSATION: ContextVar[Conversation | None] = ContextVar("masstransit_conversation", default=None)
+
+
+def conversation_kwargs() -> dict[str, str]:
+    """Envelope attributes of the message being handled, if any."""
+    conversation = CONVERSATION.get()
+    return conversation.message_kwargs() if conversation is not None else {}
+
+
+def inject(headers: dict[str, Any]) -> None:
+    """Write the current trace context into envelope headers."""
+    if TRACER is not None:
+        propagate.inject(headers)
+        return
+    conversation = CONVERSATION.get()
+    if conversation is not None:
+        for key, value in conversation.trace_headers.items():
+            headers.setdefault(key, value)
+
+
+@contextlib.contextmanager
+def publish_span(exchange: str, routing_key: str, message: "Message") -> Iterator[None]:
+    """Span of a publish. Injects its trace context into the headers of message."""
+    if TRACER is None:
+        inject(message.headers)
+        yield
+        return
+    attributes = {
+        "messaging.system": MESSAGING_SYSTEM,
+        "messaging.operation.type": "publish",
+        "messaging.destination.name": exchange,
+        "messaging.rabbitmq.destination.routing_key": routing_key,
+        "messaging.message.id": message.messageId,
+        "messaging.message.conversation_id": message.conversationId or "",
+    }
+    with TRACER.start_as_current_span(
+        f"publish {exchange or routing_key}", kind=SpanKind.PRODUCER, attributes=attributes
+    ):
+        propagate.inject(message.headers)
+        yield
+
+
+def start_receive_span(queue: str, message: "Message", received_at_ns: int | None = None) -> Any:
+    """Start the span of a delivery, as a child of the trace context in its headers.
+
+    Returns:
+        The span, to pass to `handle` and `end_receive_span`, or None without OpenTelemetry.
+    """
+    if TRACER is None:
+        return None
+    attributes = {
+        "messaging.system": MESSAGING_SYSTEM,
+        "messaging.operation.type": "receive",
+        "messaging.destination.name": queue,
+        "messaging.message.id": message.messageId,
+        "messaging.message.conversation_id": message.conversationId or "",
+        "masstransit.message_type": message.messageType[0] if message.messageType else "unknown",
+    }
+    return TRACER.start_span(
+        f"receive {queue}",
+        context=propagate.extract(message.headers),
+        kind=SpanKind.CONSUMER,
+        attributes=attributes,
+        start_time=received_at_ns,
+    )
+
+
+def end_receive_span(span: Any, action: "MessageAction | None" = None, error: BaseException | None = None) -> None:
+    """End the span of a delivery with the action that settled it, or the error of its handler."""
+    if span is None:
+        return
+    if action is not None:
+        span.set_attribute("masstransit.action", action.name)
+    if error is not None:
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+    span.end()
+
+
+def received_at_ns() -> int | None:
+    """Start time of receive spans, or None when spans are not recorded."""
+    return time.time_ns() if TRACER is not None else None
+
+
+@contextlib.contextmanager
+def handle(queue: str, message: "Message", receive_span: Any = None) -> Iterator[None]:
+    """Scope of a handler call: messages published within it join the conversation and trace of message."""
+    token = CONVERSATION.set(Conversation.from_message(message))
+    try:
+        if TRACER is None:
+            yield
+            return
+        parent = trace.set_span_in_context(receive_span) if receive_span is not None else None
+        attributes = {
+            "messaging.system": MESSAGING_SYSTEM,
+            "messaging.operation.type": "process",
+            "messaging.destination.name": queue,
+            "messaging.message.id": message.messageId,
+        }
+        with TRACER.start_as_current_span(
+            f"process {queue}", context=parent, kind=SpanKind.INTERNAL, attributes=attributes
+        ):
+            yield
+    finally:
+        CONVERSATION.reset(token)
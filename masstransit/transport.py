@@ -0,0 +1,455 @@
+"""Transports that connect consumers and producers to a message broker.
+
+Consumers and producers talk to the channels of a transport with the pika channel API: exchange and queue
+declarations, Basic.Qos, Basic.Consume, Basic.Publish and the settlement methods. `RabbitMQTransport` opens pika
+connections. `InMemoryTransport` routes messages through an in-process bus instead, so services that publish and
+consume in the same process don't pay for a broker round-trip. Its channels pass `Message` objects by reference,
+without serializing them, and the same callbacks and `contract_callback` decorators work on both transports.
+"""
+
+import abc
+import asyncio
+import itertools
+import logging
+import threading
+from collections import deque
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.exceptions import ChannelClosedByBroker
+from pika.frame import Method
+from pika.spec import Basic, Queue
+
+from masstransit.sharding import CONSISTENT_HASH_EXCHANGE, HashRing
+
+if TYPE_CHECKING:
+    from masstransit.models import Message
+
+logger = logging.getLogger(__name__)
+
+
+def redact_url(url: str) -> str:
+    """The broker URL without credentials, for logging."""
+    parts = urlsplit(url)
+    if "@" not in parts.netloc:
+        return url
+    return parts._replace(netloc=parts.netloc.rpartition("@")[2]).geturl()
+
+
+class Transport(abc.ABC):
+    """Opens connections to a broker for consumers and producers.
+
+    Consumers get an asynchronous connection with `connect`, and producers a blocking one with `connect_blocking`.
+    Both hand out channels with the subset of the pika channel API used by `RabbitMQConsumer` and
+    `RabbitMQProducer`. Transports whose channels accept `publish_message` set `by_reference`.
+    """
+
+    by_reference: bool = False
+
+    @abc.abstractmethod
+    def connect(
+        self,
+        on_open_callback: Callable,
+        on_open_error_callback: Callable,
+        on_close_callback: Callable,
+        loop: asyncio.AbstractEventLoop,
+    ) -> Any:
+        """Open a connection running on loop, like `pika.adapters.asyncio_connection.AsyncioConnection`."""
+
+    @abc.abstractmethod
+    def connect_blocking(self) -> Any:
+        """Open a connection like `pika.BlockingConnection`."""
+
+
+class RabbitMQTransport(Transport):
+    """Transport to RabbitMQ through pika."""
+
+    def __init__(self, *dsns: str):
+        """Initializes the transport for one broker URL, or several to fail over between nodes."""
+        self.dsns = dsns
+
+    def __str__(self) -> str:
+        """The broker URLs without credentials."""
+        return ", ".join(redact_url(dsn) for dsn in self.dsns)
+
+    def connect(self, on_open_callback, on_open_error_callback, on_close_callback, loop):
+        """Open an `AsyncioConnection` to the first broker URL."""
+        parameters = pika.URLParameters(self.dsns[0])
+        logger.debug("Connecting to %s:%s", parameters.host, parameters.port)
+        return AsyncioConnection(
+            parameters=parameters,
+            on_open_callback=on_open_callback,
+            on_open_error_callback=on_open_error_callback,
+            on_close_callback=on_close_callback,
+            custom_ioloop=loop,
+        )
+
+    def connect_blocking(self):
+        """Open a `BlockingConnection`, which tries each node in turn until one accepts the connection."""
+        parameters = [pika.URLParameters(dsn) for dsn in self.dsns]
+        connection = pika.BlockingConnection(parameters)
+        logger.info("Connected to RabbitMQ: %s", parameters)
+        return connection
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """Whether routing_key matches a topic binding pattern, where `*` is one word and `#` zero or more words."""
+
+    def _matches(words: list[str], keys: list[str]) -> bool:
+        if not words:
+            return not keys
+        if words[0] == "#":
+            return any(_matches(words[1:], keys[i:]) for i in range(len(keys) + 1))
+        return bool(keys) and words[0] in ("*", keys[0]) and _matches(words[1:], keys[1:])
+
+    return _matches(pattern.split("."), routing_key.split("."))
+
+
+class InMemoryBus:
+    """Exchanges, bindings and queues shared by the in-memory transports of a process.
+
+    Exchanges route like their RabbitMQ counterparts, except that headers exchanges route to every bound queue, and
+    `x-consistent-hash` exchanges route with `masstransit.sharding.HashRing` rather than with the hash of the plugin.
+    The default exchange routes to the queue named by the routing key. Messages published to an exchange that
+    was not declared, or that no queue is bound to, are dropped as RabbitMQ drops unroutable messages.
+    """
+
+    def __init__(self):
+        """Initializes an empty bus."""
+        self.exchanges: dict[str, str] = {}
+        self.bindings: dict[str, list[tuple[str, str]]] = {}
+        self.queues: dict[str, deque] = {}
+        self.consumers: dict[str, list[InMemoryChannel]] = {}
+        self.single_active_consumer: set[str] = set()
+        self._rings: dict[str, HashRing] = {}
+        self._lock = threading.Lock()
+
+    def declare_exchange(self, exchange: str, exchange_type: str):
+        """Declare an exchange of the given type."""
+        self.exchanges.setdefault(exchange, str(getattr(exchange_type, "value", exchange_type)))
+        self.bindings.setdefault(exchange, [])
+
+    def declare_queue(self, queue: str, single_active_consumer: bool = False):
+        """Declare a queue. Only the first consumer of a queue with a single active consumer receives messages."""
+        self.queues.setdefault(queue, deque())
+        if single_active_consumer:
+            self.single_active_consumer.add(queue)
+
+    def is_active(self, queue: str, channel: "InMemoryChannel") -> bool:
+        """Whether the consumer of channel may receive the messages of queue."""
+        return queue not in self.single_active_consumer or self.consumers[queue][0] is channel
+
+    def bind(self, queue: str, exchange: str, routing_key: str | None = None):
+        """Bind a queue to an exchange."""
+        binding = (queue, routing_key or "")
+        bindings = self.bindings.setdefault(exchange, [])
+        if binding not in bindings:
+            bindings.append(binding)
+        self._rings.pop(exchange, None)
+        if self.exchanges.get(exchange) == CONSISTENT_HASH_EXCHANGE:
+            self._rings[exchange] = HashRing(bindings)
+
+    def route(self, exchange: str, routing_key: str) -> list[str]:
+        """Names of the queues a message published to exchange with routing_key is routed to."""
+        if not exchange:
+            return [routing_key] if routing_key in self.queues else []
+        exchange_type = self.exchanges.get(exchange)
+        bindings = self.bindings.get(exchange, ())
+        match exchange_type:
+            case "direct":
+                queues = [queue for queue, key in bindings if key == routing_key]
+            case "topic":
+                queues = [queue for queue, key in bindings if topic_matches(key, routing_key)]
+            case "x-consistent-hash":
+                ring = self._rings.get(exchange)
+                if ring is None:
+                    ring = self._rings[exchange] = HashRing(bindings)
+                queue = ring.route(routing_key)
+                queues = [queue] if queue is not None else []
+            case None:
+                queues = []
+            case _:
+                queues = [queue for queue, _ in bindings]
+        return list(dict.fromkeys(queues))
+
+    def publish(self, exchange: str, routing_key: str, properties, body: bytes | None, message: "Message | None"):
+        """Enqueue a body or a message to the queues it is routed to, and wake their consumers."""
+        queues = self.route(exchange, routing_key)
+        if not queues:
+            logger.debug("Dropping unroutable message to %r with routing key %r", exchange, routing_key)
+        for queue in queues:
+            with self._lock:
+                self.queues[queue].append((exchange, routing_key, properties, body, message, False))
+            for channel in tuple(self.consumers.get(queue, ())):
+                channel.wake()
+
+    def requeue(self, queue: str, delivery: tuple):
+        """Put a delivery back at the head of its queue, flagged as redelivered."""
+        exchange, routing_key, properties, body, message, _ = delivery
+        with self._lock:
+            self.queues[queue].appendleft((exchange, routing_key, properties, body, message, True))
+        for channel in tuple(self.consumers.get(queue, ())):
+            channel.wake()
+
+    def pop(self, queue: str) -> tuple | None:
+        """Take the next delivery of a queue, if any."""
+        with self._lock:
+            pending = self.queues.get(queue)
+            return pending.popleft() if pending else None
+
+
+BUS = InMemoryBus()
+
+
+class InMemoryChannel:
+    """Channel of an `InMemoryBus` with the subset of the pika channel API used by consumers and producers.
+
+    Deliveries are scheduled on the event loop of the channel, so they may be published from any thread. A
+    consumer is sent at most `prefetch_count` unacknowledged deliveries, and deliveries that are still
+    unacknowledged when the channel closes are requeued.
+    """
+
+    _consumer_tags = itertools.count(1)
+
+    def __init__(self, bus: InMemoryBus, loop: asyncio.AbstractEventLoop | None = None, channel_number: int = 1):
+        """Initializes an open channel."""
+        self.bus = bus
+        self.loop = loop
+        self.channel_number = channel_number
+        self.is_open = True
+        self.prefetch_count = 0
+        self._consumer: tuple[str, str, Callable] | None = None
+        self._unacked: dict[int, tuple[str, tuple]] = {}
+        self._delivery_tags = itertools.count(1)
+        self._scheduled = False
+        self._on_close_callbacks: list[Callable] = []
+
+    def __int__(self) -> int:
+        """The channel number, as for pika channels."""
+        return self.channel_number
+
+    def add_on_close_callback(self, callback):
+        """Call callback(channel, reason) when the channel is closed."""
+        self._on_close_callbacks.append(callback)
+
+    def add_on_cancel_callback(self, callback):
+        """In-memory consumers are only cancelled by their own channel."""
+
+    def confirm_delivery(self):
+        """Publishes to the bus are always confirmed."""
+
+    def exchange_declare(self, exchange, exchange_type="direct", durable=False, callback=None, **kwargs):
+        """Declare an exchange on the bus."""
+        self.bus.declare_exchange(exchange, exchange_type)
+        self._reply(callback)
+
+    def queue_declare(self, queue, durable=False, callback=None, passive=False, **kwargs):
+        """Declare a queue on the bus, or with passive, check that it exists.
+
+        Returns:
+            The Queue.DeclareOk frame, with the message and consumer counts of the queue.
+
+        Raises:
+            ChannelClosedByBroker: If passive and the queue doesn't exist.
+        """
+        if passive and queue not in self.bus.queues:
+            raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'")
+        arguments = kwargs.get("arguments") or {}
+        self.bus.declare_queue(queue, bool(arguments.get("x-single-active-consumer")))
+        self._reply(callback)
+        declare_ok = Queue.DeclareOk(queue, len(self.bus.queues[queue]), len(self.bus.consumers.get(queue, ())))
+        return Method(self.channel_number, declare_ok)
+
+    def queue_bind(self, queue, exchange, routing_key=None, callback=None, **kwargs):
+        """Bind a queue to an exchange on the bus."""
+        self.bus.bind(queue, exchange, routing_key)
+        self._reply(callback)
+
+    def basic_qos(self, prefetch_count=0, callback=None, **kwargs):
+        """Set the number of unacknowledged deliveries a consumer of this channel may hold."""
+        self.prefetch_count = prefetch_count
+        self._reply(callback)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        """Publish a serialized message, which consumers decode as with RabbitMQ."""
+        self.bus.publish(exchange, routing_key, properties or pika.BasicProperties(), body, None)
+
+    def publish_message(self, exchange: str, routing_key: str, message: "Message", properties=None):
+        """Publish a message by reference. Consumers receive the same object, so handlers must not modify it."""
+        self.bus.publish(exchange, routing_key, properties or pika.BasicProperties(), None, message)
+
+    def basic_consume(self, queue, on_message_callback, **kwargs) -> str:
+        """Start delivering the messages of a queue to on_message_callback."""
+        if self.loop is None:
+            raise RuntimeError("Consuming needs a channel of a connection with an event loop")
+        consumer_tag = f"ctag-memory-{next(self._consumer_tags)}"
+        self._consumer = (queue, consumer_tag, on_message_callback)
+        self.bus.consumers.setdefault(queue, []).append(self)
+        self.wake()
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag=None, callback=None):
+        """Stop delivering messages. Unacknowledged deliveries can still be settled."""
+        if self._consumer is not None:
+            queue = self._consumer[0]
+            self.bus.consumers[queue].remove(self)
+            self._consumer = None
+            # The next consumer of a queue with a single active consumer takes over.
+            for channel in tuple(self.bus.consumers[queue]):
+                channel.wake()
+        self._reply(callback)
+
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a delivery."""
+        self._unacked.pop(delivery_tag, None)
+        self.wake()
+
+    def basic_nack(self, delivery_tag, requeue=False):
+        """Negatively acknowledge a delivery, dropping it unless requeued."""
+        self._settle(delivery_tag, requeue)
+
+    def basic_reject(self, delivery_tag, requeue=False):
+        """Reject a delivery, dropping it unless requeued."""
+        self._settle(delivery_tag, requeue)
+
+    def close(self, reason: str = "Closed by client"):
+        """Close the channel, requeueing its unacknowledged deliveries."""
+        if not self.is_open:
+            return
+        self.basic_cancel()
+        self.is_open = False
+        for queue, delivery in reversed(list(self._unacked.values())):
+            self.bus.requeue(queue, delivery)
+        self._unacked.clear()
+        for callback in self._on_close_callbacks:
+            self._call_soon(callback, self, reason)
+
+    def wake(self):
+        """Schedule deliveries to the consumer of this channel."""
+        if self._consumer is None or self._scheduled or self.loop is None:
+            return
+        self._scheduled = True
+        self.loop.call_soon_threadsafe(self._deliver)
+
+    def _settle(self, delivery_tag, requeue):
+        settled = self._unacked.pop(delivery_tag, None)
+        if requeue and settled is not None:
+            self.bus.requeue(*settled)
+        self.wake()
+
+    def _deliver(self):
+        self._scheduled = False
+        while self._consumer is not None and (not self.prefetch_count or len(self._unacked) < self.prefetch_count):
+            queue, consumer_tag, on_message = self._consumer
+            if not self.bus.is_active(queue, self):
+                return
+            delivery = self.bus.pop(queue)
+            if delivery is None:
+                return
+            exchange, routing_key, properties, body, message, redelivered = delivery
+            delivery_tag = next(self._delivery_tags)
+            self._unacked[delivery_tag] = (queue, delivery)
+            basic_deliver = Basic.Deliver(consumer_tag, delivery_tag, redelivered, exchange, routing_key)
+            if message is None:
+                on_message(self, basic_deliver, properties, body)
+            else:
+                on_message(self, basic_deliver, properties, b"", message=message)
+
+    def _reply(self, callback):
+        if callback is not None:
+            self._call_soon(callback, None)
+
+    def _call_soon(self, callback, *args):
+        if self.loop is None:
+            callback(*args)
+        else:
+            self.loop.call_soon(callback, *args)
+
+
+class InMemoryConnection:
+    """Connection to an `InMemoryBus`, with the subset of the pika connection API used by consumers and producers."""
+
+    def __init__(
+        self,
+        bus: InMemoryBus,
+        loop: asyncio.AbstractEventLoop | None = None,
+        on_open_callback: Callable | None = None,
+        on_close_callback: Callable | None = None,
+    ):
+        """Open the connection, calling on_open_callback(connection) on the loop when given."""
+        self.bus = bus
+        self.ioloop = loop
+        self.is_closing = False
+        self.is_closed = False
+        self._on_close_callback = on_close_callback
+        self._channels: list[InMemoryChannel] = []
+        if on_open_callback is not None and loop is not None:
+            loop.call_soon(on_open_callback, self)
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the connection is open."""
+        return not self.is_closed
+
+    def channel(self, on_open_callback: Callable | None = None) -> InMemoryChannel:
+        """Open a channel, calling on_open_callback(channel) on the loop when given."""
+        channel = InMemoryChannel(self.bus, self.ioloop, len(self._channels) + 1)
+        self._channels.append(channel)
+        if on_open_callback is not None:
+            channel._call_soon(on_open_callback, channel)
+        return channel
+
+    def close(self, reason: str = "Closed by client"):
+        """Close the channels and the connection."""
+        if self.is_closed:
+            return
+        for channel in self._channels:
+            channel.close(reason)
+        self.is_closed = True
+        if self._on_close_callback is not None:
+            if self.ioloop is None:
+                self._on_close_callback(self, reason)
+            else:
+                self.ioloop.call_soon(self._on_close_callback, self, reason)
+
+
+class InMemoryTransport(Transport):
+    """Transport through an in-process bus, passing messages by reference.
+
+    Producers and consumers on transports of the same bus exchange messages. The default is the bus of the process.
+    """
+
+    by_reference = True
+
+    def __init__(self, bus: InMemoryBus | None = None):
+        """Initializes the transport for bus, or the bus of the process."""
+        self.bus = bus or BUS
+
+    def __str__(self) -> str:
+        """The URL of the transport."""
+        return "memory://"
+
+    def connect(self, on_open_callback, on_open_error_callback, on_close_callback, loop):
+        """Open a connection whose deliveries run on loop."""
+        return InMemoryConnection(self.bus, loop, on_open_callback, on_close_callback)
+
+    def connect_blocking(self):
+        """Open a connection for publishing."""
+        return InMemoryConnection(self.bus)
+
+
+def transport_from_url(*urls: str) -> Transport:
+    """Create the transport for broker URLs: `memory://` for the in-process bus, or `amqp://` and `amqps://` URLs.
+
+    Raises:
+        ValueError: If the URL scheme is not supported.
+    """
+    schemes = {urlsplit(url).scheme for url in urls}
+    if schemes == {"memory"}:
+        return InMemoryTransport()
+    if schemes and schemes <= {"amqp", "amqps"}:
+        return RabbitMQTransport(*urls)
+    raise ValueError(f"Unsupported broker URL: {', '.join(redact_url(url) for url in urls)}")
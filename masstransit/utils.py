@@ -1,13 +1,25 @@
 """Utils for masstransit."""
 
+import atexit
 import logging
 import logging.config
 import os
+import re
+from collections.abc import Callable
+from datetime import datetime
 from importlib import import_module
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 from typing import Any
+from urllib.parse import urlsplit
 
 logger = logging.getLogger(__name__)
 
+SAMPLED = {"sampled": True}
+"""`extra` of per-message log records, which `SampleFilter` may drop."""
+
+_listener: QueueListener | None = None
+
 
 def import_string(dotted_path: str) -> Any:
     """Import a dotted module path and return the attribute/class designated by the last name in the path.
@@ -26,6 +38,55 @@ def import_string(dotted_path: str) -> Any:
         raise ImportError(f'Module "{module_path}" does not define a "{class_name}" attribute') from e
 
 
+def address_destination(address: str) -> tuple[str, str]:
+    """Exchange and routing key to send to a MassTransit endpoint address.
+
+    As in MassTransit, an address such as `rabbitmq://host/vhost/name` or `exchange:name` names an exchange. A
+    `queue:name` address, or a bare queue name such as a `reply_to`, is sent to that queue through the default
+    exchange.
+    """
+    parts = urlsplit(address)
+    name = parts.path.rstrip("/").rsplit("/", 1)[-1]
+    if parts.scheme in ("", "queue"):
+        return "", name
+    return name, ""
+
+
+_ISO_DATETIME = re.compile(
+    r"^(?P<base>[^.Zz+]+?T\d{2}:\d{2}(?::\d{2})?)"
+    r"(?:\.(?P<fraction>\d+))?"
+    r"(?P<tz>[Zz]|[+-]\d{2}:?\d{2})?$"
+)
+
+
+def parse_datetime(value: str) -> datetime:
+    """Parse an ISO-8601 timestamp into a timezone-aware datetime.
+
+    Uses `datetime.fromisoformat` and normalizes what it rejects on older Pythons, such as the `Z` suffix and the
+    7-digit fractions produced by .NET. Anything else falls back to dateutil. Naive timestamps are taken as local time.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        match = _ISO_DATETIME.match(value)
+        if match is None:
+            from dateutil.parser import isoparse  # noqa: PLC0415
+
+            parsed = isoparse(value)
+        else:
+            fraction = match["fraction"]
+            tz = match["tz"]
+            normalized = match["base"]
+            if fraction:
+                normalized += f".{fraction[:6]:0<6}"
+            if tz:
+                normalized += "+00:00" if tz in "Zz" else f"{tz[:3]}:{tz[-2:]}"
+            parsed = datetime.fromisoformat(normalized)
+    if parsed.tzinfo is None:
+        return parsed.astimezone()
+    return parsed
+
+
 def filter_maker(level):
     """Log level X and above filter factory."""
     _level = getattr(logging, level)
@@ -36,6 +97,54 @@ def filter_maker(level):
     return filter
 
 
+class SampleFilter(logging.Filter):
+    """Passes 1 in `rate` of the records logged with `extra=SAMPLED` at each call site.
+
+    Other records, and sampled records of level WARNING and above, always pass.
+    """
+
+    def __init__(self, rate: int = 1):
+        """Initializes the filter."""
+        super().__init__()
+        self.rate = rate
+        self._counts: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Whether the record should be emitted."""
+        if self.rate <= 1 or record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        site = (record.pathname, record.lineno)
+        count = self._counts.get(site, 0)
+        self._counts[site] = count + 1
+        return count % self.rate == 0
+
+
+class Lazy:
+    """Log argument computed by calling func(*args) only when the record is formatted."""
+
+    __slots__ = ("_args", "_func")
+
+    def __init__(self, func: Callable[..., Any], *args: Any):
+        """Initializes the argument."""
+        self._func = func
+        self._args = args
+
+    def __str__(self) -> str:
+        """The result of the call."""
+        return str(self._func(*self._args))
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the handlers of the listener thread.
+
+    Records are queued as they are, so log arguments must not be modified after logging them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Queue the record unformatted."""
+        return record
+
+
 def django_setup(django_settings: str):
     """Initializes django application settings."""
     try:
@@ -47,8 +156,17 @@ def django_setup(django_settings: str):
         logger.error("Could not import django")
 
 
-def logging_setup(log_level="INFO"):
-    """Initializes logging configuration."""
+def logging_setup(log_level="INFO", sample_rate: int = 1, use_queue: bool = False) -> QueueListener | None:
+    """Initializes logging configuration.
+
+    Args:
+        sample_rate: Emit 1 in `sample_rate` of the per-message records logged with `extra=SAMPLED`.
+        use_queue: Hand records to a `QueueListener` thread that formats and writes them, so the event loop
+            doesn't block on terminal and pipe writes. The listener is returned, and stopped by `logging_shutdown`
+            at exit.
+    """
+    global _listener  # noqa: PLW0603
+    logging_shutdown()
     LOGGING = {
         "version": 1,
         "disable_existing_loggers": False,
@@ -59,14 +177,17 @@ def logging_setup(log_level="INFO"):
                 "class": "logging.Formatter",
             }
         },
-        "filters": {"warnings_and_below": {"()": f"{__name__}.filter_maker", "level": "WARNING"}},
+        "filters": {
+            "warnings_and_below": {"()": f"{__name__}.filter_maker", "level": "WARNING"},
+            "sampled": {"()": f"{__name__}.SampleFilter", "rate": sample_rate},
+        },
         "handlers": {
             "stdout": {
                 "class": "logging.StreamHandler",
                 "level": "INFO",
                 "formatter": "default",
                 "stream": "ext://sys.stdout",
-                "filters": ["warnings_and_below"],
+                "filters": ["warnings_and_below"] if use_queue else ["warnings_and_below", "sampled"],
             },
             "stderr": {
                 "class": "logging.StreamHandler",
@@ -84,3 +205,22 @@ def logging_setup(log_level="INFO"):
     }
 
     logging.config.dictConfig(LOGGING)
+    if not use_queue:
+        return None
+    queue_handler = DeferredQueueHandler(SimpleQueue())
+    # Sampled records are dropped before they are queued.
+    queue_handler.addFilter(SampleFilter(sample_rate))
+    _listener = QueueListener(queue_handler.queue, *logging.getLogger().handlers, respect_handler_level=True)
+    for name in ("", "masstransit", "pika"):
+        logging.getLogger(name).handlers = [queue_handler]
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def logging_shutdown():
+    """Stop the listener started by logging_setup, once the records it has queued are written."""
+    global _listener  # noqa: PLW0603
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
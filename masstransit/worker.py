@@ -4,10 +4,16 @@ import logging
 import subprocess as sp
 import sys
 import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http import HTTPStatus
 from typing import TYPE_CHECKING
 
+from masstransit.metrics import CONTENT_TYPE, MetricsServer, merge_expositions
+
 if TYPE_CHECKING:
-    from masstransit.models.config import Config, WorkerConfig
+    from masstransit.models.config import Config, ConsumerConfig, WorkerConfig
 
 logger = logging.getLogger(__name__)
 
@@ -16,14 +22,56 @@ def _run_command(name: str, command: list[str]) -> None:
     sp.Popen(command, stdout=sys.stdout, stderr=sys.stderr).communicate()
 
 
+# ConsumerConfig fields passed to the consume command, in order.
+CONSUMER_OPTIONS = (
+    "exchange",
+    "exchange_type",
+    "routing_key",
+    "callback_path",
+    "prefetch_count",
+    "max_inflight_bytes",
+    "expired_action",
+    "coalesce_key",
+    "coalesce_window",
+    "rate_limit",
+    "rate_limit_burst",
+    "breaker_threshold",
+    "breaker_reset_timeout",
+    "handler_timeout",
+    "error_action",
+    "publish_faults",
+    "single_active_consumer",
+    "processes",
+    "shared_buffer_size",
+)
+
+
+def _consumer_arguments(consumer: "ConsumerConfig") -> list[str]:
+    arguments = []
+    for field in CONSUMER_OPTIONS:
+        value = getattr(consumer, field)
+        if isinstance(value, bool):
+            # Flags are passed as --flag or --no-flag, only when they differ from their default.
+            if value != type(consumer).model_fields[field].default:
+                arguments.append(f"--{'' if value else 'no-'}{field.replace('_', '-')}")
+        elif value is not None:
+            arguments += [f"--{field.replace('_', '-')}", str(value)]
+    for middleware in consumer.middleware:
+        arguments += ["--middleware", middleware]
+    return arguments
+
+
 def _get_consumer_commands(
     worker: "WorkerConfig",
     log_level: str,
     django_settings: str | None,
     configure_logging: bool = True,
+    metrics_port: int | None = None,
+    log_sample_rate: int = 1,
+    log_queue: bool = False,
 ) -> dict[str, list[str]]:
     consumers = {}
-    for consumer in worker.consumers:
+    for consumer in worker.expanded_consumers():
         for n in range(1, consumer.number_of_consumers + 1):
             name = f"{worker.display()}:{consumer.display()}-{n:02}"
             command = ["python", "-u", "-m", "masstransit"]
@@ -34,33 +82,77 @@ def _get_consumer_commands(
                 command += ["--django-settings", django_settings]
             if not configure_logging:
                 command += ["--no-configure-logging"]
+            if log_sample_rate > 1:
+                command += ["--log-sample-rate", str(log_sample_rate)]
+            if log_queue:
+                command += ["--log-queue"]
+            if metrics_port is not None:
+                command += ["--metrics-port", str(metrics_port + len(consumers) + 1)]
             # COMMAND
             command += ["consume", consumer.queue]
             # ARGUMENTS
-            if consumer.exchange:
-                command += ["--exchange", consumer.exchange]
-            if consumer.exchange_type:
-                command += ["--exchange-type", consumer.exchange_type]
-            if consumer.routing_key:
-                command += ["--routing-key", consumer.routing_key]
-            if consumer.callback_path:
-                command += ["--callback-path", consumer.callback_path]
+            command += _consumer_arguments(consumer)
             consumers[name] = command
             logger.info("Adding consumer %s: %s", name, " ".join(command))
     return consumers
 
 
+def _scrape(url: str, timeout: float = 2.0) -> tuple[bool, str]:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status == HTTPStatus.OK, response.read().decode()
+    except (urllib.error.URLError, OSError) as e:
+        logger.debug("Could not scrape %s: %s", url, e)
+        return False, ""
+
+
+def _serve_metrics(port: int, host: str, child_ports: list[int]) -> MetricsServer:
+    """Serve the metrics and health of all consumer processes on the worker port, and start profiling them."""
+    child_urls = [f"http://127.0.0.1:{child_port}" for child_port in child_ports]
+
+    def _metrics(_query):
+        texts = [_scrape(f"{url}/metrics")[1] for url in child_urls]
+        return HTTPStatus.OK, CONTENT_TYPE, merge_expositions(texts).encode()
+
+    def _probe(path: str):
+        def _route(_query):
+            if all(_scrape(f"{url}{path}")[0] for url in child_urls):
+                return HTTPStatus.OK, "text/plain", b"ok\n"
+            return HTTPStatus.SERVICE_UNAVAILABLE, "text/plain", b"unavailable\n"
+
+        return _route
+
+    def _profile(query):
+        suffix = f"?{urllib.parse.urlencode(query, doseq=True)}" if query else ""
+        responses = [_scrape(f"{url}/debug/profile{suffix}")[1] for url in child_urls]
+        return HTTPStatus.ACCEPTED, "text/plain", "".join(responses).encode()
+
+    server = MetricsServer(port, host)
+    server.add_route("/metrics", _metrics)
+    server.add_route("/healthz", _probe("/healthz"))
+    server.add_route("/readyz", _probe("/readyz"))
+    server.add_route("/debug/profile", _profile)
+    return server.start()
+
+
 def start(
     config: "Config",
     name: str,
     log_level: str = "INFO",
     django_settings: str | None = None,
     configure_logging: bool = True,
+    metrics_port: int | None = None,
+    metrics_host: str = "127.0.0.1",
+    log_sample_rate: int = 1,
+    log_queue: bool = False,
 ) -> None:
     """Start the worker process.
 
     This works as a multi-process worker. Starting a worker will start all consumers in the worker.
     Each worker will consume messages from their queues in the worker's config.
+
+    When a metrics port is given, each consumer process serves its own metrics on the following ports, and the
+    worker serves their aggregate along with liveness and readiness probes covering all of them.
     """
     worker = config.get_worker_config(name)
     if not worker:
@@ -71,7 +163,12 @@ def start(
         log_level=log_level,
         django_settings=django_settings,
         configure_logging=configure_logging,
+        metrics_port=metrics_port,
+        log_sample_rate=log_sample_rate,
+        log_queue=log_queue,
     )
+    if metrics_port is not None:
+        _serve_metrics(metrics_port, metrics_host, [metrics_port + n for n in range(1, len(consumers) + 1)])
     # Create a thread for each command
     threads = []
     for _name, cmd in consumers.items():
@@ -1,14 +1,20 @@
 """Test CLI __main__ module."""
 
+import subprocess
+import sys
+
 import pytest
 
-from masstransit.__main__ import consume, main, produce
+from masstransit.__main__ import ErrorAction, ExpiredAction, consume, main, produce, record, replay, stats
+from masstransit.models import Config, MessageAction
+from masstransit.models.config import WorkerConfig
+from masstransit.stats import QueueStats
 
 
 @pytest.fixture(name="rabbitmq_producer")
 def rabbitmq_producer_fixture(mocker):
     """RabbitMQProducer mock fixture."""
-    producer = mocker.patch("masstransit.__main__.RabbitMQProducer")
+    producer = mocker.patch("masstransit.producer.RabbitMQProducer")
     producer.return_value = producer
     return producer
 
@@ -16,7 +22,7 @@ def rabbitmq_producer_fixture(mocker):
 @pytest.fixture(name="rabbitmq_consumer")
 def rabbitmq_consumer_fixture(mocker):
     """RabbitMQConsumer mock fixture."""
-    consumer = mocker.patch("masstransit.__main__.ReconnectingRabbitMQConsumer")
+    consumer = mocker.patch("masstransit.consumer.ReconnectingRabbitMQConsumer")
     consumer.return_value = consumer
     return consumer
 
@@ -41,6 +47,9 @@ def context_fixture(mocker):
 
 def test_consume(context, rabbitmq_consumer):
     """We expect consume to instantiate the consumer and run it."""
+    # setup test
+    context.obj = {"config": Config(), "metrics_port": None}
+
     # execute test
     consume(context, "getting-started", "getting-started")
 
@@ -48,6 +57,35 @@ def test_consume(context, rabbitmq_consumer):
     rabbitmq_consumer.run.assert_called_once_with()
 
 
+def test_consume_maps_actions(context, rabbitmq_consumer):
+    """We expect the action choices of consume to be mapped to message actions, and HANDLE to no expired action."""
+    context.obj = {"config": Config(), "metrics_port": None}
+
+    consume(context, "orders", expired_action=ExpiredAction.HANDLE, error_action=ErrorAction.NACK_AND_REQUEUE)
+    consume(context, "orders")
+
+    handled, default = rabbitmq_consumer.call_args_list
+    assert (handled.kwargs["expired_action"], handled.kwargs["error_action"]) == (None, MessageAction.NACK_AND_REQUEUE)
+    assert (default.kwargs["expired_action"], default.kwargs["error_action"]) == (
+        MessageAction.ACK,
+        MessageAction.REJECT,
+    )
+
+
+def test_consume_serves_metrics(mocker, context, rabbitmq_consumer):
+    """We expect consume to serve metrics when a metrics port is configured."""
+    # setup test
+    metrics_server = mocker.patch("masstransit.metrics.MetricsServer")
+    context.obj = {"config": Config(), "metrics_port": 9100, "metrics_host": "0.0.0.0"}
+
+    # execute test
+    consume(context, "getting-started", "getting-started")
+
+    # assertions
+    metrics_server.assert_called_once_with(9100, "0.0.0.0")
+    metrics_server.return_value.start.assert_called_once_with()
+
+
 def test_produce(context, rabbitmq_producer):
     """We expect produce to instantiate the producer and send the message."""
     # setup test
@@ -66,7 +104,66 @@ def test_produce(context, rabbitmq_producer):
     )
 
     # assertions
-    rabbitmq_producer.send.assert_called_once_with(message, routing_key, contract_class_path=contract_class_path)
+    rabbitmq_producer.send.assert_called_once_with(
+        message, routing_key, contract_class_path=contract_class_path, ttl=None
+    )
+
+
+def test_record(mocker, context):
+    """We expect record to record the queue with the given options."""
+    capture_record = mocker.patch("masstransit.capture.record")
+    context.obj = {"config": Config()}
+
+    record(context, "orders", "orders.seg", ack=False, limit=10)
+
+    capture_record.assert_called_once_with(
+        context.obj["config"],
+        "orders",
+        "orders.seg",
+        acknowledge=False,
+        limit=10,
+        prefetch_count=100,
+        exchange=None,
+        exchange_type="fanout",
+        routing_key=None,
+    )
+
+
+def test_replay(mocker, context):
+    """We expect replay to republish the capture, or feed it to a callback when one is given."""
+    capture_replay = mocker.patch("masstransit.capture.replay")
+    replay_to_callback = mocker.patch("masstransit.capture.replay_to_callback")
+    context.obj = {"config": Config()}
+
+    replay(context, "orders.seg", speed=0.0)
+    replay(context, "orders.seg", callback_path="examples.callbacks.simple_callback", prefetch_count=10)
+
+    capture_replay.assert_called_once_with(context.obj["config"], "orders.seg", None, None, speed=0.0, limit=None)
+    replay_to_callback.assert_called_once_with(
+        context.obj["config"],
+        "orders.seg",
+        "examples.callbacks.simple_callback",
+        speed=1.0,
+        prefetch_count=10,
+        limit=None,
+        middleware=(),
+    )
+
+
+def test_stats(mocker, context, capsys):
+    """We expect stats to sample the configured queues and print them as JSON."""
+    sampler = mocker.patch("masstransit.stats.QueueSampler")
+    sampler.return_value.report.return_value = [QueueStats("orders", "orders", 6, 1, net_rate=-2.0, time_to_drain=3.0)]
+    mocker.patch("masstransit.stats.time.sleep")
+    config = Config(workers=[WorkerConfig(name="orders", consumers=[{"queue": "orders"}])])
+    context.obj = {"config": config}
+
+    stats(context, json_output=True)
+
+    sampler.assert_called_once_with(config, [("orders", "orders")], None, window=3)
+    assert sampler.return_value.sample.call_count == 3
+    sampler.return_value.close.assert_called_once_with()
+    assert '"net_rate": -2.0' in capsys.readouterr().out
 
 
 def test_main_default(context, logging_setup, django_setup):
@@ -76,7 +173,7 @@ def test_main_default(context, logging_setup, django_setup):
 
     # assertions
     django_setup.assert_not_called()
-    logging_setup.assert_called_once_with("INFO")
+    logging_setup.assert_called_once_with("INFO", sample_rate=1, use_queue=False)
 
 
 def test_main_with_django_settings(context, logging_setup, django_setup):
@@ -86,7 +183,7 @@ def test_main_with_django_settings(context, logging_setup, django_setup):
 
     # assertions
     django_setup.assert_called_once_with("app.settings")
-    logging_setup.assert_called_once_with("ERROR")
+    logging_setup.assert_called_once_with("ERROR", sample_rate=1, use_queue=False)
 
 
 def test_main_no_configure_logging(context, logging_setup, django_setup):
@@ -97,3 +194,32 @@ def test_main_no_configure_logging(context, logging_setup, django_setup):
     # assertions
     django_setup.assert_not_called()
     logging_setup.assert_not_called()
+
+
+def test_cli_import_is_lazy():
+    """We expect importing the CLI to not import pika, the consumer, the producer or pydantic-settings."""
+    # setup test
+    heavy = ["pika", "masstransit.consumer", "masstransit.producer", "masstransit.worker", "pydantic_settings"]
+    code = f"import sys, masstransit.__main__; print(*[m for m in {heavy!r} if m in sys.modules])"
+
+    # execute test
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    # assertions
+    assert result.stdout.strip() == ""
+
+
+def test_consume_in_worker_processes(mocker, context, rabbitmq_consumer):
+    """We expect consume to hand messages to worker processes, and stop them when the consumer stops."""
+    from masstransit.process_pool import DEFAULT_BUFFER_SIZE, SharedMemoryConsumer  # noqa: PLC0415
+
+    pool_class = mocker.patch("masstransit.process_pool.HandlerProcessPool")
+    context.obj = {"config": Config(), "metrics_port": None}
+
+    consume(context, "orders", "orders", callback_path="myapp.on_order", processes=4)
+
+    pool_class.assert_called_once_with("myapp.on_order", 4, DEFAULT_BUFFER_SIZE, None)
+    assert rabbitmq_consumer.call_args.kwargs["consumer_class"] is SharedMemoryConsumer
+    assert rabbitmq_consumer.call_args.kwargs["pool"] is pool_class.return_value.__enter__.return_value
+    rabbitmq_consumer.run.assert_called_once_with()
+    pool_class.return_value.__exit__.assert_called_once()
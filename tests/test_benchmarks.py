@@ -0,0 +1,11 @@
+"""Test benchmarks.throughput."""
+
+from benchmarks import throughput
+
+
+def test_throughput_benchmark_runs_every_scenario():
+    """We expect every scenario to run through the real consumer and producer against the loopback broker."""
+    report = throughput.run(messages=20)
+
+    assert [result["scenario"] for result in report["results"]] == list(throughput.SCENARIOS)
+    assert all(result["messages"] > 0 for result in report["results"])
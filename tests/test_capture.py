@@ -0,0 +1,126 @@
+"""Test masstransit.capture."""
+
+import pika
+import pytest
+
+from masstransit.capture import (
+    MAGIC,
+    SegmentReader,
+    SegmentWriter,
+    record,
+    replay,
+    replay_to_callback,
+)
+from masstransit.models import Config, MessageAction
+from masstransit.transport import BUS, InMemoryTransport
+
+BODY = b'{"messageId": "%d", "messageType": ["urn:message:Orders:OrderSubmitted"], "message": {"orderId": %d}}'
+HANDLED = []
+
+
+async def handle_order(message, **kwargs):
+    """Replay target that fails on odd orders."""
+    order_id = message.message["orderId"]
+    if order_id % 2:
+        raise ValueError(f"Odd order {order_id}")
+    HANDLED.append(order_id)
+    return MessageAction.ACK
+
+
+def write_orders(path, count, interval=1.0):
+    """Write count order deliveries, interval seconds apart."""
+    properties = pika.BasicProperties(content_type="application/vnd.masstransit+json", headers={"tenant": b"eu"})
+    with SegmentWriter(path) as writer:
+        for i in range(count):
+            writer.append("orders", "eu", properties, BODY % (i, i), timestamp=1000.0 + i * interval)
+
+
+def test_segment_round_trip(tmp_path):
+    """We expect records to be read back in order with their properties, also after appending to a capture."""
+    path = tmp_path / "orders.seg"
+    write_orders(path, 2)
+    with SegmentWriter(path) as writer:
+        writer.append("", "orders", None, b"raw", timestamp=2000.0)
+
+    with SegmentReader(path) as reader:
+        records = list(reader)
+
+    assert path.read_bytes().startswith(MAGIC)
+    assert [record.body for record in records] == [BODY % (0, 0), BODY % (1, 1), b"raw"]
+    first = records[0]
+    assert (first.timestamp, first.exchange, first.routing_key) == (1000.0, "orders", "eu")
+    assert first.properties == {"content_type": "application/vnd.masstransit+json", "headers": {"tenant": "eu"}}
+    assert first.basic_properties().headers == {"tenant": "eu"}
+    assert records[2].properties == {}
+
+
+def test_truncated_records_are_skipped(tmp_path):
+    """We expect a record cut short by a crash to be skipped."""
+    path = tmp_path / "orders.seg"
+    write_orders(path, 2)
+    path.write_bytes(path.read_bytes()[:-5])
+
+    with SegmentReader(path) as reader:
+        assert [record.body for record in reader] == [BODY % (0, 0)]
+
+
+def test_other_files_are_refused(tmp_path):
+    """We expect files without the segment header to be refused."""
+    path = tmp_path / "orders.json"
+    path.write_bytes(b'{"orders": []}')
+
+    with pytest.raises(ValueError, match="not a segment file"):
+        SegmentReader(path)
+    with pytest.raises(ValueError, match="not a segment file"):
+        SegmentWriter(path)
+
+
+@pytest.mark.parametrize(("acknowledge", "remaining"), [(True, 1), (False, 3)])
+def test_record(tmp_path, acknowledge, remaining):
+    """We expect record to stop at the limit, and to leave the messages in the queue without acknowledging."""
+    queue = f"record-{acknowledge}"
+    BUS.declare_queue(queue)
+    channel = InMemoryTransport().connect_blocking().channel()
+    for i in range(3):
+        channel.basic_publish("", queue, BODY % (i, i))
+    path = tmp_path / "orders.seg"
+
+    count = record(Config(dsn="memory://"), queue, path, acknowledge=acknowledge, limit=2)
+
+    assert count == 2
+    with SegmentReader(path) as reader:
+        assert [record.body for record in reader] == [BODY % (0, 0), BODY % (1, 1)]
+    assert len(BUS.queues[queue]) == remaining
+
+
+def test_replay_republishes_at_the_recorded_rate(tmp_path, mocker):
+    """We expect records to be republished with their body and properties, spaced by the recorded interval / speed."""
+    path = tmp_path / "orders.seg"
+    write_orders(path, 3, interval=1.0)
+    sleep = mocker.patch("masstransit.capture.time.sleep")
+    BUS.declare_queue("replayed-orders")
+
+    count = replay(Config(dsn="memory://"), path, exchange="", routing_key="replayed-orders", speed=2.0)
+
+    assert count == 3
+    assert [call.args[0] for call in sleep.call_args_list] == [
+        pytest.approx(0.5, abs=0.1),
+        pytest.approx(1.0, abs=0.1),
+    ]
+    deliveries = list(BUS.queues.pop("replayed-orders"))
+    assert [delivery[3] for delivery in deliveries] == [BODY % (i, i) for i in range(3)]
+    assert deliveries[0][2].headers == {"tenant": "eu"}
+
+
+def test_replay_to_callback(tmp_path, mocker):
+    """We expect records to be handled by the callback, and handler failures to count as rejections."""
+    path = tmp_path / "orders.seg"
+    write_orders(path, 5)
+    HANDLED.clear()
+    import_string = mocker.patch("masstransit.capture.import_string", return_value=handle_order)
+
+    settled = replay_to_callback(Config(), path, "orders.handle_order", speed=0, prefetch_count=2, limit=4)
+
+    assert settled == {"ack": 2, "nack": 0, "reject": 2}
+    assert HANDLED == [0, 2]
+    import_string.assert_called_once_with("orders.handle_order")
@@ -0,0 +1,121 @@
+"""Test claim_check module."""
+
+import asyncio
+
+import pytest
+
+from masstransit.claim_check import (
+    CLAIM_CHECK_HEADER,
+    ClaimCheckMessage,
+    FileSystemBlobStore,
+    S3BlobStore,
+    check_in,
+    check_out,
+)
+from masstransit.models import Message
+
+
+@pytest.fixture(name="store")
+def store_fixture(tmp_path):
+    """File system blob store fixture."""
+    return FileSystemBlobStore(tmp_path)
+
+
+def test_check_in_keeps_small_payloads(store):
+    """We expect payloads under the threshold to stay in the envelope."""
+    message = Message(message={"foo": "bar"})
+
+    result = check_in(message, store, threshold=1024)
+
+    assert result is message
+    assert CLAIM_CHECK_HEADER not in result.headers
+
+
+def test_check_in_stores_large_payloads(store):
+    """We expect payloads above the threshold to be replaced by a reference header."""
+    message = Message(message={"foo": "x" * 100})
+
+    result = check_in(message, store, threshold=10)
+
+    assert result.message == {}
+    assert result.headers[CLAIM_CHECK_HEADER] == message.messageId
+    assert (store.root / message.messageId).exists()
+
+
+def test_check_in_uses_known_size(store):
+    """We expect the given serialized size to be compared with the threshold instead of serializing the payload."""
+    message = Message(message={"foo": "x" * 100})
+
+    assert check_in(message, store, threshold=10, size=5) is message
+    assert check_in(message, store, threshold=10, size=500).headers[CLAIM_CHECK_HEADER] == message.messageId
+
+
+def test_check_out_fetches_payload_lazily(store, mocker):
+    """We expect the payload to be fetched only when the handler accesses it."""
+    envelope = check_in(Message(message={"foo": "x" * 100}), store, threshold=10)
+    get = mocker.spy(store, "get")
+
+    result = check_out(Message.model_validate_json(envelope.model_dump_json()), store)
+
+    assert isinstance(result, ClaimCheckMessage)
+    assert not result.payload_loaded
+    get.assert_not_called()
+    assert result.message == {"foo": "x" * 100}
+    assert result.message == {"foo": "x" * 100}
+    get.assert_called_once_with(envelope.messageId)
+    assert result.messageId == envelope.messageId
+
+
+def test_fetch_payload_loads_in_executor(store, mocker):
+    """We expect the payload to be fetched once, away from the event loop, when the consumer asks for it."""
+    envelope = check_in(Message(message={"foo": "x" * 100}), store, threshold=10)
+    result = check_out(envelope, store)
+    get = mocker.spy(store, "get")
+
+    async def fetch():
+        await result.fetch_payload()
+        await result.fetch_payload()
+
+    asyncio.run(fetch())
+
+    assert result.payload_loaded
+    assert result.message == {"foo": "x" * 100}
+    get.assert_called_once_with(envelope.messageId)
+
+
+def test_check_out_dump_includes_payload(store):
+    """We expect dumping a claim-checked message to include the fetched payload."""
+    envelope = check_in(Message(message=["x"] * 10), store, threshold=10)
+
+    result = check_out(envelope, store)
+
+    assert result.model_dump()["message"] == ["x"] * 10
+
+
+def test_check_out_ignores_regular_messages(store):
+    """We expect messages without a reference header to be returned untouched."""
+    message = Message(message={"foo": "bar"})
+
+    assert check_out(message, store) is message
+
+
+def test_file_system_store_rejects_references_outside_root(store):
+    """We expect references escaping the store directory to be refused."""
+    with pytest.raises(ValueError, match="Invalid claim-check reference"):
+        store.get("../secrets")
+
+
+def test_s3_store_uses_client(mocker):
+    """We expect the S3 store to use the boto3-style client methods."""
+    client = mocker.Mock()
+    client.get_object.return_value = {"Body": mocker.Mock(read=mocker.Mock(return_value=b"{}"))}
+    store = S3BlobStore(client, "bucket", prefix="claims/")
+
+    reference = store.put("abc", b"{}")
+    data = store.get(reference)
+    store.delete(reference)
+
+    assert reference == "claims/abc"
+    assert data == b"{}"
+    client.put_object.assert_called_once_with(Bucket="bucket", Key="claims/abc", Body=b"{}")
+    client.delete_object.assert_called_once_with(Bucket="bucket", Key="claims/abc")
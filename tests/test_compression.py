@@ -0,0 +1,86 @@
+"""Test compression module."""
+
+import pytest
+
+from masstransit.compression import CODECS, compress, decompress
+
+CODEC_NAMES = [
+    pytest.param(name, marks=pytest.mark.skipif(name not in CODECS, reason=f"{name} is not installed"))
+    for name in ("gzip", "zstd", "lz4")
+]
+
+
+@pytest.mark.parametrize("encoding", sorted(CODECS))
+def test_round_trip(encoding):
+    """We expect every registered codec to restore the original data."""
+    data = b'{"message": "' + b"x" * 1000 + b'"}'
+
+    compressed = compress(data, encoding)
+
+    assert len(compressed) < len(data)
+    assert decompress(compressed, encoding) == data
+
+
+@pytest.mark.parametrize("encoding", [None, "", "identity"])
+def test_decompress_passes_through_identity(encoding):
+    """We expect bodies without a content encoding to be returned as is."""
+    assert decompress(b"{}", encoding) == b"{}"
+
+
+def test_unknown_encoding():
+    """We expect a value error when compressing with an unsupported encoding."""
+    with pytest.raises(ValueError, match="Unsupported content encoding: br"):
+        compress(b"{}", "br")
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "br"])
+def test_decompress_passes_through_unknown_encodings(mocker, caplog, encoding):
+    """We expect bodies with a charset or an unknown encoding to be taken as not compressed, with one warning."""
+    mocker.patch("masstransit.compression._UNKNOWN_ENCODINGS", set())
+
+    assert decompress(b"{}", encoding) == b"{}"
+    assert decompress(b"{}", encoding) == b"{}"
+
+    assert [record.getMessage() for record in caplog.records] == [
+        f"Unknown content encoding {encoding!r}, taking bodies with it as not compressed"
+    ]
+
+
+@pytest.mark.parametrize("encoding", CODEC_NAMES)
+def test_decompress_is_bounded(mocker, encoding):
+    """We expect bodies decompressing to more than the maximum size to be refused."""
+    mocker.patch("masstransit.compression.MAX_DECOMPRESSED_SIZE", 1000)
+    data = b"x" * 1001
+
+    assert decompress(compress(b"x" * 1000, encoding), encoding) == b"x" * 1000
+    with pytest.raises(ValueError, match="larger than 1000 bytes"):
+        decompress(compress(data, encoding), encoding)
+
+
+def test_gzip_decompress_is_bounded_across_members(mocker):
+    """We expect the bound to apply to the members of a gzip body together."""
+    mocker.patch("masstransit.compression.MAX_DECOMPRESSED_SIZE", 1000)
+    data = b"x" * 1001
+
+    with pytest.raises(ValueError, match="larger than 1000 bytes"):
+        decompress(compress(data[:600], "gzip") + compress(data[600:], "gzip"), "gzip")
+
+
+@pytest.mark.parametrize("encoding", CODEC_NAMES)
+def test_decompress_rejects_invalid_bodies(encoding):
+    """We expect truncated and corrupt bodies to be refused with a value error, so their delivery is settled."""
+    body = compress(b"x" * 1000, encoding)
+
+    with pytest.raises(ValueError, match=f"Truncated {encoding} body|Invalid {encoding} body"):
+        decompress(body[: len(body) // 2], encoding)
+    with pytest.raises(ValueError, match=f"Invalid {encoding} body"):
+        decompress(b"not compressed at all", encoding)
+
+
+def test_gzip_decompress_joins_members():
+    """We expect every member of a gzip body to be decompressed, and a truncated last member to be refused."""
+    body = compress(b"x" * 1000, "gzip")
+
+    assert decompress(body + body, "gzip") == b"x" * 2000
+    with pytest.raises(ValueError, match="Truncated"):
+        decompress(body + body[:-10], "gzip")
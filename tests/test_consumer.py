@@ -1,10 +1,37 @@
 """Test masstransit.consumer."""
 
+import asyncio
+import gzip
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
 import pytest
 from pika.exchange_type import ExchangeType
 
-from masstransit.consumer import RabbitMQConsumer, ReconnectingRabbitMQConsumer
-from masstransit.models import Config
+from masstransit.claim_check import check_in, check_out
+from masstransit.consumer import (
+    BROKER_WAIT_SECONDS,
+    DECODE_FAILURES,
+    HANDLER_SECONDS,
+    LAG_SECONDS,
+    SETTLED,
+    MessageAction,
+    RabbitMQConsumer,
+    ReconnectingRabbitMQConsumer,
+)
+from masstransit.middleware import (
+    CircuitBreakerFilter,
+    DedupFilter,
+    DeliveryContext,
+    ExpirationFilter,
+    Filter,
+    RateLimitFilter,
+    TimeoutFilter,
+    TimingFilter,
+)
+from masstransit.models import Config, Message
+from masstransit.serializers import MSGPACK, get_serializer
 
 
 def on_message_callback(message, basic_deliver, properties, **kwargs):
@@ -23,10 +50,19 @@ class TestRabbitMQConsumer:
 
     @pytest.fixture(name="get_running_loop")
     def get_running_loop_fixture(self, mocker):
+        """Patch the running loop of the consumer to run each handler task to completion when it is created."""
         get_running_loop = mocker.patch("masstransit.consumer.get_running_loop")
-        task = mocker.Mock()
-        task.result.return_value = None
-        get_running_loop.return_value.create_task.return_value.add_done_callback = lambda f: f(task)
+
+        def create_task(coro):
+            task = mocker.Mock()
+            try:
+                task.result.return_value = asyncio.run(coro)
+            except Exception as err:
+                task.result.side_effect = err
+            task.add_done_callback = lambda callback: callback(task)
+            return task
+
+        get_running_loop.return_value.create_task.side_effect = create_task
         return get_running_loop
 
     @pytest.fixture(name="callback", autouse=True)
@@ -49,13 +85,13 @@ class TestRabbitMQConsumer:
     @pytest.fixture(name="mock_asyncio_connection", autouse=True)
     def mock_asyncio_connection_fixture(self, mocker):
         """AsyncioConnection mock fixture."""
-        mock_asyncio_connection = mocker.patch("masstransit.consumer.AsyncioConnection")
+        mock_asyncio_connection = mocker.patch("masstransit.transport.AsyncioConnection")
         mock_asyncio_connection.return_value = mock_asyncio_connection
         return mock_asyncio_connection
 
     def test_connect(self, mocker, rabbitmq_consumer, mock_asyncio_connection):
         """We expect connect to create the connection."""
-        mock_url_parameters = mocker.patch("masstransit.consumer.pika.URLParameters")
+        mock_url_parameters = mocker.patch("masstransit.transport.pika.URLParameters")
 
         rabbitmq_consumer.connect()
 
@@ -139,10 +175,10 @@ class TestRabbitMQConsumer:
         """We expect to execute callback when new message arrives."""
         mock_model_validate_json = mocker.patch("masstransit.consumer.Message.model_validate_json")
         mock_acknowledge_message = mocker.patch.object(RabbitMQConsumer, "acknowledge_message")
-        mock_model_validate_json.return_value = mocker.MagicMock(message="test message")
+        mock_model_validate_json.return_value = Message(message="test message")
         channel = mocker.MagicMock()
         basic_deliver = mocker.MagicMock()
-        properties = mocker.MagicMock()
+        properties = mocker.MagicMock(content_encoding=None, content_type=None)
         body = b'{"message": "test message"}'
 
         rabbitmq_consumer.on_message(
@@ -162,6 +198,302 @@ class TestRabbitMQConsumer:
             channel=channel,
         )
 
+    def test_on_message_decompresses_body(self, mocker, rabbitmq_consumer, get_running_loop):
+        """We expect compressed bodies to be decompressed according to content_encoding."""
+        mocker.patch.object(RabbitMQConsumer, "acknowledge_message")
+        basic_deliver = mocker.MagicMock()
+        properties = mocker.MagicMock(content_encoding="gzip", content_type=None)
+        body = gzip.compress(Message(message="test message").model_dump_json().encode())
+
+        rabbitmq_consumer.on_message(mocker.MagicMock(), basic_deliver, properties, body)
+
+        assert get_running_loop.return_value.create_task.call_count == 1
+
+    def test_on_message_takes_charset_encodings_as_uncompressed(self, mocker, rabbitmq_consumer, get_running_loop):
+        """We expect bodies whose content_encoding is a charset to be handled as not compressed."""
+        mocker.patch.object(RabbitMQConsumer, "acknowledge_message")
+        mock_reject_message = mocker.patch.object(RabbitMQConsumer, "reject_message")
+        properties = mocker.MagicMock(content_encoding="utf-8", content_type=None)
+        body = Message(message="test message").model_dump_json().encode()
+
+        rabbitmq_consumer.on_message(mocker.MagicMock(), mocker.MagicMock(), properties, body)
+
+        assert get_running_loop.return_value.create_task.call_count == 1
+        mock_reject_message.assert_not_called()
+
+    def test_on_message_decodes_unknown_content_types_as_json(self, mocker, rabbitmq_consumer, get_running_loop):
+        """We expect bodies with an unknown content_type to be decoded as MassTransit JSON."""
+        mocker.patch.object(RabbitMQConsumer, "acknowledge_message")
+        mock_reject_message = mocker.patch.object(RabbitMQConsumer, "reject_message")
+        properties = mocker.MagicMock(content_encoding=None, content_type="text/plain")
+        body = Message(message="test message").model_dump_json().encode()
+
+        rabbitmq_consumer.on_message(mocker.MagicMock(), mocker.MagicMock(), properties, body)
+
+        assert get_running_loop.return_value.create_task.call_count == 1
+        mock_reject_message.assert_not_called()
+
+    def test_on_message_dispatches_on_content_type(self, mocker, rabbitmq_consumer, get_running_loop):
+        """We expect the body to be decoded with the serializer for its content_type."""
+        mocker.patch.object(RabbitMQConsumer, "acknowledge_message")
+        properties = mocker.MagicMock(content_encoding=None, content_type=MSGPACK)
+        body = get_serializer(MSGPACK).dumps(Message(message="test message"))
+
+        rabbitmq_consumer.on_message(mocker.MagicMock(), mocker.MagicMock(), properties, body)
+
+        assert get_running_loop.return_value.create_task.call_count == 1
+
+    def test_on_message_rejects_undecodable_bodies(self, mocker, rabbitmq_consumer, get_running_loop):
+        """We expect bodies that can't be decoded to be rejected and counted."""
+        mock_reject_message = mocker.patch.object(RabbitMQConsumer, "reject_message")
+        failures = DECODE_FAILURES.labels(self.queue)
+        before = failures.value
+        properties = mocker.MagicMock(content_encoding=None, content_type=None)
+
+        rabbitmq_consumer.on_message(mocker.MagicMock(), mocker.MagicMock(delivery_tag=7), properties, b"not json")
+
+        mock_reject_message.assert_called_once_with(7)
+        get_running_loop.return_value.create_task.assert_not_called()
+        assert failures.value == before + 1
+
+    def test_task_done_callback_records_metrics(self, mocker, rabbitmq_consumer):
+        """We expect the handler latency and the message action to be recorded."""
+        mocker.patch.object(RabbitMQConsumer, "nack_message")
+        settled = SETTLED.labels(self.queue, "foo.Bar", "NACK")
+        latency = HANDLER_SECONDS.labels(self.queue, "foo.Bar")
+        settled_before, latency_before = settled.value, latency.count
+        task = mocker.Mock()
+        task.result.return_value = MessageAction.NACK
+
+        rabbitmq_consumer._task_done_callback(task, mocker.MagicMock(), contract="foo.Bar", started_at=0.0)
+
+        assert settled.value == settled_before + 1
+        assert latency.count == latency_before + 1
+
+    def test_task_done_callback_leaves_out_filter_waits(self, mocker, rabbitmq_consumer):
+        """We expect time filters held the delivery on purpose to be left out of the handler latency."""
+        mocker.patch.object(RabbitMQConsumer, "acknowledge_message")
+        latency = HANDLER_SECONDS.labels(self.queue, "foo.Waited")
+        task = mocker.Mock()
+        task.result.return_value = MessageAction.ACK
+        context = DeliveryContext(
+            self.queue, None, mocker.MagicMock(), mocker.MagicMock(), b"", span=None, waited=60.0
+        )
+
+        rabbitmq_consumer._task_done_callback(
+            task, mocker.MagicMock(), contract="foo.Waited", started_at=time.perf_counter() - 60.5, context=context
+        )
+
+        assert latency.count == 1
+        assert 0.5 <= latency.sum < 5.0
+
+    def test_on_message_records_lag(self, mocker, rabbitmq_consumer, get_running_loop):
+        """We expect the time since sentTime to be recorded when the delivery arrives and the handler starts."""
+        broker_wait = BROKER_WAIT_SECONDS.labels(self.queue)
+        lag = LAG_SECONDS.labels(self.queue)
+        broker_wait_before, lag_before = broker_wait.count, lag.count
+        mocker.patch.object(RabbitMQConsumer, "acknowledge_message")
+        rabbitmq_consumer._on_message_handler = mocker.AsyncMock()
+        properties = mocker.MagicMock(content_encoding=None, content_type=None)
+        sent_time = (datetime.now(timezone.utc) - timedelta(seconds=2)).isoformat()
+        body = Message(message="test message", sentTime=sent_time).model_dump_json().encode()
+
+        rabbitmq_consumer.on_message(mocker.MagicMock(), mocker.MagicMock(), properties, body)
+
+        assert broker_wait.count == broker_wait_before + 1
+        assert broker_wait.sum >= 2
+        assert lag.count == lag_before + 1
+
+    def test_on_message_pauses_when_inflight_bytes_exceed_budget(self, mocker, get_running_loop):
+        """We expect consumption to be paused when unfinished deliveries exceed max_inflight_bytes."""
+        mocker.patch("masstransit.consumer.Message.model_validate_json", return_value=Message())
+        mocker.patch.object(RabbitMQConsumer, "_task_done_callback")
+        rabbitmq_consumer = RabbitMQConsumer(config=self.config, queue=self.queue, max_inflight_bytes=10)
+        rabbitmq_consumer._channel = channel = mocker.MagicMock()
+        rabbitmq_consumer._consumer_tag = "ctag"
+        rabbitmq_consumer._consuming = True
+
+        properties = mocker.MagicMock(content_encoding=None, content_type=None)
+        rabbitmq_consumer.on_message(channel, mocker.MagicMock(delivery_tag=1), properties, b"12345")
+        channel.basic_cancel.assert_not_called()
+        rabbitmq_consumer.on_message(channel, mocker.MagicMock(delivery_tag=2), properties, b"123456")
+
+        assert rabbitmq_consumer.inflight_bytes == 11
+        assert rabbitmq_consumer.is_paused
+        channel.basic_cancel.assert_called_once_with("ctag", mocker.ANY)
+
+    def test_settling_deliveries_resumes_consumption(self, mocker):
+        """We expect consumption to resume once settled deliveries free up the byte budget."""
+        rabbitmq_consumer = RabbitMQConsumer(config=self.config, queue=self.queue, max_inflight_bytes=10)
+        rabbitmq_consumer._channel = channel = mocker.MagicMock()
+        rabbitmq_consumer._consumer_tag = "ctag"
+        rabbitmq_consumer._consuming = True
+        rabbitmq_consumer._track_delivery(1, 6)
+        rabbitmq_consumer._track_delivery(2, 6)
+
+        rabbitmq_consumer.acknowledge_message(1)
+
+        assert rabbitmq_consumer.inflight_bytes == 6
+        assert not rabbitmq_consumer.is_paused
+        channel.basic_consume.assert_called_once_with(self.queue, rabbitmq_consumer.on_message)
+
+    def test_on_message_settles_filtered_deliveries(self, mocker, callback, get_running_loop):
+        """We expect a filter returning an action to settle the delivery without calling the handler."""
+
+        class AckAll(Filter):
+            def after_decode(self, context):
+                return MessageAction.ACK
+
+        mock_acknowledge_message = mocker.patch.object(RabbitMQConsumer, "acknowledge_message")
+        rabbitmq_consumer = RabbitMQConsumer(config=self.config, queue=self.queue, middleware=[AckAll()])
+        properties = mocker.MagicMock(content_encoding=None, content_type=None)
+        body = Message(message="test message").model_dump_json().encode()
+
+        rabbitmq_consumer.on_message(mocker.MagicMock(), mocker.MagicMock(delivery_tag=3), properties, body)
+
+        mock_acknowledge_message.assert_called_once_with(3)
+        callback.assert_not_called()
+        get_running_loop.return_value.create_task.assert_not_called()
+
+    def test_on_message_settles_expired_deliveries_before_decoding(self, mocker, callback, get_running_loop):
+        """We expect deliveries past their expiration to be settled with expired_action without being decoded."""
+        mock_reject_message = mocker.patch.object(RabbitMQConsumer, "reject_message")
+        mock_decode = mocker.patch.object(RabbitMQConsumer, "_decode")
+        rabbitmq_consumer = RabbitMQConsumer(config=self.config, queue=self.queue, expired_action=MessageAction.REJECT)
+        properties = mocker.MagicMock(expiration="1000", timestamp=int(time.time()) - 60)
+
+        rabbitmq_consumer.on_message(mocker.MagicMock(), mocker.MagicMock(delivery_tag=5), properties, b"{}")
+
+        mock_reject_message.assert_called_once_with(5)
+        mock_decode.assert_not_called()
+        callback.assert_not_called()
+
+    def test_set_prefetch_count_restarts_subscription(self, mocker, rabbitmq_consumer):
+        """We expect a new prefetch count to be applied by restarting the active subscription."""
+        rabbitmq_consumer._channel = channel = mocker.MagicMock()
+        rabbitmq_consumer._consumer_tag = "ctag"
+        rabbitmq_consumer._consuming = True
+        rabbitmq_consumer._prefetch_count = 10
+
+        rabbitmq_consumer.set_prefetch_count(1)
+        rabbitmq_consumer.set_prefetch_count()
+
+        assert channel.basic_qos.call_args_list == [mocker.call(prefetch_count=1), mocker.call(prefetch_count=10)]
+        assert channel.basic_cancel.call_count == 2
+        assert channel.basic_consume.call_count == 2
+        assert not rabbitmq_consumer.is_paused
+
+    def test_flow_control_filters(self):
+        """We expect rate limiting first and the circuit breaker and timeout closest to the handler."""
+        rabbitmq_consumer = RabbitMQConsumer(
+            config=self.config,
+            queue=self.queue,
+            middleware=[TimingFilter()],
+            rate_limit=10,
+            breaker_threshold=3,
+            handler_timeout=5,
+        )
+
+        assert [type(f) for f in rabbitmq_consumer._pipeline.filters] == [
+            ExpirationFilter,
+            RateLimitFilter,
+            TimingFilter,
+            CircuitBreakerFilter,
+            TimeoutFilter,
+        ]
+
+    def test_task_done_callback_applies_after_result_filters(self, mocker):
+        """We expect after-result filters to replace the action taken for the handler result."""
+
+        class RequeueAll(Filter):
+            def after_result(self, context, action):
+                return MessageAction.NACK_AND_REQUEUE
+
+        mock_nack_message = mocker.patch.object(RabbitMQConsumer, "nack_message")
+        rabbitmq_consumer = RabbitMQConsumer(config=self.config, queue=self.queue, middleware=[RequeueAll()])
+        task = mocker.Mock()
+        task.result.return_value = None
+
+        rabbitmq_consumer._task_done_callback(
+            task, mocker.MagicMock(delivery_tag=4), context=mocker.MagicMock(waited=0.0), started_at=0.0
+        )
+
+        mock_nack_message.assert_called_once_with(4, requeue=True)
+
+    @pytest.mark.parametrize(
+        ("action", "delete", "deleted"),
+        [
+            (MessageAction.ACK, True, True),
+            (MessageAction.REJECT, True, False),
+            (MessageAction.ACK, False, False),
+            (MessageAction.ACK, None, False),
+        ],
+    )
+    def test_settle_deletes_claim_checked_payload_on_ack(self, mocker, tmp_path, action, delete, deleted):
+        """We expect the payload of an acknowledged claim-checked message to be deleted only when enabled."""
+        options = {} if delete is None else {"claim_check_delete": delete}
+        config = Config(claim_check_dir=str(tmp_path), claim_check_threshold=10, **options)
+        rabbitmq_consumer = RabbitMQConsumer(config=config, queue=self.queue)
+        rabbitmq_consumer._channel = mocker.MagicMock()
+        message = check_in(Message(message={"foo": "x" * 100}), rabbitmq_consumer._claim_check_store, 10)
+
+        async def settle():
+            rabbitmq_consumer._settle(1, action, message=message)
+
+        # asyncio.run waits for the default executor, where the payload is deleted.
+        asyncio.run(settle())
+
+        assert (tmp_path / message.messageId).exists() is not deleted
+
+    def test_run_handler_fetches_claim_checked_payload_first(self, mocker, tmp_path):
+        """We expect the payload to be fetched in an executor before the handler runs, not on the event loop."""
+        rabbitmq_consumer = RabbitMQConsumer(config=Config(claim_check_dir=str(tmp_path)), queue=self.queue)
+        store = rabbitmq_consumer._claim_check_store
+        message = check_out(check_in(Message(message={"foo": "x" * 100}), store, 10), store)
+        threads = []
+        get = store.get
+        mocker.patch.object(
+            store, "get", side_effect=lambda reference: threads.append(threading.get_ident()) or get(reference)
+        )
+
+        async def handler():
+            return message.payload_loaded
+
+        async def run():
+            context = DeliveryContext(self.queue, None, mocker.MagicMock(), mocker.MagicMock(), b"", message=message)
+            return await rabbitmq_consumer._run_handler(handler(), None, context), threading.get_ident()
+
+        loaded, loop_thread = asyncio.run(run())
+
+        assert loaded is True
+        assert message.message == {"foo": "x" * 100}
+        assert len(threads) == 1
+        assert threads[0] != loop_thread
+
+    def test_close_closes_middleware(self, mocker):
+        """We expect closing the consumer to close its filters."""
+        dedup = DedupFilter()
+        close = mocker.patch.object(dedup, "close")
+
+        RabbitMQConsumer(config=self.config, queue=self.queue, middleware=[dedup]).close()
+
+        close.assert_called_once_with()
+
+    def test_resume_waits_for_all_pause_reasons(self, mocker, rabbitmq_consumer):
+        """We expect consumption to stay paused while any pause reason remains."""
+        rabbitmq_consumer._channel = channel = mocker.MagicMock()
+        rabbitmq_consumer._consumer_tag = "ctag"
+        rabbitmq_consumer._consuming = True
+
+        rabbitmq_consumer.pause_consuming("foo")
+        rabbitmq_consumer.pause_consuming("bar")
+        rabbitmq_consumer.resume_consuming("foo")
+
+        channel.basic_cancel.assert_called_once()
+        channel.basic_consume.assert_not_called()
+        rabbitmq_consumer.resume_consuming("bar")
+        channel.basic_consume.assert_called_once()
+
     def test_on_connection_closed_reconnect(self, mocker, rabbitmq_consumer):
         """We expect to reconnect when connection closed unexpectedly."""
         rabbitmq_consumer._closing = False
@@ -178,6 +510,16 @@ class TestRabbitMQConsumer:
 
         rabbitmq_consumer._connection.close.assert_called_once()
 
+    def test_stopped(self, mocker, rabbitmq_consumer):
+        """We expect the consumer to be stopped for good by stop, but not when it stops to reconnect."""
+        rabbitmq_consumer._connection = mocker.MagicMock()
+        assert not rabbitmq_consumer.stopped
+
+        rabbitmq_consumer.reconnect()
+        assert not rabbitmq_consumer.stopped
+        rabbitmq_consumer.should_reconnect = False
+        assert rabbitmq_consumer.stopped
+
 
 class TestReconnectingRabbitMQConsumer:
     """ReconnectingRabbitMQConsumer test case."""
@@ -200,13 +542,13 @@ class TestReconnectingRabbitMQConsumer:
         """RabbitMQConsumer mock fixture."""
         mock = mocker.patch("masstransit.consumer.RabbitMQConsumer")
         mock.return_value = mock
-        mock.should_reconnect = False
+        mock.stopped = False
         return mock
 
     @pytest.fixture(name="mock_sleep", autouse=True)
     def mock_sleep_fixture(self, mocker):
         """Mock sleep fixture."""
-        mock = mocker.patch("time.sleep")
+        mock = mocker.patch("masstransit.consumer.asyncio.sleep", new_callable=mocker.AsyncMock)
         return mock
 
     @pytest.fixture(name="reconnecting_consumer")
@@ -231,10 +573,10 @@ class TestReconnectingRabbitMQConsumer:
 
         mock_rabbitmq_consumer.run.assert_called_once()
         mock_rabbitmq_consumer.stop.assert_called_once()
+        mock_rabbitmq_consumer.close.assert_called_once()
 
     def test_maybe_reconnects_when_consumer_drops(self, reconnecting_consumer, mock_rabbitmq_consumer, mock_sleep):
         """We expect the consumer will try to reconnect with an increasing delay."""
-        mock_rabbitmq_consumer.should_reconnect = True
         mock_rabbitmq_consumer.run.side_effect = [None, KeyboardInterrupt()]
 
         reconnecting_consumer.run()
@@ -242,4 +584,73 @@ class TestReconnectingRabbitMQConsumer:
         assert mock_rabbitmq_consumer.call_count == 2
         assert mock_rabbitmq_consumer.run.call_count == 2
         assert mock_rabbitmq_consumer.stop.call_count == 2
-        mock_sleep.assert_called_once()
+        mock_rabbitmq_consumer.close.assert_called_once()
+        mock_sleep.assert_awaited_once()
+        first, second = mock_rabbitmq_consumer.call_args_list
+        assert first.kwargs["loop"] is second.kwargs["loop"]
+        assert first.kwargs["callback"] is second.kwargs["callback"]
+
+    def test_reconnects_until_stopped(self, reconnecting_consumer, mock_rabbitmq_consumer):
+        """We expect a consumer that stops without asking to reconnect, as after a remote cancel, to reconnect."""
+
+        def run():
+            mock_rabbitmq_consumer.stopped = mock_rabbitmq_consumer.run.call_count == 3
+
+        mock_rabbitmq_consumer.should_reconnect = False
+        mock_rabbitmq_consumer.run.side_effect = run
+
+        reconnecting_consumer.run()
+
+        assert mock_rabbitmq_consumer.run.call_count == 3
+        assert mock_rabbitmq_consumer.call_count == 3
+        mock_rabbitmq_consumer.close.assert_called_once()
+
+    def test_reconnect_delay_backs_off_with_full_jitter(self, mocker, reconnecting_consumer, mock_rabbitmq_consumer):
+        """We expect the delay ceiling to double per failed attempt up to the maximum, and reset after consuming."""
+        uniform = mocker.patch("masstransit.consumer.random.uniform", side_effect=lambda low, high: high)
+        mock_rabbitmq_consumer.was_consuming = False
+
+        delays = [reconnecting_consumer._get_reconnect_delay() for _ in range(7)]
+        mock_rabbitmq_consumer.was_consuming = True
+        delays.append(reconnecting_consumer._get_reconnect_delay())
+
+        assert delays == [1, 2, 4, 8, 16, 30, 30, 1]
+        assert all(call.args[0] == 0 for call in uniform.call_args_list)
+
+    def test_reconnect_fails_over_to_next_node(self, mock_rabbitmq_consumer):
+        """We expect a node that could not be consumed from to be skipped for the next one."""
+        config = Config(dsn="amqp://node1:5672/%2F, amqp://node2:5672/%2F")
+        mock_rabbitmq_consumer.was_consuming = False
+        mock_rabbitmq_consumer.run.side_effect = [None, None, KeyboardInterrupt()]
+
+        ReconnectingRabbitMQConsumer(config=config, queue=self.queue, consumer_class=mock_rabbitmq_consumer).run()
+
+        assert [call.kwargs["dsn"] for call in mock_rabbitmq_consumer.call_args_list] == [
+            "amqp://node1:5672/%2F",
+            "amqp://node2:5672/%2F",
+            "amqp://node1:5672/%2F",
+        ]
+
+    def test_random_node_selection(self, mocker, mock_rabbitmq_consumer):
+        """We expect nodes to be tried in a random order per process with random selection."""
+        shuffle = mocker.patch("masstransit.consumer.random.shuffle", side_effect=lambda dsns: dsns.reverse())
+        config = Config(dsn="amqp://node1/,amqp://node2/", dsn_selection="random")
+
+        ReconnectingRabbitMQConsumer(config=config, queue=self.queue, consumer_class=mock_rabbitmq_consumer)
+
+        shuffle.assert_called_once()
+        assert mock_rabbitmq_consumer.call_args.kwargs["dsn"] == "amqp://node2/"
+
+    def test_middleware_is_resolved_once(self, mock_rabbitmq_consumer):
+        """We expect filters given as paths to be shared by the consumers created on reconnect."""
+        reconnecting_consumer = ReconnectingRabbitMQConsumer(
+            config=self.config,
+            queue=self.queue,
+            consumer_class=mock_rabbitmq_consumer,
+            middleware=["masstransit.middleware.DedupFilter"],
+        )
+        reconnecting_consumer._connect_consumer()
+
+        first, second = mock_rabbitmq_consumer.call_args_list
+        assert isinstance(first.kwargs["middleware"][0], DedupFilter)
+        assert first.kwargs["middleware"][0] is second.kwargs["middleware"][0]
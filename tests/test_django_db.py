@@ -0,0 +1,125 @@
+"""Test masstransit.django_db."""
+
+import asyncio
+import threading
+
+import pytest
+
+from masstransit import django_db
+from masstransit.django_db import ConnectionPool, DjangoDBFilter, run_in_connection
+from masstransit.middleware import Pipeline
+from masstransit.models import Config, MessageAction
+
+
+@pytest.fixture(name="database")
+def database_fixture(mocker):
+    """Record the Django calls of the filter, with the thread they run in."""
+    calls = []
+
+    def record(name):
+        def _record(*args):
+            calls.append((name, threading.current_thread().name, args[2:3]))
+            return name
+
+        return _record
+
+    for name in ("_connect", "_close_old_connections", "_atomic", "_end_atomic", "_close_connections"):
+        mocker.patch(f"masstransit.django_db.{name}", side_effect=record(name))
+    return calls
+
+
+@pytest.fixture(name="consumer")
+def consumer_fixture(mocker):
+    """Consumer mock with a config."""
+    consumer = mocker.MagicMock()
+    consumer._config = Config(django_db_connections=2)
+    return consumer
+
+
+def test_connection_pool_bounds_concurrent_deliveries():
+    """We expect deliveries to wait for a connection thread when all of them are in use."""
+    pool = ConnectionPool(2)
+    active, peak = set(), []
+
+    async def deliver():
+        async with pool.connection() as thread:
+            active.add(thread)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.discard(thread)
+            return await thread.run(lambda: threading.current_thread().name)
+
+    async def scenario():
+        return await asyncio.gather(*(deliver() for _ in range(6)))
+
+    names = asyncio.run(scenario())
+    pool.close()
+
+    assert max(peak) == 2
+    assert set(names) == {"masstransit-db-0_0", "masstransit-db-1_0"}
+    with pytest.raises(ValueError, match="must be positive"):
+        ConnectionPool(0)
+
+
+def test_run_in_connection_needs_the_filter():
+    """We expect ORM calls outside of a wrapped handler to be refused."""
+    with pytest.raises(RuntimeError, match="DjangoDBFilter"):
+        asyncio.run(run_in_connection(print))
+
+
+def test_django_db_filter_runs_handlers_in_a_warm_connection_thread(database, consumer):
+    """We expect connections to be opened on bind, and the handler's ORM calls to run in its connection thread."""
+    db_filter = DjangoDBFilter()
+    pipeline = Pipeline("orders", [db_filter])
+
+    async def handler(context):
+        return await run_in_connection(lambda: threading.current_thread().name)
+
+    pipeline.bind(consumer)
+    pipeline.bind(consumer)
+    thread_name = asyncio.run(pipeline.compose(handler)(None))
+    pipeline.close()
+
+    assert [name for name, _, _ in database[:2]] == ["_connect", "_connect"]
+    assert [(name, thread) for name, thread, _ in database[2:4]] == [
+        ("_close_old_connections", thread_name),
+        ("_close_old_connections", thread_name),
+    ]
+    assert [name for name, _, _ in database[4:]] == ["_close_connections", "_close_connections"]
+    assert db_filter.pool is None
+
+
+@pytest.mark.parametrize(
+    ("result", "commit"), [(None, True), (MessageAction.ACK, True), (MessageAction.REJECT, False)]
+)
+def test_django_db_filter_commits_acknowledged_deliveries(database, consumer, result, commit):
+    """We expect one transaction per delivery, rolled back when the delivery is not acknowledged."""
+    consumer._config.django_db_atomic = True
+    pipeline = Pipeline("orders", [DjangoDBFilter()])
+    pipeline.bind(consumer)
+
+    async def handler(context):
+        return result
+
+    assert asyncio.run(pipeline.compose(handler)(None)) is result
+    assert [(name, args) for name, _, args in database[2:]] == [
+        ("_close_old_connections", ()),
+        ("_atomic", ()),
+        ("_end_atomic", (commit,)),
+        ("_close_old_connections", ()),
+    ]
+
+
+def test_django_db_filter_rolls_back_failed_handlers(database, consumer):
+    """We expect the transaction to be rolled back with the handler error."""
+    pipeline = Pipeline("orders", [DjangoDBFilter(atomic=True)])
+    pipeline.bind(consumer)
+    error = ValueError("boom")
+
+    async def handler(context):
+        raise error
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(pipeline.compose(handler)(None))
+    django_db._end_atomic.assert_called_once_with("_atomic", "default", False, error)
+    assert django_db.DB_CONNECTION.get() is None
@@ -0,0 +1,188 @@
+"""Test masstransit.faults."""
+
+import asyncio
+
+import pytest
+
+from masstransit.consumer import RabbitMQConsumer
+from masstransit.faults import (
+    FAULT_MESSAGE_TYPE,
+    error_queue,
+    exception_info,
+    fault_destination,
+    fault_message,
+    fault_message_types,
+)
+from masstransit.models import Config, Contract, Message, MessageAction
+from masstransit.producer import RabbitMQProducer
+from masstransit.serializers import get_serializer
+from masstransit.transport import InMemoryBus, InMemoryTransport
+
+
+class OrderPlaced(Contract):
+    """Test contract."""
+
+    n: int
+
+
+def test_fault_message_types():
+    """We expect a Fault<T> per message type, then the Fault base type."""
+    assert fault_message_types(("urn:message:Orders:OrderPlaced",)) == [
+        "urn:message:MassTransit:Fault[[Orders:OrderPlaced]]",
+        FAULT_MESSAGE_TYPE,
+    ]
+    assert fault_message_types(None) == [FAULT_MESSAGE_TYPE]
+
+
+def test_exception_info_includes_causes():
+    """We expect the exception type, message, stack trace and cause of an exception."""
+    try:
+        try:
+            raise KeyError("sku")
+        except KeyError as e:
+            raise RuntimeError("stock lookup failed") from e
+    except RuntimeError as e:
+        info = exception_info(e)
+
+    assert (info["exceptionType"], info["message"]) == ("builtins.RuntimeError", "stock lookup failed")
+    assert "test_exception_info_includes_causes" in info["stackTrace"]
+    assert info["innerException"]["exceptionType"] == "builtins.KeyError"
+    assert info["innerException"]["innerException"] is None
+
+
+def test_fault_message():
+    """We expect the fault to carry the original message and the exception, in the conversation of the message."""
+    message = Message(
+        messageType=("urn:message:Orders:OrderPlaced",),
+        message={"orderId": 1},
+        correlationId="c1",
+        faultAddress="queue:orders-faults",
+        headers={"traceparent": "00-abc-def-01", "other": 1},
+    )
+
+    fault = fault_message(message, ValueError("bad order"), source_address="queue:orders")
+
+    assert fault.messageType == ("urn:message:MassTransit:Fault[[Orders:OrderPlaced]]", FAULT_MESSAGE_TYPE)
+    assert (fault.correlationId, fault.conversationId, fault.initiatorId) == (
+        "c1",
+        message.messageId,
+        message.messageId,
+    )
+    assert (fault.sourceAddress, fault.destinationAddress) == ("queue:orders", "queue:orders-faults")
+    assert fault.headers == {"traceparent": "00-abc-def-01"}
+    assert fault.message["faultedMessageId"] == message.messageId
+    assert fault.message["message"] == {"orderId": 1}
+    assert fault.message["faultMessageTypes"] == ["urn:message:Orders:OrderPlaced"]
+    assert fault.message["exceptions"][0]["message"] == "bad order"
+
+
+@pytest.mark.parametrize(
+    ("fault_address", "destination"),
+    [
+        (None, ("orders_error", "")),
+        ("queue:orders-faults", ("", "orders-faults")),
+        ("rabbitmq://broker/vhost/orders-faults", ("orders-faults", "")),
+        ("exchange:faults", ("faults", "")),
+    ],
+)
+def test_fault_destination(fault_address, destination):
+    """We expect fault addresses to be sent to their exchange or queue, and faults without one to the error queue."""
+    assert fault_destination(Message(faultAddress=fault_address), "orders") == destination
+
+
+async def wait_until(predicate):
+    """Run the event loop until predicate holds."""
+    for _ in range(1000):
+        if predicate():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("Condition not reached")
+
+
+def run_failing_consumer(bus, messages, **consumer_options):
+    """Send messages, as contracts and envelope fields, to a consumer whose handler raises until they are settled."""
+
+    async def callback(message, **kwargs):
+        raise ValueError(f"cannot handle {message.message['n']}")
+
+    async def scenario():
+        consumer = RabbitMQConsumer(
+            Config(dsn="memory://"),
+            "orders",
+            exchange="orders",
+            prefetch_count=1,
+            callback=callback,
+            transport=InMemoryTransport(bus),
+            **consumer_options,
+        )
+        consumer._connection = consumer.connect()
+        await wait_until(consumer.is_ready)
+        producer = RabbitMQProducer(Config(dsn="memory://"), "orders", "fanout", "", transport=InMemoryTransport(bus))
+        for obj, message_kwargs in messages:
+            producer.send_contract(obj, message_kwargs=message_kwargs)
+        await wait_until(lambda: not bus.queues["orders"] and not consumer._inflight)
+        return consumer
+
+    return asyncio.run(scenario())
+
+
+def decoded(bus, queue):
+    """Messages waiting in a queue of the bus."""
+    return [
+        get_serializer(properties.content_type).loads(body)
+        for _, _, properties, body, _, _ in bus.queues.get(queue, ())
+    ]
+
+
+def test_failed_handler_settles_delivery_and_publishes_fault():
+    """We expect each failed delivery to be rejected, so the consumer keeps going, and its fault to be published."""
+    bus = InMemoryBus()
+    bus.declare_queue("orders-faults")
+    bus.declare_exchange("faults", "fanout")
+    bus.declare_queue("all-faults")
+    bus.bind("all-faults", "faults", "")
+
+    run_failing_consumer(
+        bus,
+        [
+            (OrderPlaced(n=1), None),
+            (OrderPlaced(n=2), {"faultAddress": "queue:orders-faults"}),
+            (OrderPlaced(n=3), {"faultAddress": "rabbitmq://localhost/vhost/faults"}),
+        ],
+        publish_faults=True,
+    )
+
+    (fault,) = decoded(bus, error_queue("orders"))
+    assert fault.message["message"] == {"n": 1}
+    assert fault.message["exceptions"][0]["message"] == "cannot handle 1"
+    assert fault.messageType[0].startswith("urn:message:MassTransit:Fault[[")
+    (fault,) = decoded(bus, "orders-faults")
+    assert fault.message["message"] == {"n": 2}
+    (fault,) = decoded(bus, "all-faults")
+    assert fault.message["message"] == {"n": 3}
+
+
+def test_failed_handler_error_action_without_faults(mocker):
+    """We expect the error action to settle failed deliveries, and no faults or error queue by default."""
+    bus = InMemoryBus()
+    nack = mocker.spy(RabbitMQConsumer, "nack_message")
+
+    run_failing_consumer(bus, [(OrderPlaced(n=1), None)], error_action=MessageAction.NACK)
+
+    assert nack.call_count == 1
+    assert "orders_error" not in bus.queues
+
+
+def test_requeued_failed_delivery_has_no_fault(mocker):
+    """We expect no fault for deliveries that are requeued, as they will be handled again."""
+    publish = mocker.patch("masstransit.faults.publish_fault")
+    consumer = RabbitMQConsumer(Config(), "orders", error_action=MessageAction.REJECT_AND_REQUEUE, publish_faults=True)
+    consumer._channel = mocker.MagicMock()
+    task = mocker.MagicMock()
+    task.result.side_effect = ValueError("boom")
+    basic_deliver = mocker.MagicMock(delivery_tag=7)
+
+    consumer._task_done_callback(task, basic_deliver, context=mocker.MagicMock(span=None))
+
+    publish.assert_not_called()
+    consumer.channel.basic_reject.assert_called_once_with(7, requeue=True)
@@ -0,0 +1,203 @@
+"""Test masstransit.inbox."""
+
+import asyncio
+import contextlib
+import sqlite3
+import sys
+import threading
+import types
+
+import pytest
+
+from masstransit.inbox import DjangoInbox, MemoryInbox, SQLiteInbox, inbox_from_url
+from masstransit.middleware import DedupFilter, DeliveryContext
+from masstransit.models import Message, MessageAction
+
+
+class SynchronousOnlyOperation(Exception):
+    """Raised by Django for database calls from a thread running an event loop."""
+
+
+class IntegrityError(Exception):
+    """Django integrity error."""
+
+
+class DjangoConnection:
+    """Django database connection on SQLite, with the async safety check of `django.utils.asyncio.async_unsafe`."""
+
+    def __init__(self, path):
+        """Open the database."""
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.threads = set()
+
+    def close_if_unusable_or_obsolete(self):
+        """Keep the connection."""
+
+    def cursor(self):
+        """Cursor translating the `%s` placeholders of Django to SQLite."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise SynchronousOnlyOperation(
+                "You cannot call this from an async context - use a thread or sync_to_async."
+            )
+        self.threads.add(threading.get_ident())
+        return DjangoCursor(self._connection.cursor())
+
+
+class DjangoCursor:
+    """Django cursor wrapper."""
+
+    def __init__(self, cursor):
+        """Wrap a SQLite cursor."""
+        self._cursor = cursor
+
+    def __enter__(self):
+        """Use the cursor as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the cursor."""
+        self._cursor.close()
+
+    @property
+    def rowcount(self):
+        """Rows changed by the last statement."""
+        return self._cursor.rowcount
+
+    def execute(self, query, params=()):
+        """Execute a query."""
+        try:
+            self._cursor.execute(query.replace("%s", "?"), params)
+        except sqlite3.IntegrityError as e:
+            raise IntegrityError(str(e)) from e
+
+    def fetchone(self):
+        """Fetch a row."""
+        return self._cursor.fetchone()
+
+
+@pytest.fixture(name="django_connection")
+def django_connection_fixture(mocker, tmp_path):
+    """`django.db` with a default database on SQLite."""
+    connection = DjangoConnection(str(tmp_path / "django.db"))
+    db = types.ModuleType("django.db")
+    db.connections = {"default": connection}
+    db.IntegrityError = IntegrityError
+    db.transaction = types.SimpleNamespace(atomic=lambda using: contextlib.nullcontext())
+    mocker.patch.dict(sys.modules, {"django": types.ModuleType("django"), "django.db": db})
+    return connection
+
+
+@pytest.fixture(name="monotonic")
+def monotonic_fixture(mocker):
+    """Controllable monotonic clock."""
+    return mocker.patch("masstransit.inbox.time.monotonic", return_value=100.0)
+
+
+def test_memory_inbox_evicts_least_recently_seen():
+    """We expect the least recently seen id to be evicted once the inbox is full."""
+    inbox = MemoryInbox(max_size=2)
+
+    assert inbox.add("a") == 0
+    assert inbox.add("b") == 0
+    assert inbox.contains("a")
+    assert inbox.add("c") == 1
+
+    assert inbox.contains("a")
+    assert not inbox.contains("b")
+    assert len(inbox) == 2
+
+
+def test_memory_inbox_expires_ids(monotonic):
+    """We expect ids to be forgotten after the ttl."""
+    inbox = MemoryInbox(ttl=10)
+    inbox.add("a")
+
+    monotonic.return_value = 105.0
+    inbox.add("b")
+    assert inbox.contains("a")
+
+    monotonic.return_value = 111.0
+    assert not inbox.contains("a")
+    assert inbox.add("c") == 0
+    monotonic.return_value = 200.0
+    assert inbox.add("d") == 2
+
+
+def test_sqlite_inbox_is_shared_between_instances(tmp_path):
+    """We expect ids processed by one process to be seen by another using the same database."""
+    path = str(tmp_path / "inbox.db")
+    first, second = SQLiteInbox(path), SQLiteInbox(path)
+
+    first.add("a")
+
+    assert second.contains("a")
+    assert not second.contains("b")
+    first.close()
+    second.close()
+
+
+def test_sqlite_inbox_purges_expired_ids(mocker, tmp_path):
+    """We expect expired ids to be ignored and purged."""
+    clock = mocker.patch("masstransit.inbox.time.time", return_value=1000.0)
+    inbox = SQLiteInbox(str(tmp_path / "inbox.db"), ttl=10, purge_interval=0)
+    inbox.add("a")
+
+    clock.return_value = 1011.0
+    assert not inbox.contains("a")
+    assert inbox.add("b") == 1
+    assert inbox.contains("b")
+
+
+def test_inbox_from_url(tmp_path):
+    """We expect the inbox backend to be chosen by URL scheme."""
+    assert isinstance(inbox_from_url("memory://", max_size=5), MemoryInbox)
+    assert isinstance(inbox_from_url(f"sqlite://{tmp_path}/inbox.db"), SQLiteInbox)
+    assert inbox_from_url("django://replica").using == "replica"
+    assert isinstance(inbox_from_url("django://"), DjangoInbox)
+    with pytest.raises(ValueError, match="Unsupported inbox URL"):
+        inbox_from_url("redis://localhost")
+
+
+def test_inbox_rejects_invalid_table_names(tmp_path):
+    """We expect table names to be validated before being interpolated in SQL."""
+    with pytest.raises(ValueError, match="Invalid inbox table name"):
+        SQLiteInbox(str(tmp_path / "inbox.db"), table="inbox; DROP TABLE users")
+
+
+def test_django_inbox(django_connection):
+    """We expect ids to be recorded, refreshed and found in the Django database."""
+    inbox = DjangoInbox()
+
+    assert not inbox.contains("a")
+    assert inbox.add("a") == 0
+    assert inbox.add("a") == 0
+    assert inbox.contains("a")
+
+
+def test_django_inbox_is_called_off_the_event_loop(mocker, django_connection):
+    """We expect the dedup filter to use a Django inbox from a thread of its own, never from the event loop."""
+    dedup = DedupFilter(DjangoInbox())
+    message = Message()
+    handler = mocker.AsyncMock(return_value=None)
+
+    def context():
+        return DeliveryContext("test_queue", None, mocker.MagicMock(), mocker.MagicMock(), b"", message)
+
+    async def scenario():
+        with pytest.raises(SynchronousOnlyOperation):
+            dedup.store.contains(message.messageId)
+        first = context()
+        assert dedup.after_decode(first) is None
+        assert await dedup.around_handler(first, handler) is None
+        dedup.after_result(first, MessageAction.ACK)
+        await asyncio.gather(*dedup._pending)
+        return await dedup.around_handler(context(), handler)
+
+    assert asyncio.run(scenario()) == MessageAction.ACK
+    handler.assert_awaited_once()
+    assert threading.get_ident() not in django_connection.threads
+    assert len(django_connection.threads) == 1
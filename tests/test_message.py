@@ -0,0 +1,42 @@
+"""Test message model."""
+
+from datetime import datetime, timedelta, timezone
+
+from masstransit.models import Message
+
+
+def test_sent_time_is_timezone_aware():
+    """We expect new messages to carry an aware UTC sentTime."""
+    message = Message()
+
+    assert message.sent_at.tzinfo is not None
+    assert message.sent_at.utcoffset() == timedelta(0)
+
+
+def test_lag_is_positive_for_past_messages():
+    """We expect lag to be the time elapsed since the message was sent."""
+    message = Message(sentTime=(datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat())
+
+    assert timedelta(minutes=5) <= message.lag < timedelta(minutes=6)
+
+
+def test_lag_handles_naive_local_timestamps():
+    """We expect naive sentTime values, as sent by older producers, to be taken as local time."""
+    message = Message(sentTime=(datetime.now() - timedelta(seconds=30)).isoformat())
+
+    assert timedelta(seconds=30) <= message.lag < timedelta(seconds=31)
+
+
+def test_is_expired():
+    """We expect messages to expire once their expirationTime has passed."""
+    now = datetime.now(timezone.utc)
+
+    assert not Message().is_expired()
+    assert not Message(expirationTime=(now + timedelta(minutes=1)).isoformat()).is_expired()
+    assert Message(expirationTime=(now - timedelta(seconds=1)).isoformat()).is_expired()
+    assert Message(expirationTime="2020-01-01T00:00:00Z").is_expired(now)
+
+
+def test_is_expired_ignores_invalid_expiration_time():
+    """We expect an unparsable expirationTime not to expire the message."""
+    assert not Message(expirationTime="tomorrow").is_expired()
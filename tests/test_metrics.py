@@ -0,0 +1,152 @@
+"""Test metrics module."""
+
+import urllib.error
+import urllib.request
+
+import pytest
+
+from masstransit.metrics import Counter, Gauge, Health, Histogram, Metric, MetricsServer, Registry, merge_expositions
+
+
+@pytest.fixture(name="registry")
+def registry_fixture():
+    """Empty registry fixture."""
+    return Registry()
+
+
+def test_counter_exposition(registry):
+    """We expect labelled counters to be exposed per label set."""
+    counter = Counter("deliveries_total", "Deliveries.", ("queue",), registry=registry)
+
+    counter.labels("foo").inc()
+    counter.labels(queue="foo").inc(2)
+    counter.labels("bar").inc()
+
+    assert registry.expose() == (
+        "# HELP deliveries_total Deliveries.\n"
+        "# TYPE deliveries_total counter\n"
+        'deliveries_total{queue="foo"} 3\n'
+        'deliveries_total{queue="bar"} 1\n'
+    )
+
+
+def test_gauge_exposition(registry):
+    """We expect gauges to expose their last value."""
+    gauge = Gauge("inflight", "Inflight.", registry=registry)
+
+    gauge.set(3)
+    gauge.labels().dec()
+
+    assert "inflight 2\n" in registry.expose()
+
+
+def test_histogram_exposition(registry):
+    """We expect histograms to expose cumulative buckets, sum and count."""
+    histogram = Histogram("latency_seconds", "Latency.", ("queue",), registry=registry, buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.labels("foo").observe(value)
+
+    lines = registry.expose().splitlines()
+    assert 'latency_seconds_bucket{queue="foo",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{queue="foo",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{queue="foo",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{queue="foo"} 2.65' in lines
+    assert 'latency_seconds_count{queue="foo"} 4' in lines
+
+
+def test_label_values_are_escaped(registry):
+    """We expect quotes and backslashes in label values to be escaped."""
+    counter = Counter("escaped_total", "Escaped.", ("contract",), registry=registry)
+
+    counter.labels('a"b\\c').inc()
+
+    assert 'escaped_total{contract="a\\"b\\\\c"} 1' in registry.expose()
+
+
+def test_duplicate_registration(registry):
+    """We expect registering two metrics with the same name to fail."""
+    Counter("foo_total", "Foo.", registry=registry)
+
+    with pytest.raises(ValueError, match="Metric already registered: foo_total"):
+        Counter("foo_total", "Foo.", registry=registry)
+
+
+def test_wrong_labels(registry):
+    """We expect a value error when the label values don't match the label names."""
+    counter = Counter("foo_total", "Foo.", ("queue", "contract"), registry=registry)
+
+    with pytest.raises(ValueError, match="expects labels"):
+        counter.labels("foo")
+    with pytest.raises(TypeError, match="must be strings"):
+        counter.labels("foo", 200)
+    assert counter.labels("foo", "200") is counter.labels(queue="foo", contract="200")
+
+
+def test_health():
+    """We expect readiness to require all checks and liveness to follow the heartbeat."""
+    health = Health(heartbeat_timeout=0)
+
+    assert health.is_live()
+    assert not health.is_ready()
+    health.add_readiness_check("a", lambda: True)
+    assert health.is_ready()
+    health.add_readiness_check("b", lambda: False)
+    assert not health.is_ready()
+    health.heartbeat()
+    assert not health.is_live()
+
+
+def test_merge_expositions_sums_series():
+    """We expect identical series from several processes to be summed and headers deduplicated."""
+    text = '# HELP foo_total Foo.\n# TYPE foo_total counter\nfoo_total{queue="a"} 1\n'
+
+    merged = merge_expositions([text, text, text.replace('"a"', '"b"')])
+
+    assert (
+        merged == '# HELP foo_total Foo.\n# TYPE foo_total counter\nfoo_total{queue="a"} 2\nfoo_total{queue="b"} 1\n'
+    )
+
+
+def test_merge_expositions_keeps_gauges_apart():
+    """We expect gauge samples to be labelled with their process instead of summed."""
+    texts = [
+        f'# HELP state State.\n# TYPE state gauge\nstate{{queue="a"}} {value}\nstate {value}\n' for value in (1, 2)
+    ]
+
+    assert merge_expositions(texts) == (
+        "# HELP state State.\n"
+        "# TYPE state gauge\n"
+        'state{queue="a",process="0"} 1\n'
+        'state{process="0"} 1\n'
+        'state{queue="a",process="1"} 2\n'
+        'state{process="1"} 2\n'
+    )
+
+
+def test_metrics_server(registry):
+    """We expect the server to expose metrics and health probes over HTTP."""
+    Counter("served_total", "Served.", registry=registry).inc()
+    health = Health()
+    server = MetricsServer(0, registry=registry, health=health).start()
+    url = f"http://127.0.0.1:{server.port}"
+    try:
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert "served_total 1" in response.read().decode()
+        with urllib.request.urlopen(f"{url}/healthz") as response:
+            assert response.status == 200
+        with pytest.raises(urllib.error.HTTPError, match="503"):
+            urllib.request.urlopen(f"{url}/readyz")
+        health.add_readiness_check("consumer", lambda: True)
+        with urllib.request.urlopen(f"{url}/readyz") as response:
+            assert response.status == 200
+        with pytest.raises(urllib.error.HTTPError, match="404"):
+            urllib.request.urlopen(f"{url}/nope")
+    finally:
+        server.stop()
+
+
+def test_metric_is_abstract():
+    """We expect metrics to implement their children and samples."""
+    with pytest.raises(TypeError, match="abstract"):
+        Metric("test_abstract_metric", "Abstract metric.", registry=None)
@@ -0,0 +1,345 @@
+"""Test masstransit.middleware."""
+
+import asyncio
+
+import pytest
+
+from masstransit.inbox import MemoryInbox, SQLiteInbox
+from masstransit.middleware import (
+    BREAKER_STATE,
+    BREAKER_TRIPS,
+    COALESCED,
+    DEDUP_EVICTIONS,
+    DEDUP_LOOKUPS,
+    EXPIRED,
+    STAGE_SECONDS,
+    CircuitBreakerFilter,
+    CoalescingFilter,
+    DedupFilter,
+    DeliveryContext,
+    ExceptionMappingFilter,
+    ExpirationFilter,
+    Filter,
+    Pipeline,
+    RateLimitFilter,
+    TimeoutFilter,
+    TimingFilter,
+    TokenBucket,
+    key_selector,
+)
+from masstransit.models import Config, Message, MessageAction
+
+
+class RecordingFilter(Filter):
+    """Filter recording the order of its around-handler calls."""
+
+    def __init__(self, name, calls):
+        """Initializes the filter."""
+        self.name = name
+        self.calls = calls
+
+    async def around_handler(self, context, call_next):
+        """Record entry and exit."""
+        self.calls.append(f"{self.name}:enter")
+        result = await call_next(context)
+        self.calls.append(f"{self.name}:exit")
+        return result
+
+
+class SkipFilter(Filter):
+    """Filter settling every delivery before decoding."""
+
+    def before_decode(self, context):
+        """Skip the delivery."""
+        return MessageAction.REJECT
+
+
+def make_context(mocker, message=None):
+    """Build a delivery context."""
+    return DeliveryContext("test_queue", mocker.MagicMock(), mocker.MagicMock(), mocker.MagicMock(), b"", message)
+
+
+def test_pipeline_keeps_only_overridden_hooks():
+    """We expect hooks that are not overridden to be skipped when the pipeline is compiled."""
+    pipeline = Pipeline("test_queue", [SkipFilter(), TimingFilter()])
+
+    assert len(pipeline._before_decode) == 1
+    assert pipeline._after_decode == ()
+    assert len(pipeline._around_handler) == 1
+    assert pipeline._after_result == ()
+
+
+def test_pipeline_resolves_dotted_paths_and_classes():
+    """We expect filters to be given as instances, classes or dotted paths."""
+    pipeline = Pipeline("test_queue", ["masstransit.middleware.TimingFilter", DedupFilter])
+
+    assert [type(f) for f in pipeline.filters] == [TimingFilter, DedupFilter]
+    with pytest.raises(TypeError):
+        Pipeline("test_queue", ["masstransit.models.Message"])
+
+
+def test_pipeline_composes_first_filter_outermost(mocker):
+    """We expect around-handler hooks to wrap the handler in declaration order."""
+    calls = []
+    pipeline = Pipeline("test_queue", [RecordingFilter("a", calls), RecordingFilter("b", calls)])
+
+    async def handler(context):
+        calls.append("handler")
+        return MessageAction.NACK
+
+    result = asyncio.run(pipeline.compose(handler)(make_context(mocker)))
+
+    assert result == MessageAction.NACK
+    assert calls == ["a:enter", "b:enter", "handler", "b:exit", "a:exit"]
+
+
+def test_pipeline_without_around_filters_calls_handler_directly():
+    """We expect the handler itself to be used when no filter wraps it."""
+
+    async def handler(context):
+        return None
+
+    assert Pipeline("test_queue").compose(handler) is handler
+
+
+def test_pipeline_records_stage_latency(mocker):
+    """We expect the latency of filter stages to be recorded per queue."""
+    stage = STAGE_SECONDS.labels("test_queue", "before_decode")
+    before = stage.count
+    pipeline = Pipeline("test_queue", [SkipFilter()])
+
+    assert pipeline.before_decode(make_context(mocker)) == MessageAction.REJECT
+    assert stage.count == before + 1
+
+
+def test_dedup_filter_acks_processed_messages(mocker):
+    """We expect a message to be acknowledged without its handler once it was processed."""
+    dedup = DedupFilter(max_size=1)
+    first, second = Message(), Message()
+    hits, misses = DEDUP_LOOKUPS.labels("test_queue", "hit"), DEDUP_LOOKUPS.labels("test_queue", "miss")
+    evictions = DEDUP_EVICTIONS.labels("test_queue")
+    hits_before, misses_before, evictions_before = hits.value, misses.value, evictions.value
+    context = make_context(mocker, first)
+
+    assert dedup.after_decode(context) is None
+    dedup.after_result(context, MessageAction.ACK)
+    assert dedup.after_decode(make_context(mocker, first)) == MessageAction.ACK
+
+    dedup.after_result(make_context(mocker, second), MessageAction.ACK)
+    assert dedup.after_decode(make_context(mocker, first)) is None
+
+    assert hits.value == hits_before + 1
+    assert misses.value == misses_before + 2
+    assert evictions.value == evictions_before + 1
+
+
+def test_dedup_filter_ignores_unacknowledged_messages(mocker):
+    """We expect requeued messages to be handled again."""
+    dedup = DedupFilter()
+    context = make_context(mocker, Message())
+
+    dedup.after_result(context, MessageAction.NACK_AND_REQUEUE)
+
+    assert dedup.after_decode(context) is None
+
+
+def test_dedup_filter_uses_inbox_from_config(mocker, tmp_path):
+    """We expect the inbox to be created from the consumer config unless a store is given."""
+    consumer = mocker.MagicMock()
+    consumer._config = Config(inbox_url=f"sqlite://{tmp_path}/inbox.db", inbox_ttl=60)
+    dedup, explicit = DedupFilter(), DedupFilter(store=MemoryInbox())
+
+    dedup.bind(consumer)
+    explicit.bind(consumer)
+
+    assert isinstance(dedup.store, SQLiteInbox)
+    assert dedup.store.ttl == 60
+    assert isinstance(explicit.store, MemoryInbox)
+
+
+def test_token_bucket_delays_beyond_burst(mocker):
+    """We expect tokens beyond the burst to wait for the refill."""
+    mocker.patch("masstransit.middleware.time.monotonic", return_value=100.0)
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, pytest.approx(0.1), pytest.approx(0.2)]
+
+
+def test_rate_limit_filter_sleeps_for_token(mocker):
+    """We expect the handler call to wait until a token is available."""
+    sleep = mocker.patch("masstransit.middleware.asyncio.sleep", new_callable=mocker.AsyncMock)
+    rate_limit = RateLimitFilter(rate=1, burst=1)
+    handler = mocker.AsyncMock(return_value=None)
+
+    asyncio.run(rate_limit.around_handler(make_context(mocker), handler))
+    asyncio.run(rate_limit.around_handler(make_context(mocker), handler))
+
+    sleep.assert_awaited_once()
+    assert handler.await_count == 2
+
+
+def test_exception_mapping_filter_uses_most_specific_match(mocker):
+    """We expect handler exceptions to be turned into the action of their closest mapped class."""
+    mapping = ExceptionMappingFilter(
+        {Exception: MessageAction.REJECT, "builtins.LookupError": MessageAction.NACK_AND_REQUEUE}, default=None
+    )
+
+    async def handler(context):
+        raise KeyError("missing")
+
+    assert asyncio.run(mapping.around_handler(make_context(mocker), handler)) == MessageAction.NACK_AND_REQUEUE
+
+
+def test_exception_mapping_filter_reraises_unmapped(mocker):
+    """We expect unmapped exceptions to propagate when there is no default action."""
+    mapping = ExceptionMappingFilter({KeyError: MessageAction.NACK}, default=None)
+
+    async def handler(context):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(mapping.around_handler(make_context(mocker), handler))
+
+
+def test_expiration_filter_checks_properties_before_decode(mocker):
+    """We expect deliveries past their AMQP expiration to be settled before decoding."""
+    mocker.patch("masstransit.middleware.time.time", return_value=1000.0)
+    expired = EXPIRED.labels("test_queue", "property")
+    before = expired.value
+    expiration = ExpirationFilter(MessageAction.REJECT)
+    context = make_context(mocker)
+
+    context.properties = mocker.MagicMock(expiration="5000", timestamp=990)
+    assert expiration.before_decode(context) == MessageAction.REJECT
+    context.properties = mocker.MagicMock(expiration="5000", timestamp=995)
+    assert expiration.before_decode(context) is None
+    context.properties = mocker.MagicMock(expiration=None, timestamp=0)
+    assert expiration.before_decode(context) is None
+    assert expired.value == before + 1
+
+
+def test_expiration_filter_checks_envelope_after_decode(mocker):
+    """We expect messages past their expirationTime to be settled without calling the handler."""
+    expiration = ExpirationFilter()
+
+    assert expiration.after_decode(make_context(mocker, Message(expirationTime="2020-01-01T00:00:00Z"))) == (
+        MessageAction.ACK
+    )
+    assert expiration.after_decode(make_context(mocker, Message())) is None
+
+
+def test_key_selector():
+    """We expect keys to be read from correlationId or a path into the payload."""
+    message = Message(correlationId="c1", message={"item": {"sku": "A-1"}, "tags": ["x"]})
+
+    assert key_selector("correlationId")(message) == "c1"
+    assert key_selector("item.sku")(message) == "A-1"
+    assert key_selector("item.missing")(message) is None
+    assert key_selector("tags")(message) is None
+
+
+def test_coalescing_filter_handles_latest_per_key(mocker):
+    """We expect only the latest delivery per key within the window to reach the handler."""
+    coalesced = COALESCED.labels("test_queue")
+    before = coalesced.value
+    coalescing = CoalescingFilter("sku", window=0.01)
+    handled = []
+    contexts = []
+
+    async def handler(context):
+        handled.append(context.message.message)
+
+    async def deliver():
+        deliveries = [
+            {"sku": "A", "level": 1},
+            {"sku": "B", "level": 1},
+            {"sku": "A", "level": 2},
+            {"level": 0},
+            {"sku": "A", "level": 3},
+        ]
+        contexts.extend(make_context(mocker, Message(message=m)) for m in deliveries)
+        return await asyncio.gather(*(coalescing.around_handler(context, handler) for context in contexts))
+
+    results = asyncio.run(deliver())
+
+    assert results == [MessageAction.ACK, None, MessageAction.ACK, None, None]
+    assert handled[0] == {"level": 0}
+    assert sorted(handled[1:], key=lambda m: m["sku"]) == [{"sku": "A", "level": 3}, {"sku": "B", "level": 1}]
+    assert coalesced.value == before + 2
+    assert [context.waited > 0 for context in contexts] == [True, True, True, False, True]
+    assert coalescing._latest == {}
+    assert coalescing._deadlines == {}
+
+
+def test_timeout_filter_fails_slow_handlers(mocker):
+    """We expect handler calls exceeding the timeout to fail with TimeoutError."""
+
+    async def handler(context):
+        await asyncio.sleep(1)
+
+    with pytest.raises(TimeoutError, match="timed out"):
+        asyncio.run(TimeoutFilter(0.01).around_handler(make_context(mocker), handler))
+
+
+def test_circuit_breaker_opens_and_probes(mocker):
+    """We expect the breaker to pause after consecutive failures, then probe with a prefetch count of 1."""
+    consumer = mocker.MagicMock(_queue="test_queue")
+    breaker = CircuitBreakerFilter(threshold=2, reset_timeout=0.01)
+    breaker.bind(consumer)
+    trips = BREAKER_TRIPS.labels("test_queue")
+    trips_before = trips.value
+
+    async def fail(context):
+        raise RuntimeError("database is down")
+
+    async def succeed(context):
+        return None
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await breaker.around_handler(make_context(mocker), fail)
+        assert breaker.state == CircuitBreakerFilter.OPEN
+        consumer.pause_consuming.assert_called_once_with("circuit_breaker")
+
+        await asyncio.sleep(0.02)
+        assert breaker.state == CircuitBreakerFilter.HALF_OPEN
+        consumer.set_prefetch_count.assert_called_once_with(1)
+        consumer.resume_consuming.assert_called_once_with("circuit_breaker")
+
+        with pytest.raises(RuntimeError):
+            await breaker.around_handler(make_context(mocker), fail)
+        assert breaker.state == CircuitBreakerFilter.OPEN
+
+        await asyncio.sleep(0.02)
+        await breaker.around_handler(make_context(mocker), succeed)
+        assert breaker.state == CircuitBreakerFilter.CLOSED
+        consumer.set_prefetch_count.assert_called_with()
+
+    asyncio.run(scenario())
+
+    assert trips.value == trips_before + 2
+    assert BREAKER_STATE.labels("test_queue").value == CircuitBreakerFilter.CLOSED
+
+
+def test_circuit_breaker_counts_consecutive_failures(mocker):
+    """We expect a success to reset the failure count."""
+    breaker = CircuitBreakerFilter(threshold=2)
+    breaker.bind(mocker.MagicMock(_queue="test_queue"))
+
+    breaker.on_failure()
+    breaker.on_success()
+    breaker.on_failure()
+
+    assert breaker.state == CircuitBreakerFilter.CLOSED
+
+
+def test_pipeline_close_closes_every_filter(mocker):
+    """We expect every filter to be closed, even when one of them fails to close."""
+    failing, other = TimingFilter(), DedupFilter()
+    mocker.patch.object(failing, "close", side_effect=RuntimeError("boom"))
+    close = mocker.patch.object(other, "close")
+
+    Pipeline("test_queue", [failing, other]).close()
+
+    close.assert_called_once_with()
@@ -0,0 +1,119 @@
+"""Test masstransit.process_pool."""
+
+import asyncio
+import gzip
+import json
+
+import pika
+import pytest
+
+from masstransit.middleware import DedupFilter
+from masstransit.models import Config, MessageAction
+from masstransit.process_pool import HandlerProcessPool, RingBuffer, SharedMemoryConsumer
+from masstransit.transport import InMemoryBus, InMemoryTransport
+
+
+def check_size(message, **kwargs):
+    """Worker callback: acknowledge messages whose data has the announced size, reject the others."""
+    if len(message.message["data"]) != message.message["size"]:
+        return MessageAction.REJECT
+    return None
+
+
+@pytest.fixture(name="ring")
+def ring_fixture():
+    """Ring buffer of 100 bytes."""
+    ring = RingBuffer(100)
+    yield ring
+    ring.close()
+
+
+def test_ring_buffer_releases_slots_out_of_order(ring):
+    """We expect space to be reused only once the oldest slots are released."""
+    first, second, third = ring.allocate(40), ring.allocate(40), ring.allocate(20)
+
+    assert (first, second, third) == (0, 40, 80)
+    assert ring.allocate(1) is None
+    ring.release(second)
+    assert ring.allocate(1) is None
+    ring.release(first)
+    assert ring.used == 20
+    assert ring.allocate(80) == 0
+    ring.release(third)
+    ring.release(0)
+    assert ring.used == 0
+
+
+def test_ring_buffer_wraps_around(ring):
+    """We expect a slot that does not fit at the end of the buffer to start at its beginning."""
+    first, second = ring.allocate(50), ring.allocate(30)
+    ring.release(first)
+
+    wrapped = ring.write(b"x" * 30)
+
+    assert wrapped == 0
+    assert ring.used == 80
+    assert ring.allocate(21) is None
+    ring.release(second)
+    assert ring.used == 30
+    assert ring.allocate(70) == 30
+    with pytest.raises(ValueError, match="does not fit"):
+        ring.allocate(101)
+
+
+def test_shared_memory_consumer_rejects_filters_that_need_the_message(mocker):
+    """We expect filters that read the decoded message to be refused, as only the worker processes decode it."""
+    with pytest.raises(ValueError, match="DedupFilter needs the decoded message"):
+        SharedMemoryConsumer(
+            Config(dsn="memory://"),
+            "orders",
+            middleware=[DedupFilter()],
+            transport=InMemoryTransport(InMemoryBus()),
+            pool=mocker.Mock(),
+        )
+
+
+async def wait_until(predicate, timeout: float = 30.0):
+    """Run the event loop until predicate holds."""
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Condition not reached")
+
+
+def test_worker_processes_handle_deliveries_from_shared_memory(mocker):
+    """We expect worker processes to decode bodies from the buffer and the consumer to settle with their action."""
+    bus = InMemoryBus()
+    bodies = [
+        (json.dumps({"message": {"data": "x" * size, "size": size}}).encode(), None)
+        for size in (1000, 3000, 2000, 1000, 3000)
+    ]
+    bodies.append((json.dumps({"message": {"data": "x" * 10000, "size": 10000}}).encode(), None))
+    bodies.append((gzip.compress(json.dumps({"message": {"data": "xy", "size": 2}}).encode()), "gzip"))
+    bodies.append((json.dumps({"message": {"data": "x", "size": 2}}).encode(), None))
+
+    async def scenario(pool):
+        consumer = SharedMemoryConsumer(
+            Config(dsn="memory://"),
+            "orders",
+            exchange="orders",
+            prefetch_count=10,
+            callback_path=f"{__name__}.check_size",
+            transport=InMemoryTransport(bus),
+            pool=pool,
+        )
+        settle = mocker.spy(consumer, "_settle")
+        consumer._connection = consumer.connect()
+        await wait_until(consumer.is_ready)
+        channel = InMemoryTransport(bus).connect_blocking().channel()
+        for body, encoding in bodies:
+            channel.basic_publish("orders", "", body, pika.BasicProperties(content_encoding=encoding))
+        await wait_until(lambda: settle.call_count == len(bodies))
+        return sorted((call.args[0], call.args[1]) for call in settle.call_args_list)
+
+    with HandlerProcessPool(f"{__name__}.check_size", processes=2, buffer_size=4096) as pool:
+        settled = asyncio.run(scenario(pool))
+        assert pool.buffer.used == 0
+
+    assert settled == [(tag, MessageAction.ACK) for tag in range(1, 8)] + [(8, MessageAction.REJECT)]
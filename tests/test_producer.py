@@ -1,12 +1,17 @@
 """Producer tests."""
 
+import gzip
+from datetime import datetime, timedelta, timezone
+
 import pytest
 from pika import URLParameters
 from pika.exchange_type import ExchangeType
 
 from examples.getting_started import GettingStarted
-from masstransit.models import Config
+from masstransit.claim_check import CLAIM_CHECK_HEADER
+from masstransit.models import Config, Message
 from masstransit.producer import RabbitMQProducer
+from masstransit.serializers import MASSTRANSIT_JSON, MSGPACK, get_serializer
 
 
 class TestRabbitMQProducer:
@@ -21,14 +26,6 @@ class TestRabbitMQProducer:
     routing_key = "my_routing_key"
     contract_class_path = "examples.getting_started.GettingStarted"
 
-    @pytest.fixture(name="message")
-    def message_fixture(self, mocker):
-        """Message mock fixture."""
-        message = mocker.patch("masstransit.producer.Message")
-        message.return_value = message
-        message.model_validate.return_value = message
-        return message
-
     @pytest.fixture(name="blocking_connection")
     def blocking_connection_fixture(self, mocker):
         """BlockingConnection mock fixture."""
@@ -40,22 +37,126 @@ class TestRabbitMQProducer:
     def test_init(self, blocking_connection):
         """We expect a blocking connection to be established with a channel."""
         producer = RabbitMQProducer(self.config, self.exchange, self.exchange_type, self.queue)
-        blocking_connection.assert_called_once_with(URLParameters(self.config.dsn))
+        blocking_connection.assert_called_once_with([URLParameters(self.config.dsn)])
         assert producer.channel == blocking_connection.channel.return_value
         assert producer.connection == blocking_connection
 
-    def test_send_contract(self, blocking_connection, message):
+    def assert_published(self, producer, mocker):
+        """Assert a single MassTransit JSON envelope with the contract payload was published."""
+        producer.channel.basic_publish.assert_called_once_with(
+            body=mocker.ANY, exchange=self.exchange, routing_key=self.routing_key, properties=mocker.ANY
+        )
+        kwargs = producer.channel.basic_publish.call_args.kwargs
+        assert kwargs["properties"].content_type == MASSTRANSIT_JSON
+        assert kwargs["properties"].content_encoding is None
+        message = Message.model_validate_json(kwargs["body"])
+        assert message.message == self.contract_payload
+        assert message.messageType == tuple(GettingStarted.messageType())
+
+    def test_send_contract(self, blocking_connection, mocker):
         """We expect to be able to send Contract objects."""
         producer = RabbitMQProducer(self.config, self.exchange, self.exchange_type, self.queue)
         producer.send_contract(GettingStarted(**self.contract_payload), self.routing_key)
-        producer.channel.basic_publish.assert_called_once_with(
-            body=message.model_dump_json(), exchange=self.exchange, routing_key=self.routing_key
-        )
+        self.assert_published(producer, mocker)
 
-    def test_send(self, blocking_connection, message):
+    def test_send(self, blocking_connection, mocker):
         """We expect to be able to send json strings providing a contract_class_path."""
         producer = RabbitMQProducer(self.config, self.exchange, self.exchange_type, self.queue)
         producer.send(self.message, self.routing_key, self.contract_class_path)
-        producer.channel.basic_publish.assert_called_once_with(
-            body=message.model_dump_json(), exchange=self.exchange, routing_key=self.routing_key
-        )
+        self.assert_published(producer, mocker)
+
+    def test_send_contract_claim_checks_large_payloads(self, blocking_connection, tmp_path):
+        """We expect payloads above the threshold to be stored in the claim-check directory."""
+        config = Config(dsn="amqp://examplehost:5672/", claim_check_dir=str(tmp_path), claim_check_threshold=10)
+        producer = RabbitMQProducer(config, self.exchange, self.exchange_type, self.queue)
+
+        producer.send_contract(GettingStarted(Value="x" * 100), self.routing_key)
+
+        body = producer.channel.basic_publish.call_args.kwargs["body"]
+        envelope = Message.model_validate_json(body)
+        assert envelope.message == {}
+        assert (tmp_path / envelope.headers[CLAIM_CHECK_HEADER]).read_bytes() == b'{"Value":"' + b"x" * 100 + b'"}'
+
+    def test_send_contract_serializes_small_envelopes_once(self, blocking_connection, mocker, tmp_path):
+        """We expect envelopes under the threshold to be serialized once, and kept whole."""
+        config = Config(dsn="amqp://examplehost:5672/", claim_check_dir=str(tmp_path), claim_check_threshold=10_000)
+        producer = RabbitMQProducer(config, self.exchange, self.exchange_type, self.queue)
+        dumps = mocker.spy(producer._serializer, "dumps")
+
+        producer.send_contract(GettingStarted(Value="x" * 100), self.routing_key)
+
+        dumps.assert_called_once()
+        assert not list(tmp_path.iterdir())
+
+    def test_send_contract_compresses_large_bodies(self, blocking_connection):
+        """We expect bodies above the threshold to be compressed and flagged with content_encoding."""
+        config = Config(dsn="amqp://examplehost:5672/", compression="gzip", compression_threshold=10)
+        producer = RabbitMQProducer(config, self.exchange, self.exchange_type, self.queue)
+
+        producer.send_contract(GettingStarted(Value="x" * 100), self.routing_key)
+
+        kwargs = producer.channel.basic_publish.call_args.kwargs
+        assert kwargs["properties"].content_encoding == "gzip"
+        assert Message.model_validate_json(gzip.decompress(kwargs["body"])).message == {"Value": "x" * 100}
+
+    def test_send_contract_does_not_compress_small_bodies(self, blocking_connection):
+        """We expect bodies under the threshold to be sent uncompressed."""
+        config = Config(dsn="amqp://examplehost:5672/", compression="gzip", compression_threshold=10_000)
+        producer = RabbitMQProducer(config, self.exchange, self.exchange_type, self.queue)
+
+        producer.send_contract(GettingStarted(Value="x"), self.routing_key)
+
+        kwargs = producer.channel.basic_publish.call_args.kwargs
+        assert kwargs["properties"].content_encoding is None
+        assert Message.model_validate_json(kwargs["body"]).message == {"Value": "x"}
+
+    def test_init_rejects_unknown_compression(self, blocking_connection):
+        """We expect unsupported encodings to fail early."""
+        with pytest.raises(ValueError, match="Unsupported content encoding: brotli"):
+            RabbitMQProducer(self.config, self.exchange, self.exchange_type, self.queue, compression="brotli")
+
+    def test_send_contract_uses_producer_content_type(self, blocking_connection):
+        """We expect the producer serializer to be used and flagged with content_type."""
+        producer = RabbitMQProducer(self.config, self.exchange, self.exchange_type, self.queue, content_type=MSGPACK)
+
+        producer.send_contract(GettingStarted(**self.contract_payload), self.routing_key)
+
+        kwargs = producer.channel.basic_publish.call_args.kwargs
+        assert kwargs["properties"].content_type == MSGPACK
+        assert get_serializer(MSGPACK).loads(kwargs["body"]).message == self.contract_payload
+
+    def test_send_contract_uses_contract_content_type(self, blocking_connection):
+        """We expect contracts to override the producer serializer."""
+
+        class PackedGettingStarted(GettingStarted):
+            content_type = MSGPACK
+
+        producer = RabbitMQProducer(self.config, self.exchange, self.exchange_type, self.queue)
+
+        producer.send_contract(PackedGettingStarted(**self.contract_payload), self.routing_key)
+
+        kwargs = producer.channel.basic_publish.call_args.kwargs
+        assert kwargs["properties"].content_type == MSGPACK
+
+    def test_send_contract_sets_ttl(self, blocking_connection):
+        """We expect a ttl to set both the expiration property and the expirationTime of the envelope."""
+        producer = RabbitMQProducer(self.config, self.exchange, self.exchange_type, self.queue, ttl=30)
+
+        producer.send_contract(GettingStarted(**self.contract_payload), self.routing_key)
+        producer.send_contract(GettingStarted(**self.contract_payload), self.routing_key, ttl=0.5)
+
+        first, second = producer.channel.basic_publish.call_args_list
+        assert first.kwargs["properties"].expiration == "30000"
+        assert second.kwargs["properties"].expiration == "500"
+        message = Message.model_validate_json(first.kwargs["body"])
+        assert timedelta(seconds=29) < message.expires_at - datetime.now(timezone.utc) <= timedelta(seconds=30)
+
+    def test_send_contract_without_ttl(self, blocking_connection):
+        """We expect messages to never expire by default."""
+        producer = RabbitMQProducer(self.config, self.exchange, self.exchange_type, self.queue)
+
+        producer.send_contract(GettingStarted(**self.contract_payload), self.routing_key)
+
+        kwargs = producer.channel.basic_publish.call_args.kwargs
+        assert kwargs["properties"].expiration is None
+        assert Message.model_validate_json(kwargs["body"]).expirationTime is None
@@ -0,0 +1,91 @@
+"""Test masstransit.profiling."""
+
+import asyncio
+import json
+import pstats
+import signal
+import tracemalloc
+from http import HTTPStatus
+
+import pytest
+
+from masstransit.models.config import Config
+from masstransit.profiling import PROFILE_SIGNAL, Profiler, install
+
+
+@pytest.fixture
+def restore_signal():
+    """Restore the profiling signal handler after the test."""
+    previous = signal.getsignal(PROFILE_SIGNAL)
+    yield
+    signal.signal(PROFILE_SIGNAL, previous)
+
+
+def test_session_writes_profile_files(tmp_path):
+    """We expect a session to write the cProfile stats, the allocations and the slowest handler calls."""
+    profiler = Profiler(str(tmp_path), top=2)
+
+    assert profiler.start() is True
+    assert profiler.start() is False
+    retained = [bytearray(1024) for _ in range(100)]
+    for seconds in [0.1, 0.5, 0.3]:
+        profiler.record_handler("orders", "urn:message:Orders:OrderSubmitted", f"id-{seconds}", seconds)
+    prefix = profiler.stop()
+
+    assert retained
+    assert profiler.active is False
+    assert not tracemalloc.is_tracing()
+    assert profiler.stop() is None
+    assert pstats.Stats(f"{prefix}.prof").total_calls > 0
+    assert tracemalloc.Snapshot.load(f"{prefix}.tracemalloc").traces
+    assert "test_profiling.py" in (tmp_path / f"{prefix}.malloc.txt").read_text()
+    handlers = json.loads((tmp_path / f"{prefix}.handlers.json").read_text())
+    assert [call["messageId"] for call in handlers] == ["id-0.5", "id-0.3"]
+    assert handlers[0]["queue"] == "orders"
+
+
+def test_request_runs_sessions_on_the_loop(tmp_path, mocker):
+    """We expect requests to toggle or start a session in a callback of the attached loop, not when they are made."""
+    profiler = Profiler(str(tmp_path))
+    start = mocker.patch.object(profiler, "start")
+    stop = mocker.patch.object(profiler, "stop")
+    loop = asyncio.new_event_loop()
+    profiler.attach(loop)
+
+    profiler.on_signal()
+    start.assert_not_called()
+    loop.run_until_complete(asyncio.sleep(0))
+    start.assert_called_once_with(None)
+    profiler.active = True
+    profiler.on_signal()
+    loop.run_until_complete(asyncio.sleep(0))
+    stop.assert_called_once_with()
+    assert profiler.request(5.0) is True
+    loop.run_until_complete(asyncio.sleep(0))
+    start.assert_called_with(5.0)
+    loop.close()
+    assert profiler.request(5.0) is False
+
+
+@pytest.mark.skipif(PROFILE_SIGNAL is None, reason="SIGUSR2 is not available")
+@pytest.mark.usefixtures("restore_signal")
+def test_install(tmp_path, mocker):
+    """We expect install to apply the config, handle the signal and add the metrics route."""
+    profiler = Profiler()
+    server = mocker.MagicMock()
+    request = mocker.patch.object(profiler, "request", return_value=True)
+
+    install(Config(profile_dir=str(tmp_path), profile_seconds=5.0), server, profiler)
+
+    assert (profiler.directory, profiler.seconds) == (str(tmp_path), 5.0)
+    assert signal.getsignal(PROFILE_SIGNAL) == profiler.on_signal
+    path, route = server.add_route.call_args.args
+    assert path == "/debug/profile"
+    status, _, content = route({"seconds": ["2"]})
+    assert status == HTTPStatus.ACCEPTED
+    assert str(tmp_path).encode() in content
+    request.assert_called_once_with(2.0)
+    request.return_value = False
+    assert route({})[0] == HTTPStatus.SERVICE_UNAVAILABLE
+    profiler.active = True
+    assert route({})[0] == HTTPStatus.CONFLICT
@@ -0,0 +1,149 @@
+"""Test request_client module."""
+
+import asyncio
+
+import pytest
+
+from examples.getting_started import GettingStarted
+from masstransit.models import Config, Message
+from masstransit.request_client import DIRECT_REPLY_TO, RequestClient, respond
+from masstransit.serializers import get_serializer
+
+
+@pytest.fixture(name="asyncio_connection", autouse=True)
+def asyncio_connection_fixture(mocker):
+    """AsyncioConnection mock fixture that opens immediately."""
+    asyncio_connection = mocker.patch("masstransit.request_client.AsyncioConnection")
+    channel = mocker.MagicMock()
+    channel.basic_consume.side_effect = lambda *args, callback, **kwargs: callback(mocker.MagicMock())
+
+    def _connect(on_open_callback, **kwargs):
+        connection = mocker.MagicMock(is_closing=False, is_closed=False)
+        connection.channel.side_effect = lambda on_open_callback: on_open_callback(channel)
+        on_open_callback(connection)
+        return connection
+
+    asyncio_connection.side_effect = _connect
+    asyncio_connection.channel = channel
+    return asyncio_connection
+
+
+def _reply(client, payload):
+    request = Message.model_validate_json(client.channel.basic_publish.call_args.kwargs["body"])
+    response = Message(message=payload, requestId=request.requestId)
+    properties = type("Properties", (), {"content_type": None, "content_encoding": None, "correlation_id": None})
+    client._on_response(client.channel, None, properties, get_serializer().dumps(response))
+
+
+@pytest.mark.asyncio
+async def test_connect_consumes_direct_reply_to():
+    """We expect the client to consume from the direct reply-to pseudo-queue without acks."""
+    async with RequestClient(Config()) as client:
+        args, kwargs = client.channel.basic_consume.call_args
+
+    assert args == (DIRECT_REPLY_TO, client._on_response)
+    assert kwargs["auto_ack"] is True
+
+
+@pytest.mark.asyncio
+async def test_request_resolves_with_response():
+    """We expect the request to resolve with the response carrying the same requestId."""
+    async with RequestClient(Config(), exchange="orders") as client:
+        task = asyncio.create_task(
+            client.request(GettingStarted(Value="ping"), "status", response_type=GettingStarted)
+        )
+        await asyncio.sleep(0)
+        properties = client.channel.basic_publish.call_args.kwargs["properties"]
+        request_body = client.channel.basic_publish.call_args.kwargs["body"]
+        _reply(client, {"Value": "pong"})
+
+        response = await task
+
+    assert response == GettingStarted(Value="pong")
+    assert properties.reply_to == DIRECT_REPLY_TO
+    assert properties.correlation_id == Message.model_validate_json(request_body).requestId
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_correlated():
+    """We expect concurrent requests to receive their own responses."""
+    async with RequestClient(Config()) as client:
+        first = asyncio.create_task(client.request(GettingStarted(Value="1")))
+        await asyncio.sleep(0)
+        first_call = client.channel.basic_publish.call_args
+        second = asyncio.create_task(client.request(GettingStarted(Value="2")))
+        await asyncio.sleep(0)
+        _reply(client, {"Value": "2"})
+        client.channel.basic_publish.call_args = first_call
+        _reply(client, {"Value": "1"})
+
+        assert (await first).message == {"Value": "1"}
+        assert (await second).message == {"Value": "2"}
+
+
+@pytest.mark.asyncio
+async def test_request_times_out():
+    """We expect a timeout error when no response arrives in time."""
+    async with RequestClient(Config()) as client:
+        with pytest.raises(TimeoutError, match="No response to request"):
+            await client.request(GettingStarted(Value="ping"), timeout=0.01)
+
+        assert not client._pending
+
+
+@pytest.mark.asyncio
+async def test_closing_fails_pending_requests():
+    """We expect pending requests to fail when the client is closed."""
+    client = RequestClient(Config())
+    await client.connect()
+    task = asyncio.create_task(client.request(GettingStarted(Value="ping")))
+    await asyncio.sleep(0)
+
+    await client.close()
+
+    with pytest.raises(ConnectionError):
+        await task
+
+
+def test_respond_publishes_to_reply_to(mocker):
+    """We expect respond to publish the response to the requester reply-to address."""
+    channel = mocker.MagicMock()
+    request = Message(requestId="abc", correlationId="corr")
+    properties = mocker.MagicMock(reply_to="amq.rabbitmq.reply-to.xyz", content_type=None)
+
+    respond(request, GettingStarted(Value="pong"), channel, properties)
+
+    kwargs = channel.basic_publish.call_args.kwargs
+    response = Message.model_validate_json(kwargs["body"])
+    assert kwargs["exchange"] == ""
+    assert kwargs["routing_key"] == "amq.rabbitmq.reply-to.xyz"
+    assert kwargs["properties"].correlation_id == "abc"
+    assert response.requestId == "abc"
+    assert response.correlationId == "corr"
+    assert response.message == {"Value": "pong"}
+
+
+@pytest.mark.parametrize(
+    ("response_address", "exchange", "routing_key"),
+    [
+        ("rabbitmq://broker/vhost/bus-abc?temporary=true", "bus-abc", ""),
+        ("exchange:responses", "responses", ""),
+        ("queue:responses", "", "responses"),
+        ("responses", "", "responses"),
+    ],
+)
+def test_respond_publishes_to_response_address(mocker, response_address, exchange, routing_key):
+    """We expect a request without reply-to to be answered on the exchange or queue of its responseAddress."""
+    channel = mocker.MagicMock()
+    request = Message(requestId="abc", responseAddress=response_address)
+
+    respond(request, GettingStarted(Value="pong"), channel, mocker.MagicMock(reply_to=None, content_type=None))
+
+    kwargs = channel.basic_publish.call_args.kwargs
+    assert (kwargs["exchange"], kwargs["routing_key"]) == (exchange, routing_key)
+
+
+def test_respond_requires_a_request(mocker):
+    """We expect respond to refuse messages that were not sent as requests."""
+    with pytest.raises(ValueError, match="is not a request"):
+        respond(Message(), GettingStarted(Value="pong"), mocker.MagicMock())
@@ -0,0 +1,52 @@
+"""Test serializers module."""
+
+import pytest
+
+from masstransit.models import Message
+from masstransit.serializers import MASSTRANSIT_JSON, MSGPACK, SERIALIZERS, JsonSerializer, get_serializer
+
+
+@pytest.mark.parametrize("content_type", sorted(SERIALIZERS))
+def test_round_trip(content_type):
+    """We expect every registered serializer to restore the original envelope."""
+    message = Message(messageType=("foo.Bar",), message={"foo": [1, 2.5, "bar", None]}, headers={"a": "b"})
+    serializer = get_serializer(content_type)
+
+    assert serializer.loads(serializer.dumps(message)) == message
+
+
+@pytest.mark.parametrize("content_type", [None, "", MASSTRANSIT_JSON, "application/json"])
+def test_json_is_the_default(content_type):
+    """We expect messages without or with json content types to use the MassTransit JSON serializer."""
+    assert isinstance(get_serializer(content_type), JsonSerializer)
+
+
+def test_msgpack_is_smaller_than_json():
+    """We expect MessagePack envelopes to be more compact than JSON ones."""
+    message = Message(message={"values": list(range(1000))})
+
+    assert len(get_serializer(MSGPACK).dumps(message)) < len(get_serializer().dumps(message))
+
+
+def test_unknown_content_type():
+    """We expect a value error for unsupported content types."""
+    with pytest.raises(ValueError, match="Unsupported content type: text/plain"):
+        get_serializer("text/plain")
+
+
+@pytest.mark.parametrize("content_type", ["text/plain", "application/octet-stream"])
+def test_unknown_content_type_falls_back_to_json(mocker, caplog, content_type):
+    """We expect deliveries with an unknown content type to be decoded as MassTransit JSON, with one warning."""
+    mocker.patch("masstransit.serializers._UNKNOWN_CONTENT_TYPES", set())
+
+    assert get_serializer(content_type, fallback=True) is SERIALIZERS[MASSTRANSIT_JSON]
+    assert get_serializer(content_type, fallback=True) is SERIALIZERS[MASSTRANSIT_JSON]
+
+    assert [record.getMessage() for record in caplog.records] == [
+        f"Unknown content type {content_type!r}, decoding deliveries with it as MassTransit JSON"
+    ]
+
+
+def test_content_type_parameters_are_ignored():
+    """We expect parameters and the case of a content type to be ignored."""
+    assert isinstance(get_serializer("Application/JSON; charset=utf-8"), JsonSerializer)
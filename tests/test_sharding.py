@@ -0,0 +1,137 @@
+"""Test masstransit.sharding."""
+
+import asyncio
+from collections import Counter, defaultdict
+
+import pytest
+from pydantic import ValidationError
+
+from masstransit.consumer import RabbitMQConsumer
+from masstransit.models import Config, Contract
+from masstransit.models.config import ConsumerConfig, WorkerConfig
+from masstransit.producer import RabbitMQProducer
+from masstransit.sharding import CONSISTENT_HASH_EXCHANGE, SHARD_WEIGHT, HashRing, shard_queues, shard_routing_key
+from masstransit.transport import InMemoryBus, InMemoryTransport
+
+
+class OrderLine(Contract):
+    """Test contract."""
+
+    orderId: int
+    line: int
+
+
+def test_shard_routing_key():
+    """We expect the key as routing key, the messageId without a key, and a digest for keys that are too long."""
+    assert shard_routing_key(42, "m1") == "42"
+    assert shard_routing_key(None, "m1") == "m1"
+    assert len(shard_routing_key("x" * 300, "m1")) == 64
+
+
+def test_hash_ring_is_consistent_and_balanced():
+    """We expect a key to always go to the same queue, and keys to spread over the queues by weight."""
+    queues = shard_queues("orders", 4)
+    ring = HashRing([(queue, str(SHARD_WEIGHT)) for queue in queues])
+
+    routes = Counter(ring.route(str(key)) for key in range(4000))
+
+    assert queues == ["orders-shard-01", "orders-shard-02", "orders-shard-03", "orders-shard-04"]
+    assert ring.route("order-1") == ring.route("order-1")
+    assert set(routes) == set(queues)
+    assert min(routes.values()) > 500
+    assert HashRing([]).route("order-1") is None
+    with pytest.raises(ValueError, match="must be a weight"):
+        HashRing([("orders-shard-01", "")])
+
+
+def test_hash_ring_moves_few_keys_when_a_shard_is_added():
+    """We expect only the keys of the new shard to move."""
+    before = HashRing([(queue, str(SHARD_WEIGHT)) for queue in shard_queues("orders", 4)])
+    after = HashRing([(queue, str(SHARD_WEIGHT)) for queue in shard_queues("orders", 5)])
+
+    moved = [key for key in map(str, range(1000)) if before.route(key) != after.route(key)]
+
+    assert all(after.route(key) == "orders-shard-05" for key in moved)
+    assert len(moved) < 400
+
+
+def test_sharded_consumer_config_expands_into_shards():
+    """We expect one consumer with a single active consumer per shard queue, bound to a consistent hash exchange."""
+    worker = WorkerConfig(
+        name="orders",
+        consumers=[
+            ConsumerConfig(queue="orders", exchange="orders", name="lines", shards=2, number_of_consumers=2),
+            ConsumerConfig(queue="audit"),
+        ],
+    )
+
+    first, second, audit = worker.expanded_consumers()
+
+    assert [first.queue, second.queue, audit.queue] == ["orders-shard-01", "orders-shard-02", "audit"]
+    assert (first.name, first.exchange, first.exchange_type) == ("lines-shard-01", "orders", CONSISTENT_HASH_EXCHANGE)
+    assert (first.routing_key, first.single_active_consumer, first.shards) == (str(SHARD_WEIGHT), True, None)
+    assert first.number_of_consumers == 2
+    with pytest.raises(ValidationError, match="needs a positive number of shards and an exchange"):
+        ConsumerConfig(queue="orders", shards=2)
+
+
+async def wait_until(predicate):
+    """Run the event loop until predicate holds."""
+    for _ in range(1000):
+        if predicate():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("Condition not reached")
+
+
+def test_sharded_publishing_keeps_entities_on_one_consumer():
+    """We expect all lines of an order to be handled in order by the active consumer of a single shard."""
+    bus = InMemoryBus()
+    handled = defaultdict(list)
+
+    def callback(name):
+        async def _callback(message, **kwargs):
+            handled[name].append((message.message["orderId"], message.message["line"]))
+
+        return _callback
+
+    async def scenario():
+        consumers = [
+            RabbitMQConsumer(
+                Config(dsn="memory://"),
+                queue,
+                exchange="orders",
+                exchange_type=CONSISTENT_HASH_EXCHANGE,
+                routing_key=str(SHARD_WEIGHT),
+                single_active_consumer=True,
+                callback=callback(name),
+                transport=InMemoryTransport(bus),
+            )
+            for name, queue in [("active-1", "orders-shard-01"), ("active-2", "orders-shard-02")]
+            + [("standby-1", "orders-shard-01")]
+        ]
+        for consumer in consumers:
+            consumer._connection = consumer.connect()
+            await wait_until(consumer.is_ready)
+        producer = RabbitMQProducer(
+            Config(dsn="memory://"),
+            "orders",
+            CONSISTENT_HASH_EXCHANGE,
+            "orders",
+            transport=InMemoryTransport(bus),
+            shard_key="orderId",
+        )
+        for line in range(5):
+            for order_id in range(20):
+                producer.send_contract(OrderLine(orderId=order_id, line=line))
+        await wait_until(lambda: sum(map(len, handled.values())) == 100)
+
+    asyncio.run(scenario())
+
+    assert set(handled) == {"active-1", "active-2"}
+    orders = {name: {order_id for order_id, _ in lines} for name, lines in handled.items()}
+    assert not orders["active-1"] & orders["active-2"]
+    for lines in handled.values():
+        for order_id in {order_id for order_id, _ in lines}:
+            assert [line for o, line in lines if o == order_id] == list(range(5))
+    assert "orders" not in bus.queues
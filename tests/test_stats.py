@@ -0,0 +1,106 @@
+"""Test masstransit.stats."""
+
+import pytest
+
+from masstransit.models.config import Config
+from masstransit.stats import (
+    QueueSampler,
+    QueueStats,
+    configured_queues,
+    format_duration,
+    format_table,
+    reports,
+    settled_by_queue,
+)
+from masstransit.transport import BUS
+
+WORKERS = [
+    {"name": "orders", "consumers": [{"queue": "stats-orders"}, {"queue": "stats-orders", "name": "second"}]},
+    {"name": "billing", "consumers": [{"queue": "stats-invoices"}, {"queue": "stats-missing"}]},
+]
+
+
+def exposition(orders: int) -> str:
+    """Metrics exposition with orders settled deliveries."""
+    return (
+        "# TYPE masstransit_consumer_settled_total counter\n"
+        f'masstransit_consumer_settled_total{{queue="stats-orders",contract="Order",action="ACK"}} {orders - 1}\n'
+        'masstransit_consumer_settled_total{queue="stats-orders",contract="Order",action="REJECT"} 1\n'
+        'masstransit_consumer_handler_seconds_count{queue="stats-orders",contract="Order"} 99\n'
+    )
+
+
+@pytest.fixture(name="config")
+def config_fixture():
+    """Config of two workers on the in-memory bus."""
+    return Config(dsn="memory://", workers=WORKERS)
+
+
+def test_configured_queues(config):
+    """We expect each queue once per worker, optionally of a single worker."""
+    assert configured_queues(config) == [
+        ("orders", "stats-orders"),
+        ("billing", "stats-invoices"),
+        ("billing", "stats-missing"),
+    ]
+    assert configured_queues(config, "orders") == [("orders", "stats-orders")]
+    with pytest.raises(ValueError, match="Worker 'shipping' not found in config"):
+        configured_queues(config, "shipping")
+
+
+def test_settled_by_queue():
+    """We expect settled deliveries to be summed per queue."""
+    assert settled_by_queue(exposition(20)) == {"stats-orders": 20.0}
+
+
+def test_sampler_reports_rates_and_time_to_drain(mocker, config):
+    """We expect net rates from the depths, and drain and ingress rates from the settled deliveries."""
+    for queue, count in [("stats-orders", 10), ("stats-invoices", 0)]:
+        BUS.declare_queue(queue)
+        BUS.queues[queue].extend([None] * count)
+    urlopen = mocker.patch("masstransit.stats.urllib.request.urlopen")
+    urlopen.return_value.__enter__.return_value.read.side_effect = [exposition(10).encode(), exposition(20).encode()]
+    sampler = QueueSampler(config, configured_queues(config), "http://127.0.0.1:9100/metrics")
+
+    sampler.sample(at=0.0)
+    for _ in range(4):
+        BUS.queues["stats-orders"].popleft()
+    sampler.sample(at=2.0)
+    sampler.close()
+
+    orders, invoices, missing = sampler.report()
+    assert orders == QueueStats("orders", "stats-orders", 6, 0, 3.0, 5.0, -2.0, 3.0)
+    assert invoices == QueueStats("billing", "stats-invoices", 0, 0, net_rate=0.0, time_to_drain=0.0)
+    assert missing == QueueStats("billing", "stats-missing", None, None)
+
+
+def test_reports(mocker):
+    """We expect a report after the first samples, then after each sample when following."""
+    sampler = mocker.MagicMock()
+    sleep = mocker.patch("masstransit.stats.time.sleep")
+
+    stream = reports(sampler, interval=2.0, samples=3, follow=True)
+    next(stream)
+    assert sampler.sample.call_count == 3
+    next(stream)
+
+    assert sampler.sample.call_count == 4
+    assert [call.args[0] for call in sleep.call_args_list] == [2.0, 2.0, 2.0]
+    assert list(reports(sampler, samples=1)) == [sampler.report.return_value]
+
+
+def test_format_table():
+    """We expect an aligned table with readable durations."""
+    table = format_table(
+        [
+            QueueStats("orders", "stats-orders", 6, 2, 3.0, 5.0, -2.0, 3723.0),
+            QueueStats("billing", "stats-missing", None, None),
+        ]
+    )
+
+    assert table.splitlines() == [
+        "WORKER   QUEUE          MESSAGES   CONSUMERS  INGRESS/S  DRAIN/S  NET/S  TIME TO DRAIN",
+        "orders   stats-orders   6          2          3.0        5.0      -2.0   1h02m",
+        "billing  stats-missing  not found  -          -          -        -      -",
+    ]
+    assert [format_duration(s) for s in (None, 45, 125)] == ["never", "45s", "2m05s"]
@@ -0,0 +1,129 @@
+"""Test masstransit.tracing."""
+
+import asyncio
+
+import pytest
+
+from masstransit import tracing
+from masstransit.consumer import RabbitMQConsumer
+from masstransit.models import Config, Contract, Message
+from masstransit.producer import RabbitMQProducer
+from masstransit.transport import InMemoryBus, InMemoryTransport
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+class Greeting(Contract):
+    """Test contract."""
+
+    text: str
+
+
+@pytest.fixture(name="producer")
+def producer_fixture(mocker):
+    """Producer on an in-memory transport, with a spy on its publishes."""
+    producer = RabbitMQProducer(
+        Config(dsn="memory://"), "greetings", "fanout", "greetings", transport=InMemoryTransport(InMemoryBus())
+    )
+    mocker.spy(producer.channel, "publish_message")
+    return producer
+
+
+def published(producer) -> Message:
+    """Last message published by producer."""
+    return producer.channel.publish_message.call_args.args[2]
+
+
+def test_messages_published_outside_handlers_start_conversations(producer):
+    """We expect no conversation attributes to be set outside of a handler."""
+    producer.send_contract(Greeting(text="hello"))
+
+    message = published(producer)
+    assert tracing.conversation_kwargs() == {}
+    assert message.conversationId is None
+    assert message.initiatorId == "masstransit-python"
+
+
+@pytest.mark.skipif(tracing.TRACER is not None, reason="OpenTelemetry replaces the trace context")
+def test_messages_published_from_handlers_join_the_conversation(producer):
+    """We expect messages published while handling a message to carry its conversation and trace context."""
+    incoming = Message(correlationId="order-1", headers={"traceparent": TRACEPARENT, "other": "x"})
+
+    with tracing.handle("orders", incoming):
+        producer.send_contract(Greeting(text="hello"))
+        first = published(producer)
+        producer.send_contract(Greeting(text="hello"), message_kwargs={"correlationId": "order-2"})
+        second = published(producer)
+    producer.send_contract(Greeting(text="hello"))
+
+    assert (first.correlationId, first.conversationId, first.initiatorId) == (
+        "order-1",
+        incoming.messageId,
+        incoming.messageId,
+    )
+    assert first.headers == {"traceparent": TRACEPARENT}
+    assert second.correlationId == "order-2"
+    assert published(producer).conversationId is None
+
+
+async def wait_until(predicate):
+    """Run the event loop until predicate holds."""
+    for _ in range(100):
+        if predicate():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("Condition not reached")
+
+
+def test_consumer_handlers_run_in_the_conversation_of_their_message():
+    """We expect the conversation of the delivered message to be current in the handler."""
+    bus = InMemoryBus()
+    conversations = []
+
+    async def callback(message, **kwargs):
+        conversations.append(tracing.CONVERSATION.get())
+
+    async def scenario():
+        consumer = RabbitMQConsumer(
+            Config(dsn="memory://"),
+            "greetings",
+            exchange="greetings",
+            callback=callback,
+            transport=InMemoryTransport(bus),
+        )
+        consumer._connection = consumer.connect()
+        await wait_until(consumer.is_ready)
+        channel = InMemoryTransport(bus).connect_blocking().channel()
+        channel.basic_publish("greetings", "", b'{"messageId": "m1", "conversationId": "c1", "message": {}}')
+        await wait_until(lambda: conversations)
+
+    asyncio.run(scenario())
+
+    assert conversations == [tracing.Conversation(None, "c1", "m1", {})]
+    assert tracing.CONVERSATION.get() is None
+
+
+def test_spans(producer):
+    """We expect publish, receive and process spans in one trace, with the trace context in the headers."""
+    sdk_trace = pytest.importorskip("opentelemetry.sdk.trace")
+    export = pytest.importorskip("opentelemetry.sdk.trace.export")
+    in_memory = pytest.importorskip("opentelemetry.sdk.trace.export.in_memory_span_exporter")
+    from opentelemetry import trace  # noqa: PLC0415
+
+    exporter = in_memory.InMemorySpanExporter()
+    provider = sdk_trace.TracerProvider()
+    provider.add_span_processor(export.SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    producer.send_contract(Greeting(text="hello"))
+    message = published(producer)
+    span = tracing.start_receive_span("greetings", message)
+    with tracing.handle("greetings", message, span):
+        producer.send_contract(Greeting(text="reply"))
+    tracing.end_receive_span(span)
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert "traceparent" in message.headers
+    assert len({span.context.trace_id for span in spans.values()}) == 1
+    assert spans["receive greetings"].parent.span_id == spans["publish greetings"].context.span_id
+    assert spans["process greetings"].parent.span_id == spans["receive greetings"].context.span_id
@@ -1,8 +1,19 @@
 """Test utils module."""
 
+import logging
+from datetime import datetime, timezone
+
 import pytest
 
-from masstransit.utils import django_setup
+from masstransit.utils import (
+    SAMPLED,
+    Lazy,
+    SampleFilter,
+    django_setup,
+    logging_setup,
+    logging_shutdown,
+    parse_datetime,
+)
 
 
 @pytest.fixture(name="import_module")
@@ -46,3 +57,99 @@ def test_django_setup_handles_import_error(import_module, setdefault, logger):
     setdefault.assert_not_called()
     import_module.return_value.setup.assert_not_called()
     logger.error.assert_called_once_with("Could not import django")
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("2024-01-02T03:04:05.1234567Z", datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc)),
+        ("2024-01-02T03:04:05Z", datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+        ("2024-01-02T03:04:05.12+02:00", datetime(2024, 1, 2, 1, 4, 5, 120000, tzinfo=timezone.utc)),
+        ("2024-01-02T03:04:05.123456+00:00", datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc)),
+        ("2024-01-02T03:04:05.1-0130", datetime(2024, 1, 2, 4, 34, 5, 100000, tzinfo=timezone.utc)),
+    ],
+)
+def test_parse_datetime(value, expected):
+    """We expect ISO-8601 timestamps, including .NET ones, to be parsed as aware datetimes."""
+    assert parse_datetime(value) == expected
+
+
+def test_parse_datetime_assumes_local_time_for_naive_timestamps():
+    """We expect naive timestamps to be taken as local time."""
+    now = datetime.now()
+
+    assert parse_datetime(now.isoformat()) == now.astimezone()
+
+
+def test_parse_datetime_rejects_invalid_timestamps():
+    """We expect a value error for invalid timestamps."""
+    with pytest.raises(ValueError):
+        parse_datetime("yesterday")
+
+
+def make_record(level=logging.INFO, lineno=1, **extra):
+    """Build a log record."""
+    record = logging.LogRecord("masstransit.test", level, __file__, lineno, "message %s", ("arg",), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sample_filter_passes_one_in_n_per_call_site():
+    """We expect 1 in N sampled records of each call site to pass."""
+    sample = SampleFilter(rate=3)
+
+    first_site = [sample.filter(make_record(**SAMPLED)) for _ in range(6)]
+    second_site = [sample.filter(make_record(lineno=2, **SAMPLED)) for _ in range(2)]
+
+    assert first_site == [True, False, False, True, False, False]
+    assert second_site == [True, False]
+
+
+def test_sample_filter_always_passes_errors_and_unsampled_records():
+    """We expect warnings, errors and records not marked as sampled to always pass."""
+    sample = SampleFilter(rate=100)
+
+    assert all(sample.filter(make_record()) for _ in range(3))
+    assert all(sample.filter(make_record(logging.ERROR, **SAMPLED)) for _ in range(3))
+
+
+def test_lazy_is_computed_when_formatted(mocker):
+    """We expect a lazy argument to be computed only when the record is formatted."""
+    func = mocker.Mock(return_value="computed")
+    log = logging.getLogger("masstransit.test.lazy")
+    log.setLevel(logging.INFO)
+
+    log.debug("value: %s", Lazy(func, 1))
+    func.assert_not_called()
+
+    assert str(Lazy(func, 1)) == "computed"
+    func.assert_called_once_with(1)
+
+
+@pytest.fixture(name="restore_logging")
+def restore_logging_fixture():
+    """Restore the handlers and levels of the loggers configured by logging_setup."""
+    loggers = [logging.getLogger(name) for name in ("", "masstransit", "pika")]
+    state = [(log, log.handlers[:], log.level, log.propagate) for log in loggers]
+    yield
+    logging_shutdown()
+    for log, handlers, level, propagate in state:
+        log.handlers, log.propagate = handlers, propagate
+        log.setLevel(level)
+
+
+def test_logging_setup_with_queue(capsys, restore_logging):
+    """We expect records to be sampled and written by the listener thread."""
+    listener = logging_setup("INFO", sample_rate=2, use_queue=True)
+    log = logging.getLogger("masstransit.test.queue")
+
+    for n in range(4):
+        log.info("message %d", n, extra=SAMPLED)
+    log.error("failure")
+    logging_shutdown()
+
+    out, err = capsys.readouterr()
+    assert [line.rsplit(" ", 1)[1] for line in out.splitlines()] == ["0", "2"]
+    assert "failure" in err
+    assert listener.handlers
+    assert logging.getLogger().handlers == logging.getLogger("masstransit").handlers
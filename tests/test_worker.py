@@ -1,8 +1,12 @@
 """Test worker module."""
 
+import urllib.error
+import urllib.request
+
 import pytest
 
 from masstransit import worker
+from masstransit.metrics import Counter, Health, MetricsServer, Registry
 from masstransit.models.config import Config
 
 
@@ -78,3 +82,158 @@ def test_start_worker_starts_consumer_thread(mocker, logger, threading):
     )
     threading.Thread.return_value.start.assert_called_once()
     threading.Thread.return_value.join.assert_called_once()
+
+
+def test_start_worker_serves_metrics(mocker, logger, threading):
+    """We expect each consumer to get its own metrics port and the worker to serve their aggregate."""
+    serve_metrics = mocker.patch("masstransit.worker._serve_metrics")
+    config = Config.model_validate(
+        {"workers": [{"name": "foo", "consumers": [{"queue": "queue", "number_of_consumers": 2}]}]}
+    )
+
+    # system under test
+    worker.start(config, "foo", metrics_port=9100)
+
+    # assertions
+    commands = [call.kwargs["args"][1] for call in threading.Thread.call_args_list]
+    assert [command[command.index("--metrics-port") + 1] for command in commands] == ["9101", "9102"]
+    serve_metrics.assert_called_once_with(9100, "127.0.0.1", [9101, 9102])
+
+
+def test_serve_metrics_aggregates_children():
+    """We expect the worker endpoint to sum the children metrics and require all of them to be ready."""
+    children = []
+    for ready in (True, False):
+        registry = Registry()
+        Counter("deliveries_total", "Deliveries.", registry=registry).inc()
+        health = Health()
+        health.add_readiness_check("consumer", lambda ready=ready: ready)
+        children.append(MetricsServer(0, registry=registry, health=health).start())
+    server = worker._serve_metrics(0, "127.0.0.1", [child.port for child in children])
+    url = f"http://127.0.0.1:{server.port}"
+    try:
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert "deliveries_total 2\n" in response.read().decode()
+        with urllib.request.urlopen(f"{url}/healthz") as response:
+            assert response.status == 200
+        with pytest.raises(urllib.error.HTTPError, match="503"):
+            urllib.request.urlopen(f"{url}/readyz")
+    finally:
+        for s in (server, *children):
+            s.stop()
+
+
+def test_serve_metrics_forwards_profile_requests(mocker):
+    """We expect profiling requests to the worker endpoint to be forwarded to every child."""
+    scrape = mocker.patch("masstransit.worker._scrape", return_value=(200, "profiling\n"))
+    server = mocker.patch("masstransit.worker.MetricsServer").return_value
+    worker._serve_metrics(0, "127.0.0.1", [9101, 9102])
+
+    routes = {call.args[0]: call.args[1] for call in server.add_route.call_args_list}
+    status, _, content = routes["/debug/profile"]({"seconds": ["5"]})
+
+    assert status == 202
+    assert content == b"profiling\nprofiling\n"
+    assert [call.args[0] for call in scrape.call_args_list] == [
+        "http://127.0.0.1:9101/debug/profile?seconds=5",
+        "http://127.0.0.1:9102/debug/profile?seconds=5",
+    ]
+
+
+def test_start_worker_passes_middleware(logger, threading):
+    """We expect every configured middleware to be passed to the consumer command."""
+    config = Config.model_validate(
+        {"workers": [{"name": "foo", "consumers": [{"queue": "queue", "middleware": ["a.First", "b.Second"]}]}]}
+    )
+
+    # system under test
+    worker.start(config, "foo")
+
+    # assertions
+    command = threading.Thread.call_args.kwargs["args"][1]
+    assert command[-4:] == ["--middleware", "a.First", "--middleware", "b.Second"]
+
+
+def test_start_worker_passes_logging_options(logger, threading):
+    """We expect the log sampling and queue options to be passed to the consumer command."""
+    config = Config.model_validate({"workers": [{"name": "foo", "consumers": [{"queue": "queue"}]}]})
+
+    # system under test
+    worker.start(config, "foo", log_sample_rate=10, log_queue=True)
+
+    # assertions
+    command = threading.Thread.call_args.kwargs["args"][1]
+    assert command[command.index("--log-sample-rate") :][:3] == ["--log-sample-rate", "10", "--log-queue"]
+
+
+def test_start_worker_starts_one_consumer_per_shard(logger, threading):
+    """We expect a sharded consumer to be started on every shard queue, as single active consumer."""
+    config = Config.model_validate(
+        {"workers": [{"name": "foo", "consumers": [{"queue": "orders", "exchange": "orders", "shards": 2}]}]}
+    )
+
+    # system under test
+    worker.start(config, "foo")
+
+    # assertions
+    commands = [call.kwargs["args"][1] for call in threading.Thread.call_args_list]
+    assert [command[command.index("consume") + 1] for command in commands] == ["orders-shard-01", "orders-shard-02"]
+    for command in commands:
+        assert command[command.index("--exchange-type") + 1] == "x-consistent-hash"
+        assert command[command.index("--routing-key") + 1] == "20"
+        assert "--single-active-consumer" in command
+
+
+def test_start_worker_passes_process_options(logger, threading):
+    """We expect the worker process options to be passed to the consumer command."""
+    config = Config.model_validate(
+        {"workers": [{"name": "foo", "consumers": [{"queue": "queue", "processes": 4, "shared_buffer_size": 1024}]}]}
+    )
+
+    # system under test
+    worker.start(config, "foo")
+
+    # assertions
+    command = threading.Thread.call_args.kwargs["args"][1]
+    assert command[command.index("--processes") :][:4] == ["--processes", "4", "--shared-buffer-size", "1024"]
+
+
+def test_start_worker_passes_falsy_options(logger, threading):
+    """We expect options explicitly set to zero to be passed rather than replaced by the command default."""
+    config = Config.model_validate(
+        {"workers": [{"name": "foo", "consumers": [{"queue": "queue", "prefetch_count": 0, "handler_timeout": 0}]}]}
+    )
+
+    # system under test
+    worker.start(config, "foo")
+
+    # assertions
+    command = threading.Thread.call_args.kwargs["args"][1]
+    assert command[command.index("--prefetch-count") :][:2] == ["--prefetch-count", "0"]
+    assert command[command.index("--handler-timeout") :][:2] == ["--handler-timeout", "0.0"]
+
+
+def test_start_worker_passes_fault_options(logger, threading):
+    """We expect the error action to be passed, and fault publishing flags only when they are not the default."""
+    config = Config.model_validate(
+        {
+            "workers": [
+                {
+                    "name": "foo",
+                    "consumers": [
+                        {"queue": "queue", "error_action": "NACK", "publish_faults": True},
+                        {"queue": "q2"},
+                    ],
+                }
+            ]
+        }
+    )
+
+    # system under test
+    worker.start(config, "foo")
+
+    # assertions
+    first, second = [call.kwargs["args"][1] for call in threading.Thread.call_args_list]
+    assert first[first.index("--error-action") :][:3] == ["--error-action", "NACK", "--publish-faults"]
+    assert "--error-action" not in second
+    assert not any("publish-faults" in argument for argument in second)